@@ -7,62 +7,145 @@ Features: Multi-threading, service fingerprinting, custom payloads, and advanced
 """
 
 import socket
+import errno
 import threading
 import time
-import argparse
 import sys
-import json
-import csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
-import ipaddress
-import random
-import struct
+
+from scan_results import (BANNER_MAX_BYTES, BANNER_TERMINATORS, OUTCOME_CLOSED, OUTCOME_ERROR, OUTCOME_NO_RESPONSE,
+                          OUTCOME_OPEN, REPLY_CODE_SERVICES, banner_complete, banner_line, banner_text)
+from scan_transport import DEFAULT_TRANSPORT, SocketTransport
+
+# Everything else (argparse, json, csv, concurrent.futures, datetime, struct,
+# random, profiles, export, engines) is imported where it is used so that
+# short-lived scans and --help start quickly.
+
+# Service signatures for fingerprinting
+SERVICE_SIGNATURES = {
+    21: "FTP",
+    22: "SSH",
+    23: "Telnet",
+    25: "SMTP",
+    53: "DNS",
+    80: "HTTP",
+    110: "POP3",
+    143: "IMAP",
+    443: "HTTPS",
+    993: "IMAPS",
+    995: "POP3S",
+    3306: "MySQL",
+    3389: "RDP",
+    5432: "PostgreSQL",
+    5900: "VNC",
+    6379: "Redis",
+    8080: "HTTP-Proxy",
+    8443: "HTTPS-Alt"
+}
+
+# Custom payloads for different services; "{}" is replaced with the target.
+# Scanners share these tables read-only; assign a new dict to customise one.
+CUSTOM_PAYLOADS = {
+    80: b"GET / HTTP/1.1\r\nHost: {}\r\n\r\n",
+    443: b"GET / HTTP/1.1\r\nHost: {}\r\n\r\n",
+    22: b"SSH-2.0-OpenSSH_8.2p1\r\n",
+    21: b"USER anonymous\r\n",
+    25: b"EHLO {}\r\n",
+    53: b"\x00\x01\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
+}
+
+# connect_ex() error codes meaning the probe got no answer (dropped SYN, silent filter)
+NO_RESPONSE_ERRNOS = frozenset(
+    code for code in (getattr(errno, name, None) for name in ("EAGAIN", "EWOULDBLOCK", "ETIMEDOUT", "EINPROGRESS"))
+    if code is not None
+)
 
 class AdvancedPortScanner:
-    def __init__(self, target, ports, threads=100, timeout=3, scan_type="connect"):
+    def __init__(self, target, ports, threads=100, timeout=3, scan_type="connect", rate=None,
+                 retries=0, retry_backoff=0.5, banner_timeout=None, banner_max_bytes=BANNER_MAX_BYTES,
+                 engine="thread", quiet=False, trace=None, transport=None, congestion=None,
+                 index=None, output="text", service_probes=False, probe_workers=16,
+                 scope=None, executor=None):
         self.target = target
+        self.hostname = target
         self.ports = self._parse_ports(ports)
         self.threads = threads
         self.timeout = timeout
         self.scan_type = scan_type
+        self.rate = rate
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.banner_timeout = banner_timeout
+        self.banner_max_bytes = banner_max_bytes
+        self.engine = engine
+        self.quiet = quiet
+        self.output = "quiet" if quiet else output
+        self.service_probes = service_probes
+        self.probe_workers = probe_workers
+        self.scope = scope
+        self.trace = trace
+        self.transport = transport or DEFAULT_TRANSPORT
+        self.congestion = congestion
+        self.index = index
+        # Shared probe pool (the monitor runs many scanners on one); None: one pool per scan
+        self.executor = executor
         self.results = []
+        self.attempts = {}
         self.lock = threading.Lock()
         
-        # Service signatures for fingerprinting
-        self.service_signatures = {
-            21: "FTP",
-            22: "SSH",
-            23: "Telnet",
-            25: "SMTP",
-            53: "DNS",
-            80: "HTTP",
-            110: "POP3",
-            143: "IMAP",
-            443: "HTTPS",
-            993: "IMAPS",
-            995: "POP3S",
-            3306: "MySQL",
-            3389: "RDP",
-            5432: "PostgreSQL",
-            5900: "VNC",
-            6379: "Redis",
-            8080: "HTTP-Proxy",
-            8443: "HTTPS-Alt"
-        }
+        # Outcome of the probe currently running on this worker thread
+        self._local = threading.local()
+        
+        # Console renderer and in-flight count while a scan is running
+        self._renderer = None
+        self._engine = None
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+        self._service_pool = None
+        self._excluded = 0
+        
+        # Probe pacing for rate-limited timing templates
+        self._rate_lock = threading.Lock()
+        self._next_probe_at = 0.0
         
-        # Custom payloads for different services
-        self.custom_payloads = {
-            80: b"GET / HTTP/1.1\r\nHost: {}\r\n\r\n",
-            443: b"GET / HTTP/1.1\r\nHost: {}\r\n\r\n",
-            22: b"SSH-2.0-OpenSSH_8.2p1\r\n",
-            21: b"USER anonymous\r\n",
-            25: b"EHLO {}\r\n",
-            53: b"\x00\x01\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
-        }
+        self.service_signatures = SERVICE_SIGNATURES
+        self.custom_payloads = CUSTOM_PAYLOADS
+        self._encoded_payloads = None
+
+    @classmethod
+    def from_plan(cls, target, plan, **overrides):
+        """Create a scanner from a compiled ScanPlan (see scan_profiles)"""
+        settings = dict(plan.settings)
+        settings.update(overrides)
+        scanner = cls(
+            target=target,
+            ports=plan.ports,
+            threads=settings.get('threads', 100),
+            timeout=settings.get('timeout', 3),
+            scan_type=settings.get('scan_type', plan.probes[0]),
+            rate=settings.get('rate'),
+            retries=settings.get('retries', 0),
+            retry_backoff=settings.get('retry_backoff', 0.5),
+            banner_timeout=settings.get('banner_timeout'),
+            banner_max_bytes=settings.get('banner_max_bytes', BANNER_MAX_BYTES),
+            engine=settings.get('engine', "thread"),
+            quiet=settings.get('quiet', False),
+            output=settings.get('output', "text"),
+            service_probes=settings.get('service_probes', False),
+            probe_workers=settings.get('probe_workers', 16),
+            scope=settings.get('scope'),
+            trace=settings.get('trace'),
+            transport=settings.get('transport'),
+            congestion=settings.get('congestion'),
+            index=settings.get('index'),
+            executor=settings.get('executor')
+        )
+        scanner.custom_payloads = dict(plan.payloads)
+        return scanner
 
     def _parse_ports(self, ports_str):
         """Parse port ranges and individual ports"""
+        if not isinstance(ports_str, str):
+            return sorted(set(int(port) for port in ports_str))
         ports = set()
         for port_range in ports_str.split(','):
             if '-' in port_range:
@@ -86,14 +169,17 @@ class AdvancedPortScanner:
     def _connect_scan(self, port):
         """Perform TCP connect scan"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout)
-            result = sock.connect_ex((self.target, port))
-            sock.close()
+            result = self.transport.connect(self.target, port, self.timeout)
             
-            if result == 0:
+            if result in NO_RESPONSE_ERRNOS:
+                self._set_outcome(OUTCOME_NO_RESPONSE, result)
+            elif result != 0:
+                self._set_outcome(OUTCOME_CLOSED, result)
+            else:
+                self._set_outcome(OUTCOME_OPEN)
                 service = self._identify_service(port)
-                banner = self._get_banner(port)
+                # With service probes the banner comes from the second stage
+                banner = b"" if self.service_probes else self._get_banner(port)
                 return {
                     'port': port,
                     'state': 'open',
@@ -101,13 +187,18 @@ class AdvancedPortScanner:
                     'banner': banner,
                     'scan_type': 'connect'
                 }
+        except socket.timeout:
+            self._set_outcome(OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
         except Exception as e:
-            pass
+            self._set_outcome(OUTCOME_ERROR, getattr(e, 'errno', None) or 0)
         return None
 
     def _syn_scan(self, port):
         """Perform SYN scan (requires raw socket privileges)"""
         try:
+            import random
+            import struct
+            
             # Create raw socket
             sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
             
@@ -136,16 +227,18 @@ class AdvancedPortScanner:
                     tcp_header = response[20:40]
                     flags = struct.unpack('!BB', tcp_header[12:14])[1]
                     if flags & 0x12:  # SYN-ACK
+                        self._set_outcome(OUTCOME_OPEN)
                         service = self._identify_service(port)
                         return {
                             'port': port,
                             'state': 'open',
                             'service': service,
-                            'banner': '',
+                            'banner': b'',
                             'scan_type': 'syn'
                         }
+                    self._set_outcome(OUTCOME_CLOSED)
             except socket.timeout:
-                pass
+                self._set_outcome(OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
             sock.close()
         except PermissionError:
             print(f"[!] SYN scan requires root/administrator privileges")
@@ -158,59 +251,126 @@ class AdvancedPortScanner:
         """Identify service based on port number"""
         return self.service_signatures.get(port, "Unknown")
 
+    def _payload_for(self, port):
+        """Custom payload for port with the target substituted, or None"""
+        cache = self._encoded_payloads
+        if cache is None or cache[0] != self.target or cache[1] is not self.custom_payloads:
+            # Encode every payload once per (target, payload table), not once per probe
+            target = self.target.encode('ascii', errors='ignore')
+            encoded = {p: payload.replace(b"{}", target) for p, payload in self.custom_payloads.items()}
+            cache = self._encoded_payloads = (self.target, self.custom_payloads, encoded)
+        return cache[2].get(port)
+
+    def _banner_buffer(self):
+        """Per-worker reusable receive buffer and its memoryview"""
+        buf = getattr(self._local, 'banner_buf', None)
+        if buf is None or len(buf) != self.banner_max_bytes:
+            buf = bytearray(self.banner_max_bytes)
+            self._local.banner_buf = buf
+            self._local.banner_view = memoryview(buf)
+        return buf, self._local.banner_view
+
+    def _read_banner(self, sock, service):
+        """
+        Read a banner into the worker buffer until the protocol terminator,
+        the byte cap or the banner deadline, whichever comes first.
+        Returns the raw bytes; decoding is left to display/export time.
+        """
+        buf, view = self._banner_buffer()
+        terminator = BANNER_TERMINATORS.get(service)
+        reply_codes = service in REPLY_CODE_SERVICES
+        deadline = time.monotonic() + (self.banner_timeout or self.timeout)
+        received = 0
+        
+        while received < len(buf):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                count = sock.recv_into(view[received:])
+            except socket.timeout:
+                break
+            if not count:
+                break
+            received += count
+            if banner_complete(buf, received - count, received, terminator, reply_codes):
+                break
+        
+        return bytes(view[:received])
+
     def _get_banner(self, port):
-        """Attempt to grab service banner"""
+        """Attempt to grab service banner (raw bytes, empty if none)"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout)
-            sock.connect((self.target, port))
-            
-            # Send custom payload if available
-            if port in self.custom_payloads:
-                payload = self.custom_payloads[port].format(self.target).encode()
-                sock.send(payload)
+            sock = self.transport.open_stream(self.target, port, self.timeout)
             
-            # Receive banner
-            banner = sock.recv(1024).decode('utf-8', errors='ignore').strip()
-            sock.close()
-            return banner if banner else "No banner"
-        except:
-            return "No banner"
+            try:
+                # Send custom payload if available
+                payload = self._payload_for(port)
+                if payload:
+                    sock.send(payload)
+                
+                # Receive banner
+                return self._read_banner(sock, self._identify_service(port))
+            finally:
+                sock.close()
+        except Exception:
+            return b""
 
     def _udp_scan(self, port):
         """Perform UDP scan"""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(self.timeout)
-            
             # Send empty UDP packet
-            sock.sendto(b"", (self.target, port))
-            
-            try:
-                data, addr = sock.recvfrom(1024)
-                sock.close()
-                return {
-                    'port': port,
-                    'state': 'open',
-                    'service': self._identify_service(port),
-                    'banner': data.decode('utf-8', errors='ignore')[:100],
-                    'scan_type': 'udp'
-                }
-            except socket.timeout:
-                # Port might be open/filtered
-                sock.close()
-                return {
-                    'port': port,
-                    'state': 'open|filtered',
-                    'service': self._identify_service(port),
-                    'banner': 'No response',
-                    'scan_type': 'udp'
-                }
+            data = self.transport.udp_probe(self.target, port, b"", self.timeout, 1024)
+            self._set_outcome(OUTCOME_OPEN)
+            return {
+                'port': port,
+                'state': 'open',
+                'service': self._identify_service(port),
+                'banner': data,
+                'scan_type': 'udp'
+            }
+        except socket.timeout:
+            # Port might be open/filtered
+            self._set_outcome(OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
+            return {
+                'port': port,
+                'state': 'open|filtered',
+                'service': self._identify_service(port),
+                'banner': b'',
+                'scan_type': 'udp'
+            }
+        except ConnectionRefusedError as e:
+            self._set_outcome(OUTCOME_CLOSED, e.errno)
         except Exception as e:
-            return None
+            self._set_outcome(OUTCOME_ERROR, getattr(e, 'errno', None) or 0)
+        return None
+
+    def _throttle(self):
+        """Block until the next probe slot when a probe rate is configured"""
+        if not self.rate:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_probe_at)
+            self._next_probe_at = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
 
     def scan_port(self, port):
         """Scan a single port based on scan type"""
+        if self.scope is not None and not self.scope.permits(self.target, port):
+            self._set_outcome(OUTCOME_ERROR, errno.EACCES)
+            return None
+        if self._uses_event_engine():
+            from event_engine import SelectorEngine
+            for port, result, outcome, err in SelectorEngine(self, ports=1).run([port]):
+                self._set_outcome(outcome, err)
+                return result
+            return None
+        self._throttle()
+        # Traced latency starts once any --rate pacing delay is over
+        self._local.started = time.time()
         if self.scan_type == "connect":
             return self._connect_scan(port)
         elif self.scan_type == "syn":
@@ -219,62 +379,325 @@ class AdvancedPortScanner:
             return self._udp_scan(port)
         return None
 
-    def run_scan(self):
-        """Execute the port scan"""
-        print(f"[*] Starting {self.scan_type.upper()} scan of {self.target}")
-        print(f"[*] Scanning {len(self.ports)} ports with {self.threads} threads")
-        print(f"[*] Scan started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("-" * 60)
+    def _print(self, message):
+        """Queue a status message for the console renderer, or print it outside a scan"""
+        if self._renderer is not None:
+            self._renderer.message(message)
+        elif self.output == "text":
+            print(message)
+        elif self.output == "jsonl":
+            # JSON-lines mode keeps stdout for results only
+            print(message, file=sys.stderr)
+
+    def _inflight_count(self):
+        """Probes currently in flight, for the progress line"""
+        engine = self._engine
+        return engine.capacity - len(engine.free) if engine is not None else self._inflight
+
+    def _set_outcome(self, outcome, err=0):
+        """Record the outcome of the probe running on this thread"""
+        self._local.outcome = outcome
+        self._local.errno = err
+
+    def _probe(self, port):
+        """Scan a port and return (port, result, outcome, errno) for the scheduler"""
+        self._set_outcome(OUTCOME_ERROR)
+        with self._inflight_lock:
+            self._inflight += 1
+        self._local.started = time.time()
+        try:
+            result = self.scan_port(port)
+        finally:
+            with self._inflight_lock:
+                self._inflight -= 1
+        if result and self._local.outcome == OUTCOME_ERROR:
+            self._local.outcome = OUTCOME_OPEN
+        if self.trace is not None:
+            self.trace.record(self.target, port, "thread", self._local.outcome, self._local.errno,
+                              self._local.started, time.time())
+        return port, result, self._local.outcome, self._local.errno
+
+    def _probe_service(self, result, scan_results):
+        """Second stage: identify the service behind an open port, then record it"""
+        from service_probes import probe_service
         
-        start_time = time.time()
+        try:
+            service, banner, details = probe_service(
+                self.transport, self.target, result['port'], hint=result['service'],
+                timeout=self.banner_timeout or self.timeout, max_bytes=self.banner_max_bytes,
+                hostname=self.hostname)
+            if service is not None:
+                result['service'] = service
+            result['banner'] = banner
+            result['details'] = details
+        except Exception:
+            result['details'] = {}
+        self._record_result(result, scan_results)
+
+    def _record_result(self, result, scan_results):
+        """Add or replace the result for a port and hand it to the console renderer"""
+        if self._service_pool is not None and result['scan_type'] == "connect" and 'details' not in result:
+            self._service_pool.submit(self._probe_service, result, scan_results)
+            return
+        port = result['port']
+        result['attempts'] = self.attempts[port]
+        with self.lock:
+            previous = scan_results.get(port)
+            if previous is not None:
+                self.results.remove(previous)
+            scan_results[port] = result
+            self.results.append(result)
+            if self.index is not None:
+                self.index.add(result, host=self.target)
+        if self._renderer is not None:
+            self._renderer.result(result, self.target)
+
+    def _uses_event_engine(self):
+        """
+        The event engine handles connect and UDP scans over real sockets;
+        SYN scans and custom transports always use threads
+        """
+        return (self.engine == "event" and self.scan_type in ("connect", "udp")
+                and isinstance(self.transport, SocketTransport))
+
+    def _dispatch(self, ports):
+        """Probe ports with the configured engine, yielding (port, result, outcome, errno)"""
+        if self.scope is not None:
+            # Excluded pairs never reach an engine
+            permitted = self.scope.filter_ports(self.target, ports)
+            excluded = len(ports) - len(permitted)
+            if excluded:
+                self._excluded += excluded
+                if self._renderer is not None:
+                    self._renderer.add_total(-excluded)
+            ports = permitted
+        if self._uses_event_engine():
+            from event_engine import SelectorEngine
+            self._engine = SelectorEngine(self, ports=len(ports))
+            try:
+                yield from self._engine.run(ports)
+            finally:
+                self._engine = None
+            return
+        if self.congestion is not None:
+            yield from self._dispatch_windowed(ports)
+            return
+        from concurrent.futures import as_completed
+        with self._probe_pool() as executor:
+            futures = [executor.submit(self._probe, port) for port in ports]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _probe_pool(self):
+        """Context manager giving the shared executor, or a pool of self.threads workers for this scan"""
+        if self.executor is not None:
+            from contextlib import nullcontext
+            return nullcontext(self.executor)
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=self.threads)
+
+    def _dispatch_windowed(self, ports):
+        """
+        Thread-pool dispatch that only submits a probe once the congestion
+        controller grants this host an in-flight slot
+        """
+        import queue
+        
+        controller = self.congestion
+        finished = queue.Queue()
         
-        with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            future_to_port = {executor.submit(self.scan_port, port): port for port in self.ports}
+        def probe(port, ticket):
+            outcome = (port, None, OUTCOME_ERROR, 0)
+            try:
+                outcome = self._probe(port)
+            finally:
+                controller.release(self.target, ticket, outcome[2], outcome[3])
+                finished.put(outcome)
+        
+        inflight = 0
+        with self._probe_pool() as executor:
+            for port in ports:
+                ticket = controller.acquire(self.target, block=False)
+                while ticket is None:
+                    if inflight:
+                        # Our own probes hold the window: wait for one to finish
+                        inflight -= 1
+                        yield finished.get()
+                        ticket = controller.acquire(self.target, block=False)
+                    else:
+                        # Other scanners hold the global cap
+                        ticket = controller.acquire(self.target)
+                executor.submit(probe, port, ticket)
+                inflight += 1
+                while not finished.empty():
+                    inflight -= 1
+                    yield finished.get()
+            while inflight:
+                inflight -= 1
+                yield finished.get()
+
+    def _retry_unanswered(self, unanswered, scan_results):
+        """
+        Re-probe ports that got no response in the main pass.
+        Each round waits retry_backoff * 2**(round - 1) seconds first and only
+        covers ports still unanswered, so lossy links cost extra probes
+        rather than a longer timeout on every port.
+        """
+        for attempt in range(1, self.retries + 1):
+            if not unanswered:
+                break
+            delay = self.retry_backoff * (2 ** (attempt - 1))
+            self._print(f"[*] Retry {attempt}/{self.retries}: re-probing {len(unanswered)} unanswered ports in {delay:.2f}s")
+            time.sleep(delay)
             
-            for future in as_completed(future_to_port):
-                result = future.result()
+            retry_ports, unanswered = unanswered, []
+            if self._renderer is not None:
+                self._renderer.add_total(len(retry_ports))
+            for port, result, outcome, err in self._dispatch(retry_ports):
+                self.attempts[port] += 1
+                if self._renderer is not None:
+                    self._renderer.advance()
+                if outcome == OUTCOME_NO_RESPONSE:
+                    unanswered.append(port)
+                    with self.lock:
+                        # Still silent: keep the open|filtered guess but report every attempt
+                        if port in scan_results:
+                            scan_results[port]['attempts'] = self.attempts[port]
+                    continue
                 if result:
+                    self._record_result(result, scan_results)
+                elif port in scan_results:
+                    # Answered as closed: drop the earlier open|filtered guess
                     with self.lock:
-                        self.results.append(result)
-                        print(f"[+] {result['port']:5d}/tcp  {result['state']:12}  {result['service']:15}  {result['banner'][:30]}")
+                        dropped = scan_results.pop(port)
+                        self.results.remove(dropped)
+                        if self.index is not None:
+                            self.index.remove(self.target, port, dropped['scan_type'])
+        return unanswered
+
+    def run_scan(self):
+        """Execute the port scan"""
+        if self.output != "quiet":
+            from scan_console import ConsoleRenderer
+            self._renderer = ConsoleRenderer(self.output).start(
+                len(self.ports), open_count=lambda: len(self.results), inflight=self._inflight_count)
+        try:
+            return self._run_scan()
+        finally:
+            if self._renderer is not None:
+                self._renderer.stop()
+                self._renderer = None
+
+    def _run_scan(self):
+        """Main pass, retries and summary; output goes through the renderer"""
+        from datetime import datetime
+        
+        self._print(f"[*] Starting {self.scan_type.upper()} scan of {self.target}")
+        if self._uses_event_engine():
+            self._print(f"[*] Scanning {len(self.ports)} ports with up to {self.threads} sockets in flight (event engine)")
+        else:
+            self._print(f"[*] Scanning {len(self.ports)} ports with {self.threads} threads")
+        self._print(f"[*] Scan started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        self._print("-" * 60)
+        
+        start_time = time.time()
+        self.attempts = {}
+        scan_results = {}
+        unanswered = []
+        
+        if self.service_probes and self.scan_type == "connect":
+            # Open ports are handed to a bounded pool of protocol probes while
+            # discovery keeps running at full speed
+            from concurrent.futures import ThreadPoolExecutor
+            self._service_pool = ThreadPoolExecutor(max_workers=self.probe_workers)
+        try:
+            unanswered, retried = self._discover(scan_results)
+        finally:
+            if self._service_pool is not None:
+                self._service_pool.shutdown(wait=True)
+                self._service_pool = None
         
         end_time = time.time()
         scan_duration = end_time - start_time
         
-        print("-" * 60)
-        print(f"[*] Scan completed in {scan_duration:.2f} seconds")
-        print(f"[*] Found {len(self.results)} open ports")
+        self._print("-" * 60)
+        self._print(f"[*] Scan completed in {scan_duration:.2f} seconds")
+        if self.retries and retried:
+            self._print(f"[*] Retried {retried} unanswered ports, {retried - len(unanswered)} answered on retry")
+        self._print(f"[*] Found {len(self.results)} open ports")
         
         return self.results
 
-    def export_results(self, format_type="text", filename=None):
-        """Export scan results in various formats"""
+    def _discover(self, scan_results):
+        """Main pass and retry rounds; returns (still unanswered ports, ports retried)"""
+        unanswered = []
+        self._excluded = 0
+        for port, result, outcome, err in self._dispatch(self.ports):
+            self.attempts[port] = 1
+            if self._renderer is not None:
+                self._renderer.advance()
+            if outcome == OUTCOME_NO_RESPONSE:
+                unanswered.append(port)
+            if result:
+                self._record_result(result, scan_results)
+        if self._excluded:
+            self._print(f"[*] Skipped {self._excluded} of {len(self.ports)} ports excluded by scope")
+        
+        retried = len(unanswered)
+        return self._retry_unanswered(unanswered, scan_results), retried
+
+    def _export_rows(self, sort=False):
+        """Results with banners decoded for export, optionally in (host, port, proto) order"""
+        results = self.results
+        if sort:
+            from scan_diff import sort_key
+            results = sorted(results, key=lambda result: sort_key({'host': self.target, **result}))
+        for result in results:
+            row = dict(result)
+            row.setdefault('host', self.target)
+            row['banner'] = banner_text(result['banner'])
+            yield row
+
+    def export_results(self, format_type="text", filename=None, sort=False):
+        """Export scan results in various formats (sorted for scan_diff when sort is set)"""
+        import scan_export
+        
         if not filename:
+            from datetime import datetime
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"port_scan_{self.target}_{timestamp}"
         
         if format_type == "json":
-            with open(f"{filename}.json", 'w') as f:
-                json.dump(self.results, f, indent=2)
-            print(f"[*] Results exported to {filename}.json")
+            scan_export.write_json(self._export_rows(sort), f"{filename}.json")
+            self._print(f"[*] Results exported to {filename}.json")
         
         elif format_type == "csv":
-            with open(f"{filename}.csv", 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=['port', 'state', 'service', 'banner', 'scan_type'])
-                writer.writeheader()
-                writer.writerows(self.results)
-            print(f"[*] Results exported to {filename}.csv")
+            scan_export.write_csv(self._export_rows(sort), f"{filename}.csv")
+            self._print(f"[*] Results exported to {filename}.csv")
         
         elif format_type == "text":
-            with open(f"{filename}.txt", 'w') as f:
-                f.write(f"Port Scan Results for {self.target}\n")
-                f.write(f"Scan completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write("-" * 60 + "\n")
-                for result in self.results:
-                    f.write(f"{result['port']:5d}/tcp  {result['state']:12}  {result['service']:15}  {result['banner']}\n")
-            print(f"[*] Results exported to {filename}.txt")
+            scan_export.write_text(self._export_rows(sort), self.target, f"{filename}.txt")
+            self._print(f"[*] Results exported to {filename}.txt")
+
+# Subcommands handled by other modules: python advanced_port_scanner.py <name> ...
+# ("module" runs module.main, "module:function" runs that function)
+SUBCOMMANDS = {
+    "trace": "probe_trace",
+    "index": "result_index",
+    "diff": "scan_diff:diff_main",
+    "merge": "scan_diff:merge_main"
+}
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        import importlib
+        module, _, function = SUBCOMMANDS[sys.argv[1]].partition(":")
+        getattr(importlib.import_module(module), function or "main")(sys.argv[2:])
+        return
+    
+    import argparse
+    from scan_profiles import TIMING_TEMPLATES, compile_profile_data, load_plan, timing_settings
+    
     parser = argparse.ArgumentParser(
         description="Advanced Port Scanner with Advanced Features",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -283,41 +706,173 @@ Examples:
   python advanced_port_scanner.py 192.168.1.1 -p 1-1000
   python advanced_port_scanner.py example.com -p 80,443,8080 -t 200
   python advanced_port_scanner.py 10.0.0.1 -p 1-65535 -s syn --export json
+  python advanced_port_scanner.py 10.0.0.1 -T polite --profile web.yaml --plan-cache .plans
+  python advanced_port_scanner.py 10.0.0.1 -p 1-1000 --trace scan.trace
+  python advanced_port_scanner.py 10.0.0.1 -p 1-65535 -t 500 --congestion
+  python advanced_port_scanner.py 10.0.0.1 -p 1-65535 -e event -t 2000 --service-probes
+  python advanced_port_scanner.py 10.0.0.1 -p 1-65535 -e event -t 5000 --source-address 10.0.0.50 --source-address 10.0.0.51 --rst-close
+  python advanced_port_scanner.py 10.0.0.0/16 -p 1-1024 --monitor --exclude-file never.txt --exclude-ports 3306
+  python advanced_port_scanner.py trace analyze scan.trace
+  python advanced_port_scanner.py 10.0.0.1 -p 1-65535 --index sweep.idx
+  python advanced_port_scanner.py index query sweep.idx --port 3389 --hosts
+  python advanced_port_scanner.py 10.0.0.1 -p 1-65535 --export json --sort-export --output today
+  python advanced_port_scanner.py diff yesterday.json today.json
+  python advanced_port_scanner.py 10.0.0.0/24 -p 22,80,443 --monitor --state-file net.json --event-log events.jsonl
         """
     )
     
     parser.add_argument("target", help="Target IP address or hostname")
-    parser.add_argument("-p", "--ports", default="1-1000", help="Port range (e.g., 80,443,8080 or 1-1000)")
-    parser.add_argument("-t", "--threads", type=int, default=100, help="Number of threads (default: 100)")
-    parser.add_argument("--timeout", type=int, default=3, help="Connection timeout in seconds (default: 3)")
-    parser.add_argument("-s", "--scan-type", choices=["connect", "syn", "udp"], default="connect", 
+    parser.add_argument("-p", "--ports", help="Port range (e.g., 80,443,8080 or 1-1000) (default: 1-1000)")
+    parser.add_argument("-t", "--threads", type=int, help="Number of threads (default: 100)")
+    parser.add_argument("--timeout", type=float, help="Connection timeout in seconds (default: 3)")
+    parser.add_argument("-s", "--scan-type", choices=["connect", "syn", "udp"],
                        help="Scan type (default: connect)")
+    parser.add_argument("-e", "--engine", choices=["thread", "event"],
+                       help="Scan engine: thread pool or single-threaded selectors loop (default: thread)")
+    parser.add_argument("-T", "--timing", choices=list(TIMING_TEMPLATES),
+                       help="Timing template setting threads, rate, timeout and retries together")
+    parser.add_argument("--rate", type=float, help="Maximum probes per second (default: unlimited)")
+    parser.add_argument("--retries", type=int, help="Re-probe unanswered ports this many times (default: 0)")
+    parser.add_argument("--retry-backoff", type=float,
+                       help="Initial delay before a retry round, doubled each round (default: 0.5)")
+    parser.add_argument("--banner-timeout", type=float,
+                       help="Deadline for reading a banner in seconds (default: same as --timeout)")
+    parser.add_argument("--banner-bytes", type=int, dest="banner_max_bytes",
+                       help=f"Maximum banner size in bytes (default: {BANNER_MAX_BYTES})")
+    parser.add_argument("--congestion", action="store_true",
+                       help="Adapt per-host in-flight probes with AIMD congestion control")
+    parser.add_argument("--max-inflight", type=int,
+                       help="Global cap on in-flight probes with --congestion (default: thread count)")
+    parser.add_argument("--service-probes", action="store_true",
+                       help="Skip banners during discovery, then identify open services with protocol probes")
+    parser.add_argument("--probe-workers", type=int,
+                       help="Concurrent service probes with --service-probes (default: 16)")
+    parser.add_argument("--source-address", action="append", default=[],
+                       help="Local IPv4 address to connect from; repeat to spread probes round-robin across several")
+    parser.add_argument("--rst-close", action="store_true",
+                       help="Close discovery connections with RST instead of FIN to avoid TIME_WAIT build-up")
+    parser.add_argument("--exclude", help="Hosts, CIDRs or address ranges never to probe (comma-separated)")
+    parser.add_argument("--exclude-ports", help="Ports never to probe (e.g., 3306,5432-5439)")
+    parser.add_argument("--exclude-file", action="append", default=[],
+                       help="Scope file of hosts and 'port N' lines never to probe (repeatable)")
+    parser.add_argument("--allow", help="Only probe these hosts, CIDRs or address ranges (comma-separated)")
+    parser.add_argument("--allow-ports", help="Only probe these ports")
+    parser.add_argument("--allow-file", action="append", default=[],
+                       help="Scope file of the only hosts and ports that may be probed (repeatable)")
+    parser.add_argument("--profile", help="JSON/YAML scan profile to compile into a scan plan")
+    parser.add_argument("--plan-cache", help="Directory for caching compiled scan plans")
+    parser.add_argument("--monitor", action="store_true",
+                       help="Continuously rescan the target(s) in slices and report changes")
+    parser.add_argument("--state-file", help="Monitor state file (default: keep state in memory)")
+    parser.add_argument("--slice-size", type=int, default=256, help="Monitor probes per tick (default: 256)")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between monitor ticks (default: 60)")
+    parser.add_argument("--event-log", help="Append monitor change events to this JSON-lines file ('-' for stdout)")
+    parser.add_argument("--webhook", help="POST monitor change events to this URL")
+    parser.add_argument("--cycles", type=int, help="Stop monitoring after this many ticks")
+    parser.add_argument("--trace", help="Record a binary per-probe trace to this file (see probe_trace.py)")
+    parser.add_argument("--index", help="Add results to this result index file (see result_index.py)")
+    output_mode = parser.add_mutually_exclusive_group()
+    output_mode.add_argument("-q", "--quiet", action="store_const", const="quiet", dest="output_mode",
+                            help="Print only the final summary")
+    output_mode.add_argument("--jsonl", action="store_const", const="jsonl", dest="output_mode",
+                            help="Print each open port as a JSON line; status and progress go to stderr")
     parser.add_argument("--export", choices=["text", "json", "csv"], help="Export results to file")
     parser.add_argument("--output", help="Output filename (without extension)")
+    parser.add_argument("--sort-export", action="store_true",
+                       help="Sort exported results by host, port and protocol so diff/merge need no sort step")
     
     args = parser.parse_args()
+    trace = None
+    index = None
     
     try:
+        # Settings precedence: profile < timing template < explicit command line options
+        if args.profile:
+            plan = load_plan(args.profile, CUSTOM_PAYLOADS, args.plan_cache, ports=args.ports)
+        else:
+            plan = compile_profile_data({'ports': args.ports or "1-1000"}, CUSTOM_PAYLOADS)
+        overrides = timing_settings(args.timing) if args.timing else {}
+        for option in ("threads", "timeout", "rate", "retries", "retry_backoff",
+                       "banner_timeout", "banner_max_bytes", "engine", "scan_type", "probe_workers"):
+            if getattr(args, option) is not None:
+                overrides[option] = getattr(args, option)
+        if args.output_mode:
+            overrides['output'] = args.output_mode
+        if args.service_probes:
+            overrides['service_probes'] = True
+        
+        scope = None
+        if args.exclude or args.exclude_ports or args.exclude_file or \
+                args.allow or args.allow_ports or args.allow_file:
+            from scan_scope import ScanScope
+            scope = overrides['scope'] = ScanScope.from_options(
+                args.exclude, args.exclude_ports, args.exclude_file, args.allow, args.allow_ports, args.allow_file)
+        if args.source_address or args.rst_close:
+            overrides['transport'] = SocketTransport(args.source_address, rst_close=args.rst_close)
+        probes = [args.scan_type] if args.scan_type else plan.probes
+        
+        if args.congestion:
+            from congestion import CongestionController
+            max_inflight = args.max_inflight or overrides.get('threads', plan.settings.get('threads', 100))
+            overrides['congestion'] = CongestionController(max_inflight=max_inflight)
+        
+        if args.trace:
+            from probe_trace import TraceRecorder
+            trace = overrides['trace'] = TraceRecorder(args.trace)
+        
+        if args.index:
+            from result_index import ResultIndex
+            index = overrides['index'] = ResultIndex.load(args.index)
+        
         # Validate target
-        scanner = AdvancedPortScanner(
-            target=args.target,
-            ports=args.ports,
-            threads=args.threads,
-            timeout=args.timeout,
-            scan_type=args.scan_type
-        )
+        scanner = AdvancedPortScanner.from_plan(args.target, plan, **overrides)
+        
+        if args.monitor:
+            from scan_monitor import JsonLinesSink, ScanMonitor, WebhookSink, expand_targets
+            
+            sinks = []
+            if args.event_log:
+                sinks.append(JsonLinesSink(args.event_log))
+            if args.webhook:
+                sinks.append(WebhookSink(args.webhook))
+            options = ("threads", "timeout", "scan_type", "rate", "retries", "retry_backoff",
+                       "banner_timeout", "banner_max_bytes", "engine", "trace", "congestion", "index",
+                       "service_probes", "probe_workers", "scope", "transport")
+            hosts = expand_targets(args.target)
+            if scope is not None:
+                hosts = scope.filter_hosts(hosts)
+            monitor = ScanMonitor(
+                hosts=hosts,
+                ports=scanner.ports,
+                state_file=args.state_file,
+                slice_size=args.slice_size,
+                interval=args.interval,
+                sinks=sinks,
+                scanner_options={option: getattr(scanner, option) for option in options},
+                plan=plan,
+                probes=probes
+            )
+            monitor.run(args.cycles)
+            return
         
         # Resolve target
         scanner.target = scanner._resolve_target()
+        if scope is not None and not scope.host_permitted(scanner.target):
+            print(f"[!] Error: {args.target} is excluded by the scan scope")
+            sys.exit(1)
         
-        # Run scan
-        results = scanner.run_scan()
+        # Run scan, once per probe in the plan
+        for probe in probes:
+            scanner.scan_type = probe
+            results = scanner.run_scan()
         
         # Export results if requested
         if args.export:
-            scanner.export_results(args.export, args.output)
+            scanner.export_results(args.export, args.output, sort=args.sort_export)
         
         # Summary
+        if args.output_mode == "jsonl":
+            return
         if results:
             print(f"\n[*] Summary: {len(results)} open ports found on {scanner.target}")
             for result in results:
@@ -331,6 +886,13 @@ Examples:
     except Exception as e:
         print(f"[!] Error: {e}")
         sys.exit(1)
+    finally:
+        if trace is not None:
+            trace.close()
+        if index is not None:
+            index.save(args.index)
 
 if __name__ == "__main__":
+    # Helpers that need the scanner class import it by name; reuse this module instead of loading it twice
+    sys.modules.setdefault("advanced_port_scanner", sys.modules[__name__])
     main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Congestion Control for Advanced Port Scanner
+AIMD (additive increase, multiplicative decrease) in-flight windows per
+host under a global cap. Healthy answers (open, or refused by a closed
+port) grow a host's window; timeouts and connection resets shrink it, at
+most once per window of probes, so firewalls that start dropping or
+resetting under load get backed off automatically.
+"""
+
+import errno
+import threading
+
+from scan_results import OUTCOME_CLOSED, OUTCOME_ERROR, OUTCOME_NO_RESPONSE, OUTCOME_OPEN
+
+# Errors that signal a struggling path or local resource exhaustion
+CONGESTION_ERRNOS = frozenset(
+    code for code in (getattr(errno, name, None) for name in ("ECONNRESET", "ENOBUFS", "EADDRNOTAVAIL", "EMFILE"))
+    if code is not None
+)
+
+
+class HostWindow:
+    """AIMD state for one host"""
+
+    __slots__ = ("window", "threshold", "inflight", "answered", "sequence", "recover", "decreases")
+
+    def __init__(self, window, threshold):
+        self.window = window
+        self.threshold = threshold
+        self.inflight = 0
+        self.answered = 0
+        self.sequence = 0
+        self.recover = 0
+        self.decreases = 0
+
+
+class CongestionController:
+    """
+    Shared in-flight limiter for one or more scanners.
+
+    Each probe takes a ticket with acquire(host) and hands it back with
+    release(host, ticket, outcome, errno). A host may have at most
+    floor(window) probes in flight and all hosts together at most
+    max_inflight. Windows start at initial_window, double per round trip
+    (one step per answer) until they first shrink, then grow by one probe
+    per window of answers. A loss halves the window, ignoring further
+    losses from probes sent before the cut. Timeouts from a host that has
+    never answered are not treated as congestion, so fully filtered hosts
+    are not slowed down to one probe at a time.
+    """
+
+    def __init__(self, max_inflight=100, initial_window=10, min_window=1, max_window=None, decrease=0.5):
+        self.max_inflight = max(1, max_inflight)
+        self.initial_window = initial_window
+        self.min_window = max(1, min_window)
+        self.max_window = max_window or self.max_inflight
+        self.decrease = decrease
+        self.inflight = 0
+        self.hosts = {}
+        self.condition = threading.Condition()
+
+    def _host(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            window = max(self.min_window, min(self.initial_window, self.max_window))
+            state = self.hosts[host] = HostWindow(window, float(self.max_window))
+        return state
+
+    def window(self, host):
+        """Current in-flight window for host"""
+        with self.condition:
+            return self._host(host).window
+
+    def acquire(self, host, block=True, timeout=None):
+        """Reserve an in-flight slot for host; returns a ticket, or None if not available"""
+        with self.condition:
+            state = self._host(host)
+            while state.inflight >= int(state.window) or self.inflight >= self.max_inflight:
+                if not block or not self.condition.wait(timeout):
+                    return None
+            state.inflight += 1
+            self.inflight += 1
+            state.sequence += 1
+            return state.sequence
+
+    def release(self, host, ticket, outcome=None, err=0):
+        """Return a slot and adjust host's window from the probe outcome (None: no signal)"""
+        with self.condition:
+            state = self._host(host)
+            state.inflight -= 1
+            self.inflight -= 1
+            if outcome in (OUTCOME_OPEN, OUTCOME_CLOSED) and err not in CONGESTION_ERRNOS:
+                state.answered += 1
+                if state.window < state.threshold:
+                    state.window += 1
+                else:
+                    state.window += 1 / state.window
+                state.window = min(state.window, self.max_window)
+            elif (outcome == OUTCOME_NO_RESPONSE and state.answered) or \
+                    (outcome in (OUTCOME_CLOSED, OUTCOME_ERROR) and err in CONGESTION_ERRNOS):
+                if ticket > state.recover:
+                    state.window = max(self.min_window, state.window * self.decrease)
+                    state.threshold = state.window
+                    state.recover = state.sequence
+                    state.decreases += 1
+            self.condition.notify_all()
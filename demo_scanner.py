@@ -6,7 +6,7 @@ This script demonstrates various scanning techniques and use cases
 
 import time
 import json
-from advanced_port_scanner import AdvancedPortScanner
+from advanced_port_scanner import AdvancedPortScanner, banner_line
 
 def demo_basic_scan():
     """Demonstrate basic port scanning"""
@@ -92,7 +92,7 @@ def demo_service_fingerprinting():
         for result in results:
             print(f"  Port {result['port']}:")
             print(f"    Service: {result['service']}")
-            print(f"    Banner: {result['banner'][:100]}...")
+            print(f"    Banner: {banner_line(result['banner'])[:100]}...")
             print()
     
     print("=" * 50)
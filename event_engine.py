@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Event-Loop Scan Engine for Advanced Port Scanner
+A single-threaded selectors (epoll/kqueue/select) driver for connect and UDP
+scans. Probe state lives in preallocated slots and per-socket deadlines are
+kept in a hashed timer wheel, so thousands of sockets are handled without a
+thread or Python frame per port.
+"""
+
+import errno
+import selectors
+import socket
+import time
+
+from scan_results import (OUTCOME_CLOSED, OUTCOME_ERROR, OUTCOME_NO_RESPONSE, OUTCOME_OPEN,
+                          BANNER_TERMINATORS, REPLY_CODE_SERVICES, banner_complete)
+
+# Slot states
+FREE = 0
+CONNECTING = 1
+READING = 2
+UDP_WAIT = 3
+
+# connect_ex() codes that mean the handshake is under way
+CONNECT_PENDING = frozenset((0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY))
+
+# File descriptors kept back for the rest of the process
+FD_RESERVE = 64
+
+
+def fd_budget(requested):
+    """Clamp the in-flight socket count to what the file descriptor limit allows"""
+    try:
+        import resource
+    except ImportError:
+        return requested
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - FD_RESERVE))
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel of (slot, generation) entries.
+    Entries whose generation no longer matches the slot are dropped lazily,
+    so re-arming a slot never has to search the wheel.
+    """
+
+    def __init__(self, tick=0.01, size=512):
+        self.tick = tick
+        self.size = size
+        self.buckets = [[] for _ in range(size)]
+        self.current = int(time.monotonic() / tick)
+
+    def schedule(self, slot, generation, deadline, floor=None):
+        """Arm a timer for slot at deadline (never in a bucket before floor)"""
+        index = max(int(deadline / self.tick), self.current if floor is None else floor)
+        self.buckets[index % self.size].append((slot, generation))
+
+    def next_timeout(self, now):
+        """Seconds until the next tick boundary"""
+        return max(0.0, (self.current + 1) * self.tick - now)
+
+    def expire(self, now, generations, deadlines):
+        """Return slots whose deadline has passed, re-arming entries that wrapped around"""
+        expired = []
+        target = int(now / self.tick)
+        # Never walk more than one full revolution
+        start = max(self.current, target - self.size + 1)
+        for index in range(start, target + 1):
+            bucket = self.buckets[index % self.size]
+            if not bucket:
+                continue
+            self.buckets[index % self.size] = []
+            for slot, generation in bucket:
+                if generations[slot] != generation:
+                    continue
+                if deadlines[slot] <= now:
+                    expired.append(slot)
+                else:
+                    self.schedule(slot, generation, deadlines[slot], floor=target + 1)
+        self.current = target + 1
+        return expired
+
+
+class SelectorEngine:
+    """Non-blocking connect/UDP scan engine driven by a selector"""
+
+    def __init__(self, scanner, ports=None):
+        """Slots (and banner buffer) for scanner.threads probes, or fewer when only ports probes will run"""
+        self.scanner = scanner
+        self.capacity = fd_budget(max(1, min(scanner.threads, ports) if ports is not None else scanner.threads))
+        self.banner_timeout = scanner.banner_timeout or scanner.timeout
+        self.grab_banners = not scanner.service_probes
+        self.transport = scanner.transport
+
+        # Preallocated per-slot state
+        capacity = self.capacity
+        self.state = bytearray(capacity)
+        self.socks = [None] * capacity
+        self.ports = [0] * capacity
+        self.deadlines = [0.0] * capacity
+        self.generations = [0] * capacity
+        self.received = [0] * capacity
+        self.started = [0.0] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+
+        # One contiguous banner buffer carved into per-slot views
+        self.banner_size = scanner.banner_max_bytes
+        self.buffer = bytearray(self.banner_size * capacity)
+        self.view = memoryview(self.buffer)
+
+        self.selector = None
+        self.wheel = None
+        self.done = []
+        self.trace = scanner.trace
+
+    def run(self, ports):
+        """Scan ports, yielding (port, result, outcome, errno) as probes finish"""
+        scan_type = self.scanner.scan_type
+        if scan_type not in ("connect", "udp"):
+            raise ValueError(f"Event engine does not support {scan_type} scans")
+
+        launch = self._launch_connect if scan_type == "connect" else self._launch_udp
+        rate = self.scanner.rate
+        controller = self.scanner.congestion
+        target = self.scanner.target
+        tickets = {}
+        next_launch = 0.0
+        pending = iter(ports)
+        exhausted = False
+        active = 0
+
+        self.selector = selectors.DefaultSelector()
+        self.wheel = TimerWheel(tick=min(0.01, self.scanner.timeout / 4))
+        try:
+            while True:
+                now = time.monotonic()
+                while self.free and not exhausted and (not rate or now >= next_launch):
+                    ticket = None
+                    if controller is not None:
+                        ticket = controller.acquire(target, block=False)
+                        if ticket is None:
+                            break
+                    port = next(pending, None)
+                    if port is None:
+                        exhausted = True
+                        if ticket is not None:
+                            controller.release(target, ticket)
+                        break
+                    if ticket is not None:
+                        tickets[port] = ticket
+                    launch(self.free.pop(), port, now)
+                    if rate:
+                        next_launch = max(now, next_launch) + 1.0 / rate
+                active = self.capacity - len(self.free)
+
+                # Probes that failed inside launch are only in self.done: yield them first
+                if not active and exhausted and not self.done:
+                    break
+
+                wait = self.wheel.next_timeout(now)
+                if rate and not exhausted:
+                    wait = min(wait, max(0.0, next_launch - now))
+                if active:
+                    for key, mask in self.selector.select(wait):
+                        self._handle(key.data, mask)
+                else:
+                    time.sleep(wait)
+
+                now = time.monotonic()
+                for slot in self.wheel.expire(now, self.generations, self.deadlines):
+                    self._expire(slot)
+
+                if self.done:
+                    done, self.done = self.done, []
+                    if controller is not None:
+                        for port, result, outcome, err in done:
+                            controller.release(target, tickets.pop(port), outcome, err)
+                    yield from done
+        finally:
+            for slot in range(self.capacity):
+                if self.state[slot] != FREE:
+                    self._release(slot)
+            for ticket in tickets.values():
+                controller.release(target, ticket)
+            self.selector.close()
+
+    def _arm(self, slot, deadline):
+        """Set a new deadline for slot, invalidating any earlier timer"""
+        self.generations[slot] += 1
+        self.deadlines[slot] = deadline
+        self.wheel.schedule(slot, self.generations[slot], deadline)
+
+    def _launch_connect(self, slot, port, now):
+        """Start a non-blocking connect for port in slot"""
+        try:
+            sock = self.transport.tcp_socket()
+        except OSError as e:
+            self._complete(port, None, OUTCOME_ERROR, e.errno or 0, now)
+            self.free.append(slot)
+            return
+        sock.setblocking(False)
+        err = sock.connect_ex((self.scanner.target, port))
+        if err not in CONNECT_PENDING:
+            self.transport.close_probe(sock)
+            self._complete(port, None, OUTCOME_CLOSED, err, now)
+            self.free.append(slot)
+            return
+        self.socks[slot] = sock
+        self.ports[slot] = port
+        self.received[slot] = 0
+        self.started[slot] = now
+        self.state[slot] = CONNECTING
+        self.selector.register(sock, selectors.EVENT_WRITE, slot)
+        self._arm(slot, now + self.scanner.timeout)
+
+    def _launch_udp(self, slot, port, now):
+        """Send an empty datagram to port from a connected UDP socket in slot"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        except OSError as e:
+            self._complete(port, None, OUTCOME_ERROR, e.errno or 0, now)
+            self.free.append(slot)
+            return
+        try:
+            sock.setblocking(False)
+            # Connected UDP sockets surface ICMP port-unreachable as ECONNREFUSED
+            sock.connect((self.scanner.target, port))
+            sock.send(b"")
+        except OSError as e:
+            sock.close()
+            outcome = OUTCOME_CLOSED if isinstance(e, ConnectionRefusedError) else OUTCOME_ERROR
+            self._complete(port, None, outcome, e.errno or 0, now)
+            self.free.append(slot)
+            return
+        self.socks[slot] = sock
+        self.ports[slot] = port
+        self.started[slot] = now
+        self.state[slot] = UDP_WAIT
+        self.selector.register(sock, selectors.EVENT_READ, slot)
+        self._arm(slot, now + self.scanner.timeout)
+
+    def _handle(self, slot, mask):
+        """Advance the state machine for a ready socket"""
+        state = self.state[slot]
+        if state == CONNECTING:
+            self._on_connected(slot)
+        elif state == READING:
+            self._on_banner_data(slot)
+        elif state == UDP_WAIT:
+            self._on_datagram(slot)
+
+    def _on_connected(self, slot):
+        """Handshake finished: classify it and start the banner read"""
+        sock = self.socks[slot]
+        port = self.ports[slot]
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._finish(slot, None, OUTCOME_CLOSED, err)
+            return
+        if not self.grab_banners:
+            self._finish(slot, self._open_result(port, b""), OUTCOME_OPEN, 0)
+            return
+
+        payload = self.scanner._payload_for(port)
+        if payload:
+            try:
+                sock.send(payload)
+            except OSError:
+                pass
+        self.state[slot] = READING
+        self.selector.modify(sock, selectors.EVENT_READ, slot)
+        self._arm(slot, time.monotonic() + self.banner_timeout)
+
+    def _on_banner_data(self, slot):
+        """Read banner bytes straight into the slot's region of the shared buffer"""
+        sock = self.socks[slot]
+        start = slot * self.banner_size
+        received = self.received[slot]
+        try:
+            count = sock.recv_into(self.view[start + received:start + self.banner_size])
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            count = 0
+        received += count
+        self.received[slot] = received
+
+        service = self.scanner._identify_service(self.ports[slot])
+        complete = (not count or received >= self.banner_size or
+                    banner_complete(self.buffer, start + received - count, start + received,
+                                    BANNER_TERMINATORS.get(service), service in REPLY_CODE_SERVICES,
+                                    origin=start))
+        if complete:
+            self._finish_banner(slot)
+
+    def _finish_banner(self, slot):
+        """Emit an open result with whatever banner bytes arrived"""
+        start = slot * self.banner_size
+        banner = bytes(self.view[start:start + self.received[slot]])
+        self._finish(slot, self._open_result(self.ports[slot], banner), OUTCOME_OPEN, 0)
+
+    def _on_datagram(self, slot):
+        """A UDP reply (or an ICMP error) arrived"""
+        sock = self.socks[slot]
+        port = self.ports[slot]
+        try:
+            data = sock.recv(self.banner_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionRefusedError as e:
+            self._finish(slot, None, OUTCOME_CLOSED, e.errno)
+            return
+        except OSError as e:
+            self._finish(slot, None, OUTCOME_ERROR, e.errno or 0)
+            return
+        result = {
+            'port': port,
+            'state': 'open',
+            'service': self.scanner._identify_service(port),
+            'banner': data,
+            'scan_type': 'udp'
+        }
+        self._finish(slot, result, OUTCOME_OPEN, 0)
+
+    def _expire(self, slot):
+        """Deadline hit: the outcome depends on which phase the probe was in"""
+        state = self.state[slot]
+        port = self.ports[slot]
+        if state == CONNECTING:
+            self._finish(slot, None, OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
+        elif state == READING:
+            self._finish_banner(slot)
+        elif state == UDP_WAIT:
+            result = {
+                'port': port,
+                'state': 'open|filtered',
+                'service': self.scanner._identify_service(port),
+                'banner': b'',
+                'scan_type': 'udp'
+            }
+            self._finish(slot, result, OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
+
+    def _open_result(self, port, banner):
+        """Result dict for an open TCP port"""
+        return {
+            'port': port,
+            'state': 'open',
+            'service': self.scanner._identify_service(port),
+            'banner': banner,
+            'scan_type': 'connect'
+        }
+
+    def _complete(self, port, result, outcome, err, started):
+        """Queue a finished probe for the caller and record it in the trace"""
+        self.done.append((port, result, outcome, err))
+        if self.trace is not None:
+            # Slot times are monotonic; convert to wall-clock like the thread engine
+            now = time.monotonic()
+            offset = time.time() - now
+            self.trace.record(self.scanner.target, port, "event", outcome, err, started + offset, now + offset)
+
+    def _finish(self, slot, result, outcome, err):
+        """Queue the probe's outcome and return the slot to the free list"""
+        self._complete(self.ports[slot], result, outcome, err, self.started[slot])
+        self._release(slot)
+
+    def _release(self, slot):
+        """Close the slot's socket and mark the slot free"""
+        sock = self.socks[slot]
+        if sock is not None:
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            # Only pure discovery connects may be reset; banner streams close gracefully
+            if self.state[slot] == CONNECTING:
+                self.transport.close_probe(sock)
+            else:
+                sock.close()
+        self.socks[slot] = None
+        self.state[slot] = FREE
+        self.generations[slot] += 1
+        self.free.append(slot)
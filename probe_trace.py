@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Probe Tracing for Advanced Port Scanner
+Records one compact binary record per probe (host, port, engine, start/end
+time, outcome, errno) into a preallocated ring buffer that is flushed to disk
+in batches, and analyses or replays the resulting trace files.
+
+Usage:
+  python probe_trace.py analyze scan.trace
+  python probe_trace.py replay scan.trace --threads 50 --speed 0
+"""
+
+import errno
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"PSTRACE1"
+
+# host (16 bytes, IPv4-mapped for IPv4), port, engine, outcome, errno, start, end
+RECORD = struct.Struct("<16sHBBhdd")
+
+ENGINES = ("thread", "event")
+OUTCOMES = ("open", "closed", "no-response", "error")
+_ENGINE_CODES = {name: code for code, name in enumerate(ENGINES)}
+_OUTCOME_CODES = {name: code for code, name in enumerate(OUTCOMES)}
+
+_IPV4_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def pack_host(host):
+    """Pack an IPv4/IPv6 address string into 16 bytes"""
+    try:
+        return _IPV4_PREFIX + socket.inet_aton(host)
+    except OSError:
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, host)
+    except OSError:
+        return b"\x00" * 16
+
+
+def unpack_host(packed):
+    """Inverse of pack_host"""
+    if packed.startswith(_IPV4_PREFIX):
+        return socket.inet_ntoa(packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+class TraceRecorder:
+    """
+    Thread-safe probe recorder backed by a preallocated ring buffer.
+    Records are packed in place and the buffer is written out whenever it
+    fills and on close(), so the hot path never allocates or touches disk.
+    """
+
+    def __init__(self, path, capacity=8192):
+        self.path = path
+        self.capacity = capacity
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.count = 0
+        self.total = 0
+        self.lock = threading.Lock()
+        self._hosts = {}
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+
+    def record(self, host, port, engine, outcome, err, start, end):
+        """Append one probe record"""
+        packed = self._hosts.get(host)
+        if packed is None:
+            packed = self._hosts[host] = pack_host(host)
+        with self.lock:
+            RECORD.pack_into(self.buffer, self.count * RECORD.size, packed, port,
+                             _ENGINE_CODES[engine], _OUTCOME_CODES[outcome],
+                             max(-32768, min(32767, err or 0)), start, end)
+            self.count += 1
+            self.total += 1
+            if self.count == self.capacity:
+                self._flush()
+
+    def _flush(self):
+        """Write buffered records; caller holds the lock"""
+        if self.count:
+            with open(self.path, 'ab') as f:
+                f.write(memoryview(self.buffer)[:self.count * RECORD.size])
+            self.count = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+
+def read_trace(path):
+    """Yield trace records as (host, port, engine, outcome, errno, start, end)"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a probe trace")
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            if not chunk:
+                break
+            for packed, port, engine, outcome, err, start, end in RECORD.iter_unpack(chunk):
+                yield unpack_host(packed), port, ENGINES[engine], OUTCOMES[outcome], err, start, end
+
+
+def _bar(value, peak, width=40):
+    return "#" * (round(width * value / peak) if peak else 0)
+
+
+def analyze(records, bins=20, port_rows=8, out=sys.stdout):
+    """Print latency histogram, concurrency over time and a timeout heatmap"""
+    records = list(records)
+    if not records:
+        print("[!] Trace is empty", file=out)
+        return
+
+    first = min(r[5] for r in records)
+    last = max(r[6] for r in records)
+    span = max(last - first, 1e-9)
+    outcomes = {}
+    for r in records:
+        outcomes[r[3]] = outcomes.get(r[3], 0) + 1
+
+    print(f"[*] {len(records)} probes over {span:.3f}s ({len(records) / span:.0f} probes/sec)", file=out)
+    print("[*] Outcomes: " + ", ".join(f"{name}={outcomes[name]}" for name in OUTCOMES if name in outcomes), file=out)
+
+    # Latency histogram in power-of-two millisecond buckets
+    buckets = {}
+    for r in records:
+        latency_ms = (r[6] - r[5]) * 1000
+        bucket = 0
+        while (1 << bucket) <= latency_ms and bucket < 20:
+            bucket += 1
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    peak = max(buckets.values())
+    print("\nLatency histogram (ms)", file=out)
+    for bucket in range(min(buckets), max(buckets) + 1):
+        low = 0 if bucket == 0 else 1 << (bucket - 1)
+        count = buckets.get(bucket, 0)
+        print(f"  {low:>6}-{1 << bucket:<6} {count:>8}  {_bar(count, peak)}", file=out)
+
+    # Peak in-flight probes per time bin from a sweep over start/end events;
+    # each bin starts at the level carried in, so probes spanning it count
+    width = span / bins
+    events = sorted([(r[5], 1) for r in records] + [(r[6], -1) for r in records])
+    peaks = [0] * bins
+    inflight = current = 0
+    for when, delta in events:
+        index = min(bins - 1, int((when - first) / width))
+        while current < index:
+            current += 1
+            peaks[current] = inflight
+        inflight += delta
+        peaks[index] = max(peaks[index], inflight)
+    peak = max(peaks)
+    print("\nConcurrency over time (peak in-flight probes)", file=out)
+    for index, value in enumerate(peaks):
+        print(f"  +{index * width:8.3f}s {value:>6}  {_bar(value, peak)}", file=out)
+
+    # Timeouts by port range (rows) and time (columns)
+    low_port = min(r[1] for r in records)
+    high_port = max(r[1] for r in records)
+    row_span = max(1, (high_port - low_port + port_rows) // port_rows)
+    grid = [[0] * bins for _ in range(port_rows)]
+    for r in records:
+        if r[3] == "no-response":
+            row = min(port_rows - 1, (r[1] - low_port) // row_span)
+            grid[row][min(bins - 1, int((r[5] - first) / width))] += 1
+    peak = max(max(row) for row in grid)
+    shades = " .:-=+*#%@"
+    print("\nTimeout heatmap (rows: ports, columns: time)", file=out)
+    for row, cells in enumerate(grid):
+        start_port = low_port + row * row_span
+        line = "".join(shades[0 if not peak else min(9, -(-9 * cell // peak))] for cell in cells)
+        print(f"  {start_port:>5}-{start_port + row_span - 1:<5} |{line}|", file=out)
+
+
+class _ReplayStream:
+    """Open stream with nothing to say: traces keep no banner bytes"""
+
+    def settimeout(self, timeout):
+        pass
+
+    def send(self, data):
+        return len(data)
+
+    def recv_into(self, buffer, nbytes=0):
+        return 0
+
+    def recv(self, bufsize):
+        return b""
+
+    def close(self):
+        pass
+
+
+class ReplayTarget:
+    """
+    Deterministic transport reproducing the traced targets.
+    The n-th probe of a traced (host, port) reproduces the n-th recorded
+    attempt (outcome, errno and latency scaled by speed), repeating the last
+    one; untraced pairs answer closed immediately. Scanners use it like any
+    other transport, so their scheduler, retries and congestion control run
+    unchanged.
+    """
+
+    def __init__(self, records, speed=1.0):
+        self.speed = speed
+        self.scripts = {}
+        self.attempts = {}
+        self.lock = threading.Lock()
+        for host, port, engine, outcome, err, start, end in sorted(records, key=lambda r: r[5]):
+            self.scripts.setdefault((host, port), []).append((outcome, err, end - start))
+
+    def hosts(self):
+        """{host: sorted traced ports}"""
+        hosts = {}
+        for host, port in self.scripts:
+            hosts.setdefault(host, []).append(port)
+        return {host: sorted(ports) for host, ports in sorted(hosts.items())}
+
+    def _answer(self, host, port):
+        """Next recorded (outcome, errno) for host:port, after its recorded latency"""
+        with self.lock:
+            attempt = self.attempts.get((host, port), 0)
+            self.attempts[(host, port)] = attempt + 1
+        script = self.scripts.get((host, port), [("closed", errno.ECONNREFUSED, 0.0)])
+        outcome, err, latency = script[min(attempt, len(script) - 1)]
+        if self.speed and latency:
+            time.sleep(latency * self.speed)
+        return outcome, err
+
+    def connect(self, host, port, timeout):
+        """TCP connect probe with the same return convention as SocketTransport"""
+        outcome, err = self._answer(host, port)
+        if outcome == "open":
+            return 0
+        if outcome == "closed":
+            return err or errno.ECONNREFUSED
+        if outcome == "no-response":
+            return err if err in (errno.EAGAIN, errno.ETIMEDOUT) else errno.ETIMEDOUT
+        raise OSError(err, os.strerror(err))
+
+    def open_stream(self, host, port, timeout):
+        """Banner stream for a port the replay reported open"""
+        return _ReplayStream()
+
+    def udp_probe(self, host, port, payload, timeout, bufsize):
+        """UDP probe with the same conventions as SocketTransport.udp_probe"""
+        outcome, err = self._answer(host, port)
+        if outcome == "open":
+            return b""
+        if outcome == "closed":
+            raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+        if outcome == "no-response":
+            raise socket.timeout("timed out")
+        raise OSError(err, os.strerror(err))
+
+
+def replay(path, threads=100, speed=1.0, retries=0):
+    """
+    Re-run every traced host's port set through a ReplayTarget transport.
+    Hosts are scanned concurrently on one shared probe pool, as monitor mode
+    does. The event engine needs real sockets, so replays use the thread engine.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from advanced_port_scanner import AdvancedPortScanner
+
+    target = ReplayTarget(read_trace(path), speed)
+    hosts = target.hosts()
+    results = []
+    probes = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as probe_pool, \
+            ThreadPoolExecutor(max_workers=max(1, min(threads, len(hosts)))) as scans:
+        scanners = [AdvancedPortScanner(host, ports, threads=threads, retries=retries, retry_backoff=0, quiet=True,
+                                        transport=target, executor=probe_pool)
+                    for host, ports in hosts.items()]
+        for scanner, found in zip(scanners, scans.map(lambda scanner: scanner.run_scan(), scanners)):
+            for result in found:
+                result.setdefault('host', scanner.target)
+            results.extend(found)
+            probes += sum(scanner.attempts.values())
+    duration = time.perf_counter() - start
+    print(f"[*] Replayed {probes} probes to {len(hosts)} hosts in {duration:.3f}s "
+          f"({probes / max(duration, 1e-9):.0f} probes/sec), {len(results)} open")
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="probe_trace", description="Analyse or replay probe traces")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyze_parser = commands.add_parser("analyze", help="Latency, concurrency and timeout report")
+    analyze_parser.add_argument("trace", help="Trace file written with --trace")
+    analyze_parser.add_argument("--bins", type=int, default=20, help="Time bins (default: 20)")
+
+    replay_parser = commands.add_parser("replay", help="Re-run the trace against a simulated target")
+    replay_parser.add_argument("trace", help="Trace file written with --trace")
+    replay_parser.add_argument("-t", "--threads", type=int, default=100, help="Number of threads (default: 100)")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="Latency scale factor, 0 replays instantly (default: 1.0)")
+    replay_parser.add_argument("--retries", type=int, default=0, help="Retry rounds for unanswered ports")
+
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.trace):
+        print(f"[!] Error: {args.trace} not found")
+        sys.exit(1)
+    if args.command == "analyze":
+        analyze(read_trace(args.trace), bins=args.bins)
+    else:
+        replay(args.trace, threads=args.threads, speed=args.speed, retries=args.retries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Result Index for Advanced Port Scanner
+Deduplicated findings from any number of scans and hosts, indexed
+incrementally by port, service and host, with trigram and prefix lookup
+over banners, so questions like "which hosts expose 3389?" or "which
+banners mention OpenSSH_7." are set intersections instead of file scans.
+
+Usage:
+  python result_index.py add sweep.idx scan1.json scan2.csv
+  python result_index.py query sweep.idx --port 3389 --hosts
+  python result_index.py query sweep.idx --banner OpenSSH_7. --host 10.0.0.0/16
+  python result_index.py stats sweep.idx
+"""
+
+import ipaddress
+import os
+import sys
+import threading
+from bisect import bisect_left
+
+from scan_results import banner_line
+
+# Leading banner characters covered by the trigram index and so by
+# substring queries; prefix queries always see the whole banner
+BANNER_INDEX_CHARS = 512
+
+INDEX_VERSION = 1
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ResultIndex:
+    """
+    In-memory index of findings keyed by (host, port, scan_type).
+
+    Adding a finding for a key that is already indexed replaces it, so
+    rescans and retries never produce duplicates. Postings are sets of
+    finding ids; queries intersect the smallest sets first and only verify
+    banner substrings against the surviving candidates.
+    """
+
+    def __init__(self):
+        self.findings = []
+        self.keys = {}
+        self.by_port = {}
+        self.by_service = {}
+        self.by_host = {}
+        self.by_trigram = {}
+        self._prefixes = []
+        self._prefixes_sorted = True
+        self._addresses = []
+        self._addresses_sorted = True
+        self.dead = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, result, host=None):
+        """Index a scan result (raw or exported row); returns the finding"""
+        banner = banner_line(result.get('banner') or b'')
+        finding = {
+            'host': result.get('host') or host,
+            'port': int(result['port']),
+            'scan_type': result.get('scan_type') or 'connect',
+            'state': result.get('state') or 'open',
+            'service': result.get('service') or 'Unknown',
+            'banner': '' if banner == "No banner" else banner
+        }
+        key = (finding['host'], finding['port'], finding['scan_type'])
+        with self.lock:
+            previous = self.keys.get(key)
+            if previous is not None:
+                if self.findings[previous] == finding:
+                    return self.findings[previous]
+                self._unlink(previous)
+            # Link first so keys never points at a replaced slot while compacting
+            self._link(key, finding)
+            if self.dead > 1024 and self.dead > len(self.keys):
+                self._compact()
+        return finding
+
+    def _link(self, key, finding):
+        """Store a finding and add it to every posting set; caller holds the lock"""
+        finding_id = len(self.findings)
+        self.findings.append(finding)
+        self.keys[key] = finding_id
+        self.by_port.setdefault(finding['port'], set()).add(finding_id)
+        self.by_service.setdefault(finding['service'].lower(), set()).add(finding_id)
+        if finding['host'] not in self.by_host:
+            self.by_host[finding['host']] = set()
+            self._addresses_sorted = False
+        self.by_host[finding['host']].add(finding_id)
+        text = finding['banner'].lower()
+        if text:
+            for gram in _trigrams(text[:BANNER_INDEX_CHARS]):
+                self.by_trigram.setdefault(gram, set()).add(finding_id)
+        self._prefixes.append((text, finding_id))
+        self._prefixes_sorted = False
+
+    def _compact(self):
+        """Renumber live findings, dropping replaced ones; caller holds the lock"""
+        live = [(key, self.findings[finding_id]) for key, finding_id in self.keys.items()
+                if self.findings[finding_id] is not None]
+        lock = self.lock
+        self.__init__()
+        self.lock = lock
+        for key, finding in live:
+            self._link(key, finding)
+
+    def remove(self, host, port, scan_type='connect'):
+        """Drop the finding for (host, port, scan_type) if indexed"""
+        with self.lock:
+            finding_id = self.keys.pop((host, port, scan_type), None)
+            if finding_id is not None:
+                self._unlink(finding_id)
+
+    def _unlink(self, finding_id):
+        """Remove a finding from every posting set; caller holds the lock"""
+        finding = self.findings[finding_id]
+        self.findings[finding_id] = None
+        self.dead += 1
+        for postings, value in ((self.by_port, finding['port']), (self.by_service, finding['service'].lower()),
+                                (self.by_host, finding['host'])):
+            postings[value].discard(finding_id)
+            if not postings[value]:
+                del postings[value]
+        text = finding['banner'].lower()
+        for gram in _trigrams(text[:BANNER_INDEX_CHARS]):
+            self.by_trigram[gram].discard(finding_id)
+            if not self.by_trigram[gram]:
+                del self.by_trigram[gram]
+        # Prefix entries are filtered lazily against self.findings
+
+    def _host_ids(self, host):
+        """Postings for a host, an IP or a CIDR range"""
+        if '/' not in host:
+            return self.by_host.get(host, set())
+        if not self._addresses_sorted:
+            # (version, integer address) keys make a CIDR range one bisect slice
+            self._addresses = []
+            for candidate in self.by_host:
+                try:
+                    address = ipaddress.ip_address(candidate)
+                except (TypeError, ValueError):
+                    continue
+                self._addresses.append((address.version, int(address), candidate))
+            self._addresses.sort()
+            self._addresses_sorted = True
+        network = ipaddress.ip_network(host, strict=False)
+        low = bisect_left(self._addresses, (network.version, int(network.network_address)))
+        high = bisect_left(self._addresses, (network.version, int(network.broadcast_address) + 1))
+        ids = set()
+        for version, address, candidate in self._addresses[low:high]:
+            ids |= self.by_host.get(candidate, set())
+        return ids
+
+    def _prefix_ids(self, prefix):
+        """Ids of findings whose banner starts with prefix (case-insensitive)"""
+        if not self._prefixes_sorted:
+            self._prefixes = sorted(entry for entry in self._prefixes if self.findings[entry[1]] is not None)
+            self._prefixes_sorted = True
+        ids = set()
+        index = bisect_left(self._prefixes, (prefix,))
+        while index < len(self._prefixes) and self._prefixes[index][0].startswith(prefix):
+            finding_id = self._prefixes[index][1]
+            finding = self.findings[finding_id]
+            if finding is not None and finding['banner'].lower() == self._prefixes[index][0]:
+                ids.add(finding_id)
+            index += 1
+        return ids
+
+    def query(self, port=None, service=None, host=None, banner=None, banner_prefix=None, limit=None):
+        """Findings matching every given criterion, sorted by (host, port)"""
+        with self.lock:
+            candidates = []
+            if port is not None:
+                candidates.append(self.by_port.get(int(port), set()))
+            if service is not None:
+                candidates.append(self.by_service.get(service.lower(), set()))
+            if host is not None:
+                candidates.append(self._host_ids(host))
+            if banner_prefix:
+                candidates.append(self._prefix_ids(banner_prefix.lower()))
+            needle = banner.lower() if banner else None
+            if needle and len(needle) >= 3:
+                # Every trigram of the needle must occur in a matching banner
+                candidates.extend(self.by_trigram.get(gram, set()) for gram in _trigrams(needle))
+
+            if candidates:
+                candidates.sort(key=len)
+                ids = set(candidates[0])
+                for postings in candidates[1:]:
+                    if not ids:
+                        break
+                    ids &= postings
+            else:
+                ids = (finding_id for finding_id in self.keys.values())
+
+            matches = []
+            for finding_id in ids:
+                finding = self.findings[finding_id]
+                if needle and needle not in finding['banner'].lower():
+                    continue
+                matches.append(finding)
+        matches.sort(key=lambda f: (f['host'] or '', f['port'], f['scan_type']))
+        return matches[:limit] if limit else matches
+
+    def hosts(self, **criteria):
+        """Distinct hosts with findings matching criteria"""
+        return sorted({finding['host'] for finding in self.query(**criteria)})
+
+    def counts(self, field):
+        """Number of findings per port, service or host, largest first"""
+        postings = {'port': self.by_port, 'service': self.by_service, 'host': self.by_host}[field]
+        with self.lock:
+            return sorted(((value, len(ids)) for value, ids in postings.items()), key=lambda item: -item[1])
+
+    def save(self, path):
+        """Atomically write the findings; postings are rebuilt on load"""
+        import json
+
+        with self.lock:
+            findings = [finding for finding in self.findings if finding is not None]
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'findings': findings}, f)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        """Index saved with save(), or an empty index if path does not exist"""
+        import json
+
+        index = cls()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                raise ValueError(f"{path} is not a version {INDEX_VERSION} result index")
+            for finding in data['findings']:
+                index.add(finding)
+        return index
+
+
+def read_export(path, host=None):
+    """Yield rows from a JSON or CSV file written by export_results"""
+    if path.endswith('.csv'):
+        import csv
+        with open(path, 'r', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        import json
+        with open(path, 'r') as f:
+            rows = json.load(f)
+    for row in rows:
+        if host and not row.get('host'):
+            row['host'] = host
+        yield row
+
+
+def _print_findings(findings, as_json, out=sys.stdout):
+    if as_json:
+        import json
+        for finding in findings:
+            print(json.dumps(finding), file=out)
+        return
+    for finding in findings:
+        print(f"{finding['host'] or '-':>15} {finding['port']:5d}/{finding['scan_type']:8} "
+              f"{finding['state']:12}  {finding['service']:15}  {finding['banner'][:60]}", file=out)
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(prog="result_index", description="Build and query result indexes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", help="Add exported JSON/CSV results to an index")
+    add_parser.add_argument("index", help="Index file (created if missing)")
+    add_parser.add_argument("files", nargs="+", help="Files written with --export json/csv")
+    add_parser.add_argument("--host", help="Host for rows that do not record one")
+
+    query_parser = commands.add_parser("query", help="Find indexed results")
+    query_parser.add_argument("index", help="Index file")
+    query_parser.add_argument("-p", "--port", type=int, help="Port number")
+    query_parser.add_argument("--service", help="Service name (case-insensitive)")
+    query_parser.add_argument("--host", help="Host, IP or CIDR range")
+    query_parser.add_argument("--banner", help="Banner substring (case-insensitive)")
+    query_parser.add_argument("--banner-prefix", help="Banner prefix (case-insensitive)")
+    query_parser.add_argument("--limit", type=int, help="Maximum results to print")
+    query_parser.add_argument("--hosts", action="store_true", help="Print matching hosts only")
+    query_parser.add_argument("--json", action="store_true", help="Print one JSON object per line")
+
+    stats_parser = commands.add_parser("stats", help="Findings per port, service and host")
+    stats_parser.add_argument("index", help="Index file")
+    stats_parser.add_argument("--top", type=int, default=10, help="Rows per table (default: 10)")
+
+    args = parser.parse_args(argv)
+    if args.command != "add" and not os.path.exists(args.index):
+        print(f"[!] Error: {args.index} not found")
+        sys.exit(1)
+    index = ResultIndex.load(args.index)
+
+    if args.command == "add":
+        before = len(index)
+        for path in args.files:
+            for row in read_export(path, args.host):
+                index.add(row)
+        index.save(args.index)
+        print(f"[*] Indexed {len(index)} findings ({len(index) - before} new) in {args.index}")
+    elif args.command == "query":
+        criteria = {'port': args.port, 'service': args.service, 'host': args.host,
+                    'banner': args.banner, 'banner_prefix': args.banner_prefix}
+        start = time.perf_counter()
+        if args.hosts:
+            hosts = index.hosts(**criteria)
+            for host in hosts[:args.limit] if args.limit else hosts:
+                print(host)
+            found = len(hosts)
+        else:
+            findings = index.query(limit=args.limit, **criteria)
+            _print_findings(findings, args.json)
+            found = len(findings)
+        if not args.json:
+            print(f"[*] {found} matches in {(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+    else:
+        print(f"[*] {len(index)} findings")
+        for field in ("port", "service", "host"):
+            print(f"\nTop {field}s")
+            for value, count in index.counts(field)[:args.top]:
+                print(f"  {str(value):>20} {count:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Console Output for Advanced Port Scanner
+A renderer thread that owns the terminal. Scanners hand it results and
+messages through a queue that never blocks; it formats them in batches,
+writes each batch with a single call and redraws a throttled progress
+line (ports/sec, ETA, in-flight and open counts) on stderr.
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+
+from scan_results import banner_line, banner_text
+
+OUTPUT_MODES = ("text", "quiet", "jsonl")
+
+_STOP = object()
+
+
+def format_result(result):
+    """One console line for an open port"""
+    proto = "udp" if result.get('scan_type') == "udp" else "tcp"
+    return (f"[+] {result['port']:5d}/{proto}  {result['state']:12}  {result['service']:15}  "
+            f"{banner_line(result['banner'])[:30]}")
+
+
+def result_json(result, host):
+    """One JSON line for an open port, with the banner decoded"""
+    row = dict(result)
+    row.setdefault('host', host)
+    row['banner'] = banner_text(result['banner'])
+    return json.dumps(row)
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class ConsoleRenderer:
+    """
+    Background console writer.
+
+    In "text" mode results print as human-readable lines on stream; in
+    "jsonl" mode each result is a JSON object on stream and messages go to
+    progress_stream so stdout stays machine-readable; "quiet" drops
+    everything. The progress line is drawn every interval seconds when
+    progress_stream is a terminal (or progress=True).
+    """
+
+    def __init__(self, mode="text", stream=None, progress_stream=None, interval=0.25, progress=None):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode '{mode}'")
+        self.mode = mode
+        self.stream = stream or sys.stdout
+        self.progress_stream = progress_stream or sys.stderr
+        self.interval = interval
+        if progress is None:
+            progress = mode != "quiet" and getattr(self.progress_stream, 'isatty', lambda: False)()
+        self.progress = progress
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.total = 0
+        self.done = 0
+        self.started_at = 0.0
+        self.open_count = lambda: 0
+        self.inflight = lambda: 0
+        self._progress_width = 0
+
+    def start(self, total=0, open_count=None, inflight=None):
+        """Start the renderer thread for a scan of total probes"""
+        self.total = total
+        self.done = 0
+        self.started_at = time.monotonic()
+        if open_count is not None:
+            self.open_count = open_count
+        if inflight is not None:
+            self.inflight = inflight
+        self.thread = threading.Thread(target=self._run, name="scan-console", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Flush everything queued so far and stop the thread"""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+    def message(self, text):
+        """Queue a status message"""
+        if self.mode != "quiet":
+            self.queue.put((False, text, None))
+
+    def result(self, result, host):
+        """Queue an open-port result"""
+        if self.mode != "quiet":
+            self.queue.put((True, result, host))
+
+    def advance(self, count=1):
+        """Count finished probes (called from the scan loop)"""
+        self.done += count
+
+    def add_total(self, count):
+        """Count probes added after start, such as retries"""
+        self.total += count
+
+    def _format(self, item):
+        is_result, payload, host = item
+        if not is_result:
+            return payload
+        return result_json(payload, host) if self.mode == "jsonl" else format_result(payload)
+
+    def _run(self):
+        last_draw = 0.0
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                item = None
+            lines, messages = [], []
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                # JSON-lines mode keeps stdout for results only
+                (messages if self.mode == "jsonl" and not item[0] else lines).append(self._format(item))
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if lines or messages or stopping:
+                self._clear_progress()
+            if messages:
+                self.progress_stream.write("\n".join(messages) + "\n")
+                self.progress_stream.flush()
+            if lines:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+
+            now = time.monotonic()
+            if self.progress and not stopping and now - last_draw >= self.interval:
+                self._draw_progress(now)
+                last_draw = now
+
+    def _progress_text(self, now):
+        elapsed = max(now - self.started_at, 1e-9)
+        rate = self.done / elapsed
+        remaining = max(0, self.total - self.done)
+        eta = remaining / rate if rate else None
+        return (f"[*] {self.done}/{self.total} probes  {rate:,.0f} ports/sec  ETA {_format_eta(eta)}  "
+                f"in-flight {self.inflight()}  open {self.open_count()}")
+
+    def _draw_progress(self, now):
+        text = self._progress_text(now)
+        padding = " " * max(0, self._progress_width - len(text))
+        self.progress_stream.write(f"\r{text}{padding}")
+        self.progress_stream.flush()
+        self._progress_width = len(text)
+
+    def _clear_progress(self):
+        if self._progress_width:
+            self.progress_stream.write("\r" + " " * self._progress_width + "\r")
+            self.progress_stream.flush()
+            self._progress_width = 0
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Report Diff and Merge for Advanced Port Scanner
+Compares and merges exported results (JSON, CSV or JSON lines) as streams
+ordered by (host, port, proto), so two scans of any size are a single
+linear merge in bounded memory. Files that are not already in that order
+(see --sort-export) are first put through an external sort: sorted runs of
+--chunk-rows rows in temporary files, merged back with a k-way heap merge.
+
+Usage:
+  python scan_diff.py diff old.json new.json
+  python scan_diff.py diff old.csv new.csv --format jsonl -o changes.jsonl
+  python scan_diff.py merge week1.json week2.json week3.csv -o all.json
+  python scan_diff.py sort huge.json -o huge-sorted.json
+"""
+
+import csv
+import heapq
+import ipaddress
+import json
+import os
+import sys
+import tempfile
+from functools import lru_cache
+
+from scan_results import banner_line
+
+# Rows held in memory per sorted run during an external sort
+CHUNK_ROWS = 100000
+
+# Most runs merged at once; more are first merged into longer runs
+MAX_MERGE_FANIN = 64
+
+# Fields compared when a finding appears in both reports
+COMPARE_FIELDS = ('state', 'service', 'banner')
+
+_READ_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=4096)
+def _host_key(host):
+    """Addresses in numeric order (IPv4 before IPv6), then hostnames"""
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return 1, 0, 0, host
+    return 0, address.version, int(address), ""
+
+
+def proto(row):
+    return "udp" if row.get('scan_type') == "udp" else "tcp"
+
+
+def sort_key(row):
+    """The (host, port, proto) order that reports are merged in"""
+    return _host_key(row.get('host') or "") + (int(row['port']), proto(row))
+
+
+def _normalize(row):
+    row['port'] = int(row['port'])
+    row['host'] = row.get('host') or ""
+    row['scan_type'] = row.get('scan_type') or "connect"
+    return row
+
+
+def _iter_json_array(f):
+    """Objects of a JSON array, decoded one at a time"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, started = "", 0, False, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            more = f.read(_READ_SIZE)
+            buffer, pos, eof = more, 0, not more
+            continue
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            row, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The object continues past the buffer
+            more = f.read(_READ_SIZE)
+            buffer, pos, eof = buffer[pos:] + more, 0, not more
+            continue
+        yield row
+
+
+def _format(path):
+    """'csv', 'jsonl' or 'json' from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return "json"
+
+
+def iter_rows(path):
+    """Stream result rows from a JSON array, JSON-lines or CSV file"""
+    if _format(path) == "csv":
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                yield _normalize(row)
+        return
+    with open(path, 'r') as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == "[":
+            f.seek(0)
+            for row in _iter_json_array(f):
+                yield _normalize(row)
+            return
+        if not first:
+            return
+        line = first + f.readline()
+        if line.strip():
+            yield _normalize(json.loads(line))
+        for line in f:
+            if line.strip():
+                yield _normalize(json.loads(line))
+
+
+def is_sorted(rows):
+    """True if rows are in sort_key order (duplicates allowed)"""
+    previous = None
+    for row in rows:
+        key = sort_key(row)
+        if previous is not None and key < previous:
+            return False
+        previous = key
+    return True
+
+
+def _write_run(rows, directory):
+    handle, path = tempfile.mkstemp(suffix=".jsonl", prefix="scan-sort-", dir=directory)
+    with os.fdopen(handle, 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    return path
+
+
+def external_sort(rows, chunk_rows=CHUNK_ROWS, tmpdir=None):
+    """
+    Yield rows in sort_key order holding at most chunk_rows in memory.
+    The sort is stable, so duplicates keep their input order.
+    """
+    runs = []
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                chunk.sort(key=sort_key)
+                runs.append(_write_run(chunk, tmpdir))
+                chunk = []
+        chunk.sort(key=sort_key)
+        if not runs:
+            yield from chunk
+            return
+        if chunk:
+            runs.append(_write_run(chunk, tmpdir))
+        del chunk
+
+        while len(runs) > MAX_MERGE_FANIN:
+            group = runs[:MAX_MERGE_FANIN]
+            merged = _write_run(heapq.merge(*(iter_rows(run) for run in group), key=sort_key), tmpdir)
+            for run in group:
+                os.remove(run)
+            # The merged run replaces the oldest runs in place, so earlier input stays ahead for equal keys
+            runs[:MAX_MERGE_FANIN] = [merged]
+        yield from heapq.merge(*(iter_rows(run) for run in runs), key=sort_key)
+    finally:
+        for run in runs:
+            try:
+                os.remove(run)
+            except OSError:
+                pass
+
+
+def sorted_rows(path, assume_sorted=False, chunk_rows=CHUNK_ROWS, tmpdir=None):
+    """Rows of path in sort_key order, external-sorting only when needed"""
+    if assume_sorted or is_sorted(iter_rows(path)):
+        return iter_rows(path)
+    return external_sort(iter_rows(path), chunk_rows, tmpdir)
+
+
+def _unique(rows, name="input"):
+    """(key, row) pairs with one row per key (the last one); rows must be sorted"""
+    previous_key = previous = None
+    for row in rows:
+        key = sort_key(row)
+        if previous is not None:
+            if key < previous_key:
+                raise ValueError(f"{name} is not sorted by host, port and protocol")
+            if key != previous_key:
+                yield previous_key, previous
+        previous_key, previous = key, row
+    if previous is not None:
+        yield previous_key, previous
+
+
+def changed_fields(old, new):
+    """Compared fields whose values differ between two rows for the same finding"""
+    fields = [field for field in COMPARE_FIELDS if (old.get(field) or "") != (new.get(field) or "")]
+    if 'details' in old and 'details' in new and old['details'] != new['details']:
+        fields.append('details')
+    return fields
+
+
+def diff_rows(old, new):
+    """
+    Linear merge of two sorted row streams.
+    Yields (change, old row, new row) with change 'added', 'removed' or 'changed'.
+    """
+    old, new = _unique(old, "old report"), _unique(new, "new report")
+    a, b = next(old, None), next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield 'removed', a[1], None
+            a = next(old, None)
+        elif a is None or b[0] < a[0]:
+            yield 'added', None, b[1]
+            b = next(new, None)
+        else:
+            if changed_fields(a[1], b[1]):
+                yield 'changed', a[1], b[1]
+            a, b = next(old, None), next(new, None)
+
+
+def merge_rows(*streams):
+    """One sorted stream from sorted streams; for duplicate findings the last stream wins"""
+    for key, row in _unique(heapq.merge(*streams, key=sort_key), "merged input"):
+        yield row
+
+
+class RowWriter:
+    """Streaming writer for JSON array, JSON-lines or CSV output"""
+
+    def __init__(self, path=None):
+        self.format = _format(path) if path else "jsonl"
+        self.file = open(path, 'w', newline='' if self.format == "csv" else None) if path else sys.stdout
+        self.count = 0
+        if self.format == "csv":
+            from scan_export import CSV_FIELDS
+            self.csv = csv.DictWriter(self.file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            self.csv.writeheader()
+        elif self.format == "json":
+            self.file.write("[")
+
+    def write(self, row):
+        if self.format == "csv":
+            self.csv.writerow(row)
+        elif self.format == "json":
+            self.file.write(("," if self.count else "") + "\n  " + json.dumps(row))
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.count += 1
+
+    def close(self):
+        if self.format == "json":
+            self.file.write("\n]\n" if self.count else "]\n")
+        if self.file is sys.stdout:
+            self.file.flush()
+        else:
+            self.file.close()
+
+
+def _change_line(change, old, new):
+    row = new or old
+    where = f"{row['host'] or '-':>15} {row['port']:5d}/{proto(row)}"
+    if change == 'changed':
+        fields = "; ".join(f"{field}: {old.get(field)!r} -> {new.get(field)!r}"
+                           for field in changed_fields(old, new))
+        return f"~ {where}  {fields}"
+    banner = banner_line(row.get('banner') or "")
+    return f"{'+' if change == 'added' else '-'} {where}  {row['state']:12}  {row['service']:15}  {banner[:60]}"
+
+
+def _change_json(change, old, new):
+    row = new or old
+    record = {'change': change, 'host': row['host'], 'port': row['port'], 'proto': proto(row)}
+    if change == 'changed':
+        record['fields'] = changed_fields(old, new)
+    if old is not None:
+        record['old'] = old
+    if new is not None:
+        record['new'] = new
+    return json.dumps(record)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="scan_diff", description="Compare, merge and sort exported results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = commands.add_parser("diff", help="Added, removed and changed findings between two reports")
+    diff_parser.add_argument("old", help="Earlier JSON/CSV/JSON-lines report")
+    diff_parser.add_argument("new", help="Later JSON/CSV/JSON-lines report")
+    diff_parser.add_argument("--format", choices=["text", "jsonl"], default="text",
+                             help="Output format (default: text)")
+    diff_parser.add_argument("-o", "--output", help="Write changes to this file (default: stdout)")
+
+    merge_parser = commands.add_parser("merge", help="Merge reports into one sorted report, later files winning")
+    merge_parser.add_argument("files", nargs="+", help="JSON/CSV/JSON-lines reports")
+    merge_parser.add_argument("-o", "--output", help="Output .json, .csv or .jsonl file (default: JSON lines on stdout)")
+
+    sort_parser = commands.add_parser("sort", help="Sort a report by host, port and protocol")
+    sort_parser.add_argument("file", help="JSON/CSV/JSON-lines report")
+    sort_parser.add_argument("-o", "--output", help="Output .json, .csv or .jsonl file (default: JSON lines on stdout)")
+
+    for command in (diff_parser, merge_parser, sort_parser):
+        command.add_argument("--assume-sorted", action="store_true",
+                             help="Skip the sortedness check (inputs written with --sort-export)")
+        command.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                             help=f"Rows per in-memory run when sorting (default: {CHUNK_ROWS})")
+        command.add_argument("--tmpdir", help="Directory for external sort runs (default: system temp)")
+
+    args = parser.parse_args(argv)
+    if args.command == "diff":
+        paths = [args.old, args.new]
+    else:
+        paths = args.files if args.command == "merge" else [args.file]
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"[!] Error: {path} not found")
+            sys.exit(1)
+    streams = [sorted_rows(path, args.assume_sorted, args.chunk_rows, args.tmpdir) for path in paths]
+
+    try:
+        if args.command == "diff":
+            out = open(args.output, 'w') if args.output else sys.stdout
+            counts = {'added': 0, 'removed': 0, 'changed': 0}
+            try:
+                for change, old, new in diff_rows(*streams):
+                    counts[change] += 1
+                    line = _change_json(change, old, new) if args.format == "jsonl" else _change_line(change, old, new)
+                    out.write(line + "\n")
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            print(f"[*] {counts['added']} added, {counts['removed']} removed, {counts['changed']} changed",
+                  file=sys.stderr)
+        else:
+            writer = RowWriter(args.output)
+            try:
+                for row in merge_rows(*streams):
+                    writer.write(row)
+            finally:
+                writer.close()
+            print(f"[*] Wrote {writer.count} findings" + (f" to {args.output}" if args.output else ""),
+                  file=sys.stderr)
+    except ValueError as e:
+        print(f"[!] Error: {e}")
+        sys.exit(1)
+
+
+def diff_main(argv=None):
+    main(["diff"] + list(argv if argv is not None else sys.argv[1:]))
+
+
+def merge_main(argv=None):
+    main(["merge"] + list(argv if argv is not None else sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    main()
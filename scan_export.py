@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Result Export for Advanced Port Scanner
+Writers for the JSON, CSV and text report formats. Loaded on demand by
+AdvancedPortScanner.export_results so scans that never export skip it.
+"""
+
+import csv
+import json
+from datetime import datetime
+
+from scan_results import banner_line
+
+CSV_FIELDS = ['port', 'state', 'service', 'banner', 'scan_type', 'host']
+
+
+def write_json(rows, path):
+    """Write decoded result rows as a JSON array"""
+    with open(path, 'w') as f:
+        json.dump(list(rows), f, indent=2)
+
+
+def write_csv(rows, path):
+    """Write decoded result rows as CSV"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_text(rows, target, path):
+    """Write decoded result rows as a plain text report"""
+    with open(path, 'w') as f:
+        f.write(f"Port Scan Results for {target}\n")
+        f.write(f"Scan completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("-" * 60 + "\n")
+        for row in rows:
+            f.write(f"{row['port']:5d}/tcp  {row['state']:12}  {row['service']:15}  {banner_line(row['banner'])}\n")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Continuous Monitoring Mode for Advanced Port Scanner
+Keeps a target inventory and last-known port state, rescans it in small
+slices on a schedule and emits change events (port opened, port closed,
+banner changed) to a local JSON-lines sink or a webhook.
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from advanced_port_scanner import AdvancedPortScanner
+from scan_results import banner_line
+
+
+def expand_targets(spec):
+    """Expand a comma-separated list of hosts, IPs and CIDR ranges into IP strings"""
+    hosts = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '/' in item:
+            network = ipaddress.ip_network(item, strict=False)
+            hosts.extend(str(ip) for ip in (network.hosts() if network.num_addresses > 2 else network))
+            continue
+        try:
+            hosts.append(str(ipaddress.ip_address(item)))
+        except ValueError:
+            try:
+                hosts.append(socket.gethostbyname(item))
+            except socket.gaierror:
+                print(f"[!] Error: Cannot resolve hostname '{item}', skipping")
+    return list(dict.fromkeys(hosts))
+
+
+def _proto(scan_type):
+    return "udp" if scan_type == "udp" else "tcp"
+
+
+def _state_key(port, proto):
+    """Key of a port in host state: "22" for TCP, "53/udp" for UDP"""
+    return str(port) if proto == "tcp" else f"{port}/{proto}"
+
+
+class JsonLinesSink:
+    """Append change events to a local file, one JSON object per line ('-' for stdout)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, events):
+        lines = "".join(json.dumps(event) + "\n" for event in events)
+        if self.path == "-":
+            print(lines, end="")
+            return
+        with open(self.path, 'a') as f:
+            f.write(lines)
+
+
+class WebhookSink:
+    """POST each batch of change events as a JSON array"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, events):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(events).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except OSError as e:
+            print(f"[!] Webhook delivery failed: {e}")
+
+
+class ScanMonitor:
+    """
+    Incremental rescanner over a fixed inventory of hosts and ports.
+
+    Each tick scans at most slice_size (host, port) probes. Up to hot_fraction
+    of the slice rechecks known-open ports, hosts that changed within
+    hot_window seconds first and then the least recently checked; the rest
+    continues a round-robin sweep over the whole inventory. The first full
+    sweep is a baseline and emits no "opened" events. A known-open port must
+    be missed close_after times in a row before it is reported closed.
+
+    Every (host, port) pair is checked with each probe type (plan.probes by
+    default) by scanners built from plan, so profile payloads apply. All
+    probes of a slice share one pool of scanner_options['threads'] workers,
+    so a tick takes about as long as one scan of slice_size ports.
+    """
+
+    def __init__(self, hosts, ports, state_file=None, slice_size=256, interval=60,
+                 hot_fraction=0.5, hot_window=3600, close_after=2, sinks=None, scanner_options=None,
+                 plan=None, probes=None):
+        self.hosts = list(hosts)
+        self.ports = list(ports)
+        self.state_file = state_file
+        self.slice_size = slice_size
+        self.interval = interval
+        self.hot_fraction = hot_fraction
+        self.hot_window = hot_window
+        self.close_after = close_after
+        self.sinks = sinks or []
+        self.scanner_options = dict(scanner_options or {})
+        self.plan = plan
+        if probes is None:
+            probes = plan.probes if plan is not None else [self.scanner_options.get('scan_type') or "connect"]
+        self.probes = list(dict.fromkeys(probes))
+        self.protos = list(dict.fromkeys(_proto(probe) for probe in self.probes))
+        self.state = self._load_state()
+
+    @property
+    def inventory_size(self):
+        return len(self.hosts) * len(self.ports)
+
+    def _load_state(self):
+        """Load last-known state from disk, or start empty"""
+        state = {'cursor': 0, 'sweeps': 0, 'hosts': {}}
+        if self.state_file and os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                state.update(json.load(f))
+        if self.inventory_size:
+            state['cursor'] %= self.inventory_size
+        return state
+
+    def save_state(self):
+        """Atomically write the state file"""
+        if not self.state_file:
+            return
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _host_state(self, host):
+        return self.state['hosts'].setdefault(host, {'changed_at': 0, 'open': {}})
+
+    def _next_slice(self, now):
+        """Pick this tick's (host, port) pairs: hot rechecks first, then the sweep"""
+        hot_budget = int(self.slice_size * self.hot_fraction)
+        candidates = []
+        for host, host_state in self.state['hosts'].items():
+            recently_changed = now - host_state['changed_at'] < self.hot_window
+            for key, entry in host_state['open'].items():
+                # Missed ports and recently changed hosts sort ahead of the rest
+                rank = (not entry.get('missed'), not recently_changed, entry['checked_at'])
+                candidates.append((rank, host, int(key.split('/')[0])))
+        candidates.sort()
+        selected, chosen = [], set()
+        for rank, host, port in candidates:
+            if len(selected) >= hot_budget:
+                break
+            if (host, port) not in chosen:
+                selected.append((host, port))
+                chosen.add((host, port))
+
+        total = self.inventory_size
+        cursor = self.state['cursor']
+        steps = 0
+        while len(selected) < self.slice_size and steps < total:
+            host = self.hosts[cursor // len(self.ports)]
+            port = self.ports[cursor % len(self.ports)]
+            if (host, port) not in chosen:
+                selected.append((host, port))
+                chosen.add((host, port))
+            cursor += 1
+            steps += 1
+            if cursor >= total:
+                cursor = 0
+                self.state['sweeps'] += 1
+        self.state['cursor'] = cursor
+        return selected
+
+    def _scanner(self, host, ports, probe, **options):
+        """Scanner for one host and probe type, built from the plan when there is one"""
+        options = dict(self.scanner_options, scan_type=probe, **options)
+        if self.plan is None:
+            return AdvancedPortScanner(host, ports, quiet=True, **options)
+        scanner = AdvancedPortScanner.from_plan(host, self.plan, quiet=True, **options)
+        scanner.ports = sorted(ports)
+        return scanner
+
+    def _scan_pairs(self, pairs):
+        """
+        Scan (host, port) pairs with every probe type; return {(host, port, proto): result}.
+        One scanner runs per host and probe type, all submitting to a single
+        shared probe pool, so hosts are scanned in parallel rather than in turn.
+        """
+        by_host = {}
+        for host, port in pairs:
+            by_host.setdefault(host, []).append(port)
+        jobs = [(host, ports, probe) for host, ports in by_host.items() for probe in self.probes]
+        if not jobs:
+            return {}
+
+        threads = self.scanner_options.get('threads') or 100
+        workers = min(threads, len(jobs))
+        rate = self.scanner_options.get('rate')
+        found = {}
+        with ThreadPoolExecutor(max_workers=threads) as probe_pool, ThreadPoolExecutor(max_workers=workers) as scans:
+            # Concurrent scanners split the rate so the slice as a whole keeps to it
+            scanners = [self._scanner(host, ports, probe, executor=probe_pool, rate=rate / workers if rate else None)
+                        for host, ports, probe in jobs]
+            for scanner, results in zip(scanners, scans.map(lambda scanner: scanner.run_scan(), scanners)):
+                for result in results:
+                    found.setdefault((scanner.target, result['port'], _proto(scanner.scan_type)), result)
+        return found
+
+    def _event(self, kind, host, port, proto, **fields):
+        event = {'event': kind, 'host': host, 'port': port, 'proto': proto,
+                 'time': datetime.now().isoformat(timespec='seconds')}
+        event.update(fields)
+        return event
+
+    def tick(self):
+        """Scan one slice, update state and emit change events; returns the events"""
+        now = time.time()
+        baseline = self.state['sweeps'] == 0
+        pairs = self._next_slice(now)
+        found = self._scan_pairs(pairs)
+        events = []
+
+        for host, port in pairs:
+            host_state = self._host_state(host)
+            for proto in self.protos:
+                key = _state_key(port, proto)
+                known = host_state['open'].get(key)
+                result = found.get((host, port, proto))
+
+                if result is not None:
+                    banner = banner_line(result['banner'])
+                    if known is None:
+                        if not baseline:
+                            events.append(self._event('port_opened', host, port, proto, service=result['service'],
+                                                      state=result['state'], banner=banner))
+                            host_state['changed_at'] = now
+                    elif known['banner'] != banner:
+                        events.append(self._event('banner_changed', host, port, proto, service=result['service'],
+                                                  banner=banner, previous_banner=known['banner']))
+                        host_state['changed_at'] = now
+                    host_state['open'][key] = {
+                        'state': result['state'],
+                        'service': result['service'],
+                        'banner': banner,
+                        'scan_type': result.get('scan_type') or self.probes[0],
+                        'checked_at': now,
+                        'missed': 0
+                    }
+                elif known is not None:
+                    known['missed'] = known.get('missed', 0) + 1
+                    known['checked_at'] = now
+                    if known['missed'] >= self.close_after:
+                        del host_state['open'][key]
+                        index = self.scanner_options.get('index')
+                        if index is not None:
+                            index.remove(host, port, known.get('scan_type') or self.probes[0])
+                        events.append(self._event('port_closed', host, port, proto, service=known['service'],
+                                                  banner=known['banner']))
+                        host_state['changed_at'] = now
+
+        if events:
+            for sink in self.sinks:
+                sink.emit(events)
+        self.save_state()
+
+        progress = 100.0 * self.state['cursor'] / self.inventory_size if self.inventory_size else 100.0
+        print(f"[*] Monitor: {len(pairs)} probes, {len(found)} open, {len(events)} events, "
+              f"sweep {self.state['sweeps'] + 1} at {progress:.1f}%")
+        return events
+
+    def run(self, cycles=None):
+        """Tick every interval seconds, forever or for a number of cycles"""
+        print(f"[*] Monitoring {len(self.hosts)} hosts x {len(self.ports)} ports, "
+              f"{self.slice_size} probes every {self.interval}s")
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            started = time.monotonic()
+            self.tick()
+            cycle += 1
+            if cycles is not None and cycle >= cycles:
+                break
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Scan Profiles and Timing Templates for Advanced Port Scanner
+Named timing templates bundle concurrency, rate, timeout and retry settings.
+User-defined JSON/YAML profiles compile once into a reusable ScanPlan.
+"""
+
+import os
+
+# Timing templates, slowest to fastest.
+# threads: worker concurrency, rate: probes per second (None = unlimited),
+# timeout: per-probe timeout in seconds, retries: re-probes for unanswered ports
+TIMING_TEMPLATES = {
+    "paranoid":   {"threads": 1,    "rate": 0.2,  "timeout": 10.0, "retries": 3},
+    "sneaky":     {"threads": 5,    "rate": 2.0,  "timeout": 8.0,  "retries": 3},
+    "polite":     {"threads": 20,   "rate": 10.0, "timeout": 5.0,  "retries": 2},
+    "normal":     {"threads": 100,  "rate": None, "timeout": 3.0,  "retries": 1},
+    "aggressive": {"threads": 300,  "rate": None, "timeout": 1.5,  "retries": 1},
+    "insane":     {"threads": 1000, "rate": None, "timeout": 0.5,  "retries": 0},
+}
+
+SETTING_KEYS = ("threads", "rate", "timeout", "retries")
+SCAN_TYPES = ("connect", "syn", "udp")
+
+# json/hashlib/yaml are imported inside the functions that need them so that
+# reading TIMING_TEMPLATES for --help stays cheap
+
+# Compiled plans keyed by (path, mtime, size, ports, payload table) so repeated loads in one process are free
+_PLAN_CACHE = {}
+
+
+class ProfileError(ValueError):
+    """Raised when a scan profile is malformed"""
+
+
+class ScanPlan:
+    """Compiled, immutable scan plan: port set, probe list and per-port payloads"""
+
+    __slots__ = ("name", "ports", "probes", "payloads", "settings", "key")
+
+    def __init__(self, name, ports, probes, payloads, settings, key):
+        self.name = name
+        self.ports = tuple(ports)
+        self.probes = tuple(probes)
+        self.payloads = dict(payloads)
+        self.settings = dict(settings)
+        self.key = key
+
+    def __repr__(self):
+        return f"ScanPlan(name={self.name!r}, ports={len(self.ports)}, probes={self.probes})"
+
+    def to_dict(self):
+        """Serialize the plan to a JSON-compatible dict"""
+        return {
+            'name': self.name,
+            'ports': list(self.ports),
+            'probes': list(self.probes),
+            'payloads': {str(port): payload.hex() for port, payload in self.payloads.items()},
+            'settings': self.settings,
+            'key': self.key
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a plan from to_dict() output"""
+        return cls(
+            name=data['name'],
+            ports=data['ports'],
+            probes=data['probes'],
+            payloads={int(port): bytes.fromhex(payload) for port, payload in data['payloads'].items()},
+            settings=data['settings'],
+            key=data['key']
+        )
+
+
+def timing_settings(name):
+    """Return a copy of the settings for a named timing template"""
+    try:
+        return dict(TIMING_TEMPLATES[name])
+    except KeyError:
+        raise ProfileError(f"Unknown timing template '{name}' "
+                           f"(choose from: {', '.join(TIMING_TEMPLATES)})")
+
+
+def parse_port_spec(spec):
+    """Parse a port spec (string like '80,1-100' or list of ints/strings) into a sorted tuple"""
+    if isinstance(spec, int):
+        spec = [spec]
+    if isinstance(spec, str):
+        spec = spec.split(',')
+    ports = set()
+    for item in spec:
+        item = str(item).strip()
+        if not item:
+            continue
+        if '-' in item:
+            start, end = map(int, item.split('-'))
+            ports.update(range(start, end + 1))
+        else:
+            ports.add(int(item))
+    for port in ports:
+        if not 0 < port < 65536:
+            raise ProfileError(f"Port out of range: {port}")
+    return tuple(sorted(ports))
+
+
+def _decode_payload(value):
+    """Profile payloads are text with escapes, or 'hex:' prefixed raw bytes"""
+    if value.startswith("hex:"):
+        return bytes.fromhex(value[4:])
+    return value.encode('latin-1').decode('unicode_escape').encode('latin-1')
+
+
+def _load_document(path, text):
+    """Parse profile text as JSON, or YAML when the file extension asks for it"""
+    if path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ProfileError("YAML profiles require PyYAML (pip install pyyaml)")
+        data = yaml.safe_load(text)
+    else:
+        import json
+        data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ProfileError(f"Profile {path} must be a mapping")
+    return data
+
+
+def compile_profile_data(data, base_payloads=None, key=None, ports=None):
+    """Compile a parsed profile mapping into a ScanPlan; ports overrides the profile's port spec"""
+    unknown = set(data) - {"name", "timing", "ports", "probes", "payloads"} - set(SETTING_KEYS)
+    if unknown:
+        raise ProfileError(f"Unknown profile keys: {', '.join(sorted(unknown))}")
+
+    settings = {}
+    if data.get("timing"):
+        settings.update(timing_settings(data["timing"]))
+    for setting in SETTING_KEYS:
+        if setting in data:
+            settings[setting] = data[setting]
+
+    ports = parse_port_spec(ports or data.get("ports", "1-1000"))
+
+    probes = data.get("probes", ["connect"])
+    if isinstance(probes, str):
+        probes = [probes]
+    for probe in probes:
+        if probe not in SCAN_TYPES:
+            raise ProfileError(f"Unknown probe '{probe}' (choose from: {', '.join(SCAN_TYPES)})")
+
+    port_set = set(ports)
+    payloads = {port: payload for port, payload in (base_payloads or {}).items() if port in port_set}
+    for port, payload in data.get("payloads", {}).items():
+        port = int(port)
+        if port in port_set:
+            payloads[port] = _decode_payload(payload)
+
+    return ScanPlan(
+        name=data.get("name", "custom"),
+        ports=ports,
+        probes=probes,
+        payloads=payloads,
+        settings=settings,
+        key=key
+    )
+
+
+def _plan_key(text, base_payloads, ports=None):
+    """Content hash of the profile text, port override and payload table it was compiled against"""
+    import hashlib
+    digest = hashlib.sha256(text.encode('utf-8'))
+    if ports:
+        digest.update(b"ports:%s;" % ports.encode('utf-8'))
+    for port in sorted(base_payloads or {}):
+        digest.update(b"%d:%s;" % (port, base_payloads[port]))
+    return digest.hexdigest()
+
+
+def load_plan(path, base_payloads=None, cache_dir=None, ports=None):
+    """
+    Load and compile a profile file into a ScanPlan.
+    ports, a port spec such as "22,80-90", replaces the profile's ports so
+    the payload table is built for the ports actually scanned.
+    Compiled plans are memoized per process and, with cache_dir, stored on
+    disk keyed by content hash so other runs and workers skip compilation.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, ports,
+                tuple(sorted((base_payloads or {}).items())))
+    if memo_key in _PLAN_CACHE:
+        return _PLAN_CACHE[memo_key]
+
+    import json
+    
+    with open(path, 'r') as f:
+        text = f.read()
+    key = _plan_key(text, base_payloads, ports)
+
+    cache_file = os.path.join(cache_dir, f"{key}.plan.json") if cache_dir else None
+    plan = None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r') as f:
+                plan = ScanPlan.from_dict(json.load(f))
+        except (ValueError, KeyError):
+            plan = None
+
+    if plan is None:
+        plan = compile_profile_data(_load_document(path, text), base_payloads, key, ports)
+        if cache_file:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(plan.to_dict(), f)
+            os.replace(tmp_file, cache_file)
+
+    _PLAN_CACHE[memo_key] = plan
+    return plan
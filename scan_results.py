@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Probe Results for Advanced Port Scanner
+Per-probe outcomes and banner handling shared by the scanner, its engines
+and the report helpers. It imports nothing from the scanner, so helpers
+load it without pulling in (or, when the scanner runs as a script,
+re-importing) advanced_port_scanner.
+"""
+
+# Per-probe outcomes, used to decide which ports deserve a retry
+OUTCOME_OPEN = "open"
+OUTCOME_CLOSED = "closed"
+OUTCOME_NO_RESPONSE = "no-response"
+OUTCOME_ERROR = "error"
+
+# Banner reads stop at the first protocol terminator, the byte cap or the deadline.
+# Services with a reply code ("220-..." continuation lines) end on a line with a
+# space after the code; services not listed here stop after the first chunk.
+BANNER_MAX_BYTES = 4096
+BANNER_TERMINATORS = {
+    "FTP": b"\r\n",
+    "SSH": b"\n",
+    "SMTP": b"\r\n",
+    "POP3": b"\r\n",
+    "IMAP": b"\r\n",
+    "Redis": b"\r\n",
+    "HTTP": b"\r\n\r\n",
+    "HTTPS": b"\r\n\r\n",
+    "HTTP-Proxy": b"\r\n\r\n",
+    "HTTPS-Alt": b"\r\n\r\n"
+}
+REPLY_CODE_SERVICES = frozenset(("FTP", "SMTP"))
+
+
+def banner_text(banner):
+    """Decode a raw banner for display or export"""
+    if isinstance(banner, bytes):
+        banner = banner.decode('utf-8', errors='ignore')
+    banner = banner.strip()
+    return banner if banner else "No banner"
+
+
+def banner_line(banner):
+    """Decoded banner folded onto one line"""
+    return " | ".join(line.strip() for line in banner_text(banner).splitlines() if line.strip())
+
+
+def banner_complete(buf, start, end, terminator, reply_codes, origin=0):
+    """Check whether buf[origin:end] holds a complete banner, searching new bytes from start"""
+    if terminator is None:
+        return end > origin
+    if buf.find(terminator, max(origin, start - len(terminator) + 1), end) < 0:
+        return False
+    if not reply_codes:
+        return True
+    if buf[end - len(terminator):end] != terminator:
+        return False
+    newline = buf.rfind(b"\n", origin, end - 1)
+    line_start = newline + 1 if newline >= 0 else origin
+    # "220 text" or a bare "220" ends the reply; "220-text" continues it
+    return end - line_start > 3 and buf[line_start + 3] in (0x20, 0x0d, 0x0a)
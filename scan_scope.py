@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Scan Scope for Advanced Port Scanner
+Exclusion lists and allow-lists for hosts (IPs, CIDR ranges, address
+ranges, hostnames) and ports. Entries are merged into sorted, disjoint
+integer intervals, so checking a (host, port) pair is a couple of bisects
+no matter how many tens of thousands of entries the lists hold. Hostname
+entries are not resolved while the lists are built; their addresses are
+looked up once, the first time an address target is checked against them.
+An excluded hostname that does not resolve fails closed with ScopeError.
+
+Scope file syntax, one entry per line ('#' starts a comment):
+  10.0.0.0/8            CIDR range
+  192.168.1.10          single address (IPv4 or IPv6)
+  172.16.0.1-172.16.0.99  address range
+  db.internal           hostname (matched by name, or by address once resolved)
+  port 3306             port
+  port 5432-5439        port range
+"""
+
+import ipaddress
+import socket
+from bisect import bisect_right
+
+
+class ScopeError(ValueError):
+    """Raised for scope entries that cannot be parsed"""
+
+
+class IntervalSet:
+    """Sorted, merged, inclusive integer intervals with O(log n) membership"""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals=()):
+        merged = []
+        for low, high in sorted(intervals):
+            if merged and low <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], high)
+            else:
+                merged.append([low, high])
+        self.starts = [low for low, high in merged]
+        self.ends = [high for low, high in merged]
+
+    def __contains__(self, value):
+        index = bisect_right(self.starts, value) - 1
+        return index >= 0 and value <= self.ends[index]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+
+def parse_port_entry(entry):
+    """'22' or '1000-2000' -> (low, high)"""
+    try:
+        if '-' in entry:
+            low, high = (int(part) for part in entry.split('-', 1))
+        else:
+            low = high = int(entry)
+    except ValueError:
+        raise ScopeError(f"Invalid port entry '{entry}'")
+    if not 0 <= low <= high <= 65535:
+        raise ScopeError(f"Port entry '{entry}' is out of range")
+    return low, high
+
+
+def parse_host_entry(entry):
+    """
+    Parse an IP, CIDR or address range into (version, low, high);
+    returns None for anything else (treated as a hostname)
+    """
+    try:
+        if '/' in entry:
+            network = ipaddress.ip_network(entry, strict=False)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        if '-' in entry:
+            first, last = (ipaddress.ip_address(part.strip()) for part in entry.split('-', 1))
+            if first.version != last.version or int(first) > int(last):
+                raise ScopeError(f"Invalid address range '{entry}'")
+            return first.version, int(first), int(last)
+        address = ipaddress.ip_address(entry)
+        return address.version, int(address), int(address)
+    except ValueError as e:
+        if isinstance(e, ScopeError):
+            raise
+        if '/' in entry:
+            raise ScopeError(f"Invalid network '{entry}'")
+        return None
+
+
+class HostPortList:
+    """A set of hosts and a set of ports built from scope entries"""
+
+    def __init__(self, hosts=(), ports=()):
+        intervals = {4: [], 6: []}
+        self.names = set()
+        for entry in hosts:
+            parsed = parse_host_entry(entry)
+            if parsed is not None:
+                intervals[parsed[0]].append(parsed[1:])
+            else:
+                self.names.add(entry.lower())
+        self.addresses = {version: IntervalSet(spans) for version, spans in intervals.items()}
+        self.ports = IntervalSet(parse_port_entry(entry) for entry in ports)
+        self._name_addresses = None
+
+    @property
+    def has_hosts(self):
+        return bool(self.names or any(self.addresses.values()))
+
+    @property
+    def has_ports(self):
+        return bool(self.ports)
+
+    def __len__(self):
+        return len(self.names) + sum(len(spans) for spans in self.addresses.values()) + len(self.ports)
+
+    def contains_host(self, host, strict=False):
+        """
+        True if host matches an entry. With strict (used for exclusions), a
+        hostname entry that cannot be resolved raises ScopeError rather than
+        letting its addresses through.
+        """
+        if host.lower() in self.names:
+            return True
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        if int(address) in self.addresses[address.version]:
+            return True
+        return bool(self.names) and str(address) in self._resolve_names(strict)
+
+    def _resolve_names(self, strict=False):
+        """Addresses of the hostname entries, looked up on the first address check that needs them"""
+        if self._name_addresses is None:
+            resolved, unresolved = set(), []
+            for name in sorted(self.names):
+                try:
+                    resolved.update(socket.gethostbyname_ex(name)[2])
+                except OSError:
+                    unresolved.append(name)
+            if unresolved and strict:
+                # Not cached, so the lookup is retried on the next check
+                raise ScopeError(f"Cannot resolve excluded host(s) {', '.join(unresolved)}; refusing to scan")
+            self._name_addresses = resolved
+        return self._name_addresses
+
+    def contains_port(self, port):
+        return port in self.ports
+
+
+def read_scope_file(path):
+    """Split a scope file into (host entries, port entries)"""
+    hosts, ports = [], []
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            keyword, _, rest = line.partition(' ')
+            if keyword.lower() in ("port", "ports"):
+                ports.extend(item.strip() for item in rest.split(',') if item.strip())
+            else:
+                hosts.extend(item.strip() for item in line.split(',') if item.strip())
+    return hosts, ports
+
+
+def _split(spec):
+    return [item.strip() for item in spec.split(',') if item.strip()] if spec else []
+
+
+class ScanScope:
+    """
+    What a scan may touch.
+
+    A (host, port) pair is permitted unless its host or its port is
+    excluded. When an allow-list names hosts, the host must be on it; when
+    it names ports, the port must be on it. Hostnames that are not IP
+    literals are resolved once and cached, so a name cannot slip past an
+    address-based exclusion.
+    """
+
+    def __init__(self, exclude=None, allow=None):
+        self.exclude = exclude or HostPortList()
+        self.allow = allow or HostPortList()
+        self._resolved = {}
+
+    @classmethod
+    def from_options(cls, exclude=None, exclude_ports=None, exclude_files=(), allow=None, allow_ports=None,
+                     allow_files=()):
+        """Build a scope from comma-separated specs and scope files"""
+        def build(hosts, ports, files):
+            hosts, ports = _split(hosts), _split(ports)
+            for path in files or ():
+                file_hosts, file_ports = read_scope_file(path)
+                hosts.extend(file_hosts)
+                ports.extend(file_ports)
+            return HostPortList(hosts, ports)
+        return cls(build(exclude, exclude_ports, exclude_files), build(allow, allow_ports, allow_files))
+
+    def __bool__(self):
+        return bool(len(self.exclude) or len(self.allow))
+
+    def _addresses(self, host):
+        """host plus its resolved address, for matching hostnames against IP entries"""
+        try:
+            ipaddress.ip_address(host)
+            return (host,)
+        except ValueError:
+            pass
+        resolved = self._resolved.get(host)
+        if resolved is None:
+            try:
+                resolved = self._resolved[host] = (host, socket.gethostbyname(host))
+            except OSError:
+                resolved = self._resolved[host] = (host,)
+        return resolved
+
+    def host_permitted(self, host):
+        """False if the host is excluded or outside a host allow-list"""
+        names = self._addresses(host)
+        if any(self.exclude.contains_host(name, strict=True) for name in names):
+            return False
+        return not self.allow.has_hosts or any(self.allow.contains_host(name) for name in names)
+
+    def port_permitted(self, port):
+        """False if the port is excluded or outside a port allow-list"""
+        if self.exclude.contains_port(port):
+            return False
+        return not self.allow.has_ports or self.allow.contains_port(port)
+
+    def permits(self, host, port):
+        return self.port_permitted(port) and self.host_permitted(host)
+
+    def filter_ports(self, host, ports):
+        """The ports of host that may be probed"""
+        if not self.host_permitted(host):
+            return []
+        return [port for port in ports if self.port_permitted(port)]
+
+    def filter_hosts(self, hosts):
+        return [host for host in hosts if self.host_permitted(host)]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Transport Layer for Advanced Port Scanner
+The thread engine's connect, banner and UDP probes go through a transport
+object. SocketTransport talks to the real network; other transports (such
+as simulated_network.SimulatedNetwork) can stand in for it.
+"""
+
+import socket
+import sys
+
+# Linux value, for Pythons whose socket module does not export it
+IP_BIND_ADDRESS_NO_PORT = getattr(socket, "IP_BIND_ADDRESS_NO_PORT",
+                                  24 if sys.platform.startswith("linux") else None)
+
+
+class SocketTransport:
+    """
+    Real-network transport built on blocking sockets.
+
+    Every outgoing connection uses a fresh ephemeral port, so one source
+    address tops out at a few tens of thousands of connects per TIME_WAIT
+    period. source_addresses spreads TCP probes round-robin across several
+    local addresses (bound with IP_BIND_ADDRESS_NO_PORT where available, so
+    the port is only picked at connect time), and rst_close aborts discovery
+    connections with RST instead of FIN so they never enter TIME_WAIT.
+    Only sockets that never carried a banner or service probe are reset;
+    streams that exchanged data close gracefully.
+    """
+
+    def __init__(self, source_addresses=(), rst_close=False):
+        self.source_addresses = ()
+        self.rst_close = rst_close
+        self._sources = None
+        self._linger_reset = None
+        if source_addresses:
+            import ipaddress
+            import itertools
+            self.source_addresses = tuple(str(ipaddress.IPv4Address(address)) for address in source_addresses)
+            self._sources = itertools.cycle(self.source_addresses)
+
+    def tcp_socket(self):
+        """New TCP socket, bound to the next source address if any are configured"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self._sources is None:
+            return sock
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if IP_BIND_ADDRESS_NO_PORT is not None:
+                try:
+                    sock.setsockopt(socket.IPPROTO_IP, IP_BIND_ADDRESS_NO_PORT, 1)
+                except OSError:
+                    pass
+            sock.bind((next(self._sources), 0))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def close_probe(self, sock):
+        """Close a discovery socket, resetting the connection when rst_close is set"""
+        if self.rst_close:
+            if self._linger_reset is None:
+                import struct
+                # l_onoff=1, l_linger=0: close() sends RST and skips TIME_WAIT
+                self._linger_reset = struct.pack("ii", 1, 0)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, self._linger_reset)
+            except OSError:
+                pass
+        sock.close()
+
+    def connect(self, host, port, timeout):
+        """TCP connect probe; returns 0 when open, otherwise an errno"""
+        try:
+            sock = self.tcp_socket()
+        except OSError as e:
+            return e.errno or 0
+        sock.settimeout(timeout)
+        try:
+            return sock.connect_ex((host, port))
+        finally:
+            self.close_probe(sock)
+
+    def open_stream(self, host, port, timeout):
+        """Connected TCP stream supporting send, recv_into, settimeout and close"""
+        sock = self.tcp_socket()
+        sock.settimeout(timeout)
+        try:
+            sock.connect((host, port))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def udp_probe(self, host, port, payload, timeout, bufsize):
+        """
+        Send one datagram and wait for a reply.
+        Returns the reply bytes; raises socket.timeout when nothing comes back
+        and ConnectionRefusedError when the port is reported closed.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(timeout)
+        try:
+            sock.sendto(payload, (host, port))
+            data, addr = sock.recvfrom(bufsize)
+            return data
+        finally:
+            sock.close()
+
+
+DEFAULT_TRANSPORT = SocketTransport()
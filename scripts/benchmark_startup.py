@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for Advanced Port Scanner
+Times `advanced_port_scanner.py --help` and a one-port scan of a local
+listener, next to a bare interpreter start, over repeated fresh processes.
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+SCANNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "advanced_port_scanner.py")
+
+
+def start_listener():
+    """Accept-and-close TCP listener on an ephemeral localhost port"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(64)
+
+    def serve():
+        while True:
+            try:
+                client, addr = server.accept()
+            except OSError:
+                return
+            client.sendall(b"benchmark\r\n")
+            client.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server
+
+
+def time_command(command, runs):
+    """Wall-clock milliseconds for each of runs executions of command"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure scanner startup time")
+    parser.add_argument("-n", "--runs", type=int, default=20, help="Runs per command (default: 20)")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to benchmark")
+    args = parser.parse_args()
+
+    server = start_listener()
+    port = server.getsockname()[1]
+    commands = [
+        ("interpreter baseline", [args.python, "-c", "pass"]),
+        ("--help", [args.python, SCANNER, "--help"]),
+        ("one-port scan", [args.python, SCANNER, "127.0.0.1", "-p", str(port), "--timeout", "1"]),
+    ]
+
+    print(f"[*] {args.runs} runs per command with {args.python}")
+    print(f"{'command':22}  {'min':>8}  {'median':>8}  {'max':>8}")
+    print("-" * 52)
+    try:
+        for name, command in commands:
+            timings = time_command(command, args.runs)
+            print(f"{name:22}  {min(timings):7.1f}ms  {statistics.median(timings):7.1f}ms  {max(timings):7.1f}ms")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Service Probes for Advanced Port Scanner
+Second-stage protocol probes for ports that discovery found open. Each
+probe waits briefly for a server greeting, fingerprints the raw bytes
+(SSH, FTP, SMTP, POP3, IMAP, MySQL, Redis, HTTP, TLS) and then speaks
+just enough of that protocol to pull out versions and capabilities.
+Silent services get client-first probes (HTTP, Redis), ordered by the
+port's usual service but identified by what actually answers.
+"""
+
+import re
+import struct
+import time
+
+from scan_results import banner_complete
+
+# Longest wait for a server-first greeting before trying client-first probes
+GREETING_WAIT = 2.0
+
+# Usual services whose clients speak first: skip the greeting wait. A
+# server-first service still answers with its own greeting, so the port
+# hint only saves time and never decides the fingerprint.
+CLIENT_FIRST_SERVICES = frozenset(("HTTP", "HTTPS", "HTTP-Proxy", "HTTPS-Alt", "Redis"))
+
+HTTP_TITLE = re.compile(rb"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+REDIS_VERSION = re.compile(rb"redis_version:([^\r\n]+)")
+
+REDIS_PING = b"*1\r\n$4\r\nPING\r\n"
+REDIS_INFO = b"*2\r\n$4\r\nINFO\r\n$6\r\nserver\r\n"
+
+
+class ProbeSession:
+    """Reads and writes on one stream against a shared deadline"""
+
+    def __init__(self, stream, deadline, max_bytes):
+        self.stream = stream
+        self.deadline = deadline
+        self.buffer = bytearray(max_bytes)
+        self.view = memoryview(self.buffer)
+
+    def send(self, data):
+        """Send data; returns False if the peer has gone away"""
+        try:
+            self.stream.send(data)
+            return True
+        except OSError:
+            return False
+
+    def read(self, complete=None, wait=None):
+        """
+        Read until complete(data) holds (default: any data), EOF, the buffer
+        fills or the deadline (or wait seconds, if sooner) passes
+        """
+        deadline = self.deadline if wait is None else min(self.deadline, time.monotonic() + wait)
+        received = 0
+        while received < len(self.buffer):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.stream.settimeout(remaining)
+            try:
+                count = self.stream.recv_into(self.view[received:])
+            except OSError:
+                break
+            if not count:
+                break
+            received += count
+            if complete is None or complete(bytes(self.view[:received])):
+                break
+        return bytes(self.view[:received])
+
+
+def _reply_complete(data):
+    """A complete (possibly multi-line) FTP/SMTP reply"""
+    return banner_complete(data, 0, len(data), b"\r\n", True)
+
+
+def _line_complete(data):
+    return bytes(data[-1:]) == b"\n"
+
+
+def _bulk_complete(data):
+    """A complete RESP reply: a simple line or a whole bulk string"""
+    header_end = data.find(b"\r\n")
+    if header_end < 0 or not data.startswith(b"$"):
+        return header_end >= 0
+    try:
+        size = int(data[1:header_end])
+    except ValueError:
+        return True
+    return len(data) >= header_end + 2 + max(size, 0) + 2
+
+
+def _is_mysql_packet(data):
+    """MySQL initial handshake (protocol 10) or error packet"""
+    if len(data) < 5 or data[3] != 0:
+        return False
+    length = data[0] | data[1] << 8 | data[2] << 16
+    return 0 < length <= 0xffff and data[4] in (10, 0xff)
+
+
+def fingerprint(data, hint=None):
+    """Service name for raw greeting or response bytes, or None"""
+    if data.startswith(b"SSH-"):
+        return "SSH"
+    if _is_mysql_packet(data):
+        return "MySQL"
+    if data.startswith(b"HTTP/"):
+        return "HTTP"
+    if data.startswith(b"+OK"):
+        return "POP3"
+    if data.startswith((b"* OK", b"* PREAUTH")):
+        return "IMAP"
+    if data.startswith((b"220", b"421")):
+        upper = data.upper()
+        if b"FTP" in upper:
+            return "FTP"
+        if b"SMTP" in upper or b"MAIL" in upper or hint == "SMTP":
+            return "SMTP"
+        return "FTP"
+    if data.startswith((b"+PONG", b"-NOAUTH", b"-ERR", b"-DENIED", b"$")):
+        return "Redis"
+    if data[:2] in (b"\x15\x03", b"\x16\x03"):
+        return "TLS"
+    return None
+
+
+def _first_line(data):
+    return data.split(b"\n", 1)[0].strip().decode('utf-8', errors='replace')
+
+
+def _probe_ssh(session, greeting, context):
+    line = _first_line(greeting)
+    parts = line.split("-", 2)
+    details = {'protocol': parts[1] if len(parts) > 1 else ""}
+    if len(parts) > 2:
+        software, _, comment = parts[2].partition(" ")
+        details['software'] = software
+        if comment:
+            details['comment'] = comment
+    return greeting, details
+
+
+def _probe_ftp(session, greeting, context):
+    if not _reply_complete(greeting):
+        greeting += session.read(_reply_complete)
+    details = {'greeting': _first_line(greeting)}
+    if session.send(b"SYST\r\n"):
+        system = session.read(_reply_complete)
+        if system.startswith(b"215"):
+            details['system'] = _first_line(system)[4:]
+    session.send(b"QUIT\r\n")
+    return greeting, details
+
+
+def _probe_smtp(session, greeting, context):
+    if not _reply_complete(greeting):
+        greeting += session.read(_reply_complete)
+    details = {'greeting': _first_line(greeting)}
+    if session.send(b"EHLO " + context['client_name'] + b"\r\n"):
+        reply = session.read(_reply_complete)
+        lines = [line.strip().decode('utf-8', errors='replace') for line in reply.splitlines()]
+        if lines and lines[0].startswith("250"):
+            details['extensions'] = [line[4:] for line in lines[1:] if line.startswith("250")]
+            greeting += reply
+    session.send(b"QUIT\r\n")
+    return greeting, details
+
+
+def _probe_greeting(session, greeting, context):
+    """POP3/IMAP: the greeting line is the useful part"""
+    if not _line_complete(greeting):
+        greeting += session.read(_line_complete)
+    return greeting, {'greeting': _first_line(greeting)}
+
+
+def _probe_mysql(session, greeting, context):
+    length = greeting[0] | greeting[1] << 8 | greeting[2] << 16
+    if len(greeting) < length + 4:
+        greeting += session.read(lambda data: len(greeting) + len(data) >= length + 4)
+    payload = greeting[4:4 + length]
+    if payload[:1] == b"\xff":
+        code = struct.unpack_from("<H", payload, 1)[0] if len(payload) >= 3 else 0
+        message = payload[3:]
+        if message.startswith(b"#"):
+            message = message[6:]
+        return greeting, {'error_code': code, 'error': message.decode('utf-8', errors='replace')}
+    end = payload.find(b"\x00", 1)
+    details = {'protocol': payload[0], 'version': payload[1:end].decode('utf-8', errors='replace')}
+    if end > 0 and len(payload) >= end + 5:
+        details['connection_id'] = struct.unpack_from("<I", payload, end + 1)[0]
+    return greeting, details
+
+
+def _probe_http(session, response, context):
+    if b"\r\n\r\n" not in response:
+        start = response
+        response += session.read(lambda data: b"\r\n\r\n" in start + data)
+    head, _, body = response.partition(b"\r\n\r\n")
+    if not HTTP_TITLE.search(body):
+        start = body
+        body += session.read(lambda data: HTTP_TITLE.search(start + data) is not None)
+    lines = head.decode('iso-8859-1').split("\r\n")
+    status = lines[0].split(" ", 2)
+    details = {'status': int(status[1]) if len(status) > 1 and status[1].isdigit() else 0,
+               'reason': status[2] if len(status) > 2 else ""}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "server":
+            details['server'] = value.strip()
+    title = HTTP_TITLE.search(body)
+    if title:
+        details['title'] = " ".join(title.group(1).decode('utf-8', errors='replace').split())
+    return head + b"\r\n\r\n", details
+
+
+def _probe_redis(session, response, context):
+    details = {'auth_required': response.startswith((b"-NOAUTH", b"-DENIED"))}
+    if response.startswith(b"+PONG") and session.send(REDIS_INFO):
+        info = session.read(_bulk_complete)
+        version = REDIS_VERSION.search(info)
+        if version:
+            details['version'] = version.group(1).decode('utf-8', errors='replace')
+    return response, details
+
+
+def _probe_tls(session, response, context):
+    return response, {'tls': True}
+
+
+PROBES = {
+    "SSH": _probe_ssh,
+    "FTP": _probe_ftp,
+    "SMTP": _probe_smtp,
+    "POP3": _probe_greeting,
+    "IMAP": _probe_greeting,
+    "MySQL": _probe_mysql,
+    "HTTP": _probe_http,
+    "Redis": _probe_redis,
+    "TLS": _probe_tls,
+}
+
+
+def _http_request(host_header):
+    return (f"GET / HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: advanced-port-scanner\r\n"
+            f"Accept: */*\r\nConnection: close\r\n\r\n").encode('ascii', errors='ignore')
+
+
+def _host_header(host, port):
+    """Host header value for host:port (bracketed for IPv6, port omitted when default)"""
+    name = f"[{host}]" if ":" in host else host
+    return name if port in (80, 443) else f"{name}:{port}"
+
+
+def probe_service(transport, host, port, hint=None, timeout=3.0, max_bytes=4096, hostname=None):
+    """
+    Identify the service on an open port and collect protocol details.
+    Returns (service, banner bytes, details); service is None when nothing
+    recognisable answered.
+    """
+    context = {'client_name': b"scanner.invalid"}
+    deadline = time.monotonic() + timeout
+    # Client-first probes to try on silent ports, likeliest first
+    requests = [REDIS_PING, _http_request(_host_header(hostname or host, port))]
+    if hint != "Redis":
+        requests.reverse()
+
+    stream = transport.open_stream(host, port, timeout)
+    try:
+        session = ProbeSession(stream, deadline, max_bytes)
+        data = b"" if hint in CLIENT_FIRST_SERVICES else session.read(wait=min(GREETING_WAIT, timeout))
+        while not data and requests and time.monotonic() < deadline:
+            if session.send(requests.pop(0)):
+                # Share what is left of the deadline with the remaining probes
+                data = session.read(_bulk_complete if hint == "Redis" else None,
+                                    wait=(deadline - time.monotonic()) / (len(requests) + 1))
+            if not data and requests:
+                # The last probe may have left the service waiting for more input
+                stream.close()
+                stream = transport.open_stream(host, port, timeout)
+                session = ProbeSession(stream, deadline, max_bytes)
+
+        service = fingerprint(data, hint)
+        if service is None:
+            return None, data, {}
+        banner, details = PROBES[service](session, data, context)
+        return service, banner, details
+    finally:
+        stream.close()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Simulated Network for Advanced Port Scanner
+A deterministic, in-process transport with per-host open/closed/filtered
+port maps, latency distributions, packet loss and scripted banners. Plug it
+in with AdvancedPortScanner(..., transport=SimulatedNetwork(...)) to test
+scheduling and throughput at /16 scale without touching the network.
+"""
+
+import errno
+import ipaddress
+import random
+import socket
+import threading
+import time
+import zlib
+
+OPEN = "open"
+CLOSED = "closed"
+FILTERED = "filtered"
+
+
+def _draw_latency(rng, spec):
+    """
+    Sample a latency in seconds from a distribution spec:
+    a number (fixed), ("uniform", low, high), ("normal", mean, stddev),
+    ("lognormal", mu, sigma) or ("exponential", mean)
+    """
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    kind, *params = spec
+    if kind == "uniform":
+        return rng.uniform(*params)
+    if kind == "normal":
+        return max(0.0, rng.gauss(*params))
+    if kind == "lognormal":
+        return rng.lognormvariate(*params)
+    if kind == "exponential":
+        return rng.expovariate(1.0 / params[0])
+    raise ValueError(f"Unknown latency distribution '{kind}'")
+
+
+class SimulatedHost:
+    """
+    Behaviour of one simulated host (or every host in a simulated network).
+
+    Ports not listed in open/closed/filtered get default_state. udp maps
+    UDP ports to their reply (None for a silent open port). Banner scripts
+    map TCP ports to bytes, a list of chunks, or a callable taking the bytes
+    the client sent and returning the reply.
+    """
+
+    def __init__(self, open=(), closed=(), filtered=(), default_state=CLOSED,
+                 latency=0.001, loss=0.0, banners=None, udp=None):
+        self.states = {}
+        for state, ports in ((CLOSED, closed), (FILTERED, filtered), (OPEN, open)):
+            for port in ports:
+                self.states[port] = state
+        self.default_state = default_state
+        self.latency = latency
+        self.loss = loss
+        self.banners = dict(banners or {})
+        self.udp = dict(udp or {})
+
+    def state(self, port):
+        return self.states.get(port, self.default_state)
+
+
+class SimulatedStream:
+    """Connected stream to a simulated service, mimicking the socket calls banner grabs use"""
+
+    def __init__(self, network, script, latency):
+        self.network = network
+        self.script = script
+        self.latency = latency
+        self.sent = b""
+        self.pending = None
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def send(self, data):
+        self.sent += bytes(data)
+        if callable(self.script):
+            self.pending = None
+        return len(data)
+
+    sendall = send
+
+    def _chunks(self):
+        if self.pending is None:
+            reply = self.script(self.sent) if callable(self.script) else self.script
+            if reply is None:
+                reply = []
+            self.pending = [reply] if isinstance(reply, (bytes, bytearray)) else list(reply)
+            if callable(self.script):
+                self.sent = b""
+        return self.pending
+
+    def recv_into(self, buffer, nbytes=0):
+        chunks = self._chunks()
+        if not chunks:
+            if self.script is None or callable(self.script):
+                # Silent service: nothing more will arrive before the deadline
+                self.network._sleep(self.timeout or 0)
+                raise socket.timeout("timed out")
+            return 0
+        self.network._sleep(self.latency)
+        chunk = chunks[0]
+        size = min(len(chunk), len(buffer), nbytes or len(buffer))
+        buffer[:size] = chunk[:size]
+        if size < len(chunk):
+            chunks[0] = chunk[size:]
+        else:
+            chunks.pop(0)
+        return size
+
+    def recv(self, bufsize):
+        buffer = bytearray(bufsize)
+        return bytes(buffer[:self.recv_into(buffer)])
+
+    def close(self):
+        pass
+
+
+class SimulatedNetwork:
+    """
+    Deterministic transport over simulated hosts.
+
+    Every probe draws its loss and latency from an RNG seeded by
+    (seed, kind, host, port, attempt), so identical scans produce identical
+    outcomes regardless of thread scheduling. time_scale multiplies
+    simulated latencies before sleeping; 0 answers instantly while still
+    accounting the simulated time in stats['simulated_seconds'].
+    """
+
+    def __init__(self, seed=0, time_scale=0.0, default_host=None):
+        self.seed = seed
+        self.time_scale = time_scale
+        self.default_host = default_host
+        self.hosts = {}
+        self.networks = []
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.stats = {'connect': 0, 'udp': 0, 'stream': 0, 'lost': 0, 'simulated_seconds': 0.0}
+
+    def add_host(self, host, **behaviour):
+        """Simulate a single host; returns its SimulatedHost"""
+        self.hosts[host] = SimulatedHost(**behaviour)
+        return self.hosts[host]
+
+    def add_network(self, cidr, **behaviour):
+        """Simulate every address in a CIDR range with one shared behaviour"""
+        profile = SimulatedHost(**behaviour)
+        self.networks.append((ipaddress.ip_network(cidr, strict=False), profile))
+        return profile
+
+    def host(self, host):
+        """Behaviour for host: explicit host, then containing network, then default"""
+        profile = self.hosts.get(host)
+        if profile is not None:
+            return profile
+        if self.networks:
+            try:
+                address = ipaddress.ip_address(host)
+            except ValueError:
+                address = None
+            if address is not None:
+                for network, profile in self.networks:
+                    if address in network:
+                        return profile
+        return self.default_host
+
+    def _rng(self, kind, host, port):
+        """Per-probe RNG, stable across runs and independent of thread order"""
+        key = (kind, host, port)
+        with self.lock:
+            attempt = self.attempts.get(key, 0)
+            self.attempts[key] = attempt + 1
+            self.stats[kind] += 1
+        return random.Random(zlib.crc32(f"{self.seed}:{kind}:{host}:{port}:{attempt}".encode()))
+
+    def _sleep(self, seconds):
+        with self.lock:
+            self.stats['simulated_seconds'] += seconds
+        if self.time_scale and seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def _lost(self, rng, profile):
+        if profile.loss and rng.random() < profile.loss:
+            with self.lock:
+                self.stats['lost'] += 1
+            return True
+        return False
+
+    def connect(self, host, port, timeout):
+        """TCP connect probe with the same return convention as SocketTransport"""
+        rng = self._rng('connect', host, port)
+        profile = self.host(host)
+        if profile is None:
+            self._sleep(timeout)
+            return errno.EAGAIN
+        state = profile.state(port)
+        if state == FILTERED or self._lost(rng, profile):
+            self._sleep(timeout)
+            return errno.EAGAIN
+        latency = _draw_latency(rng, profile.latency)
+        if latency > timeout:
+            self._sleep(timeout)
+            return errno.EAGAIN
+        self._sleep(latency)
+        return 0 if state == OPEN else errno.ECONNREFUSED
+
+    def open_stream(self, host, port, timeout):
+        """Connected stream to an open simulated port, replaying its banner script"""
+        rng = self._rng('stream', host, port)
+        profile = self.host(host)
+        if profile is None or profile.state(port) != OPEN:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+        latency = _draw_latency(rng, profile.latency)
+        self._sleep(latency)
+        return SimulatedStream(self, profile.banners.get(port), latency)
+
+    def udp_probe(self, host, port, payload, timeout, bufsize):
+        """UDP probe with the same conventions as SocketTransport.udp_probe"""
+        rng = self._rng('udp', host, port)
+        profile = self.host(host)
+        if profile is None or self._lost(rng, profile):
+            self._sleep(timeout)
+            raise socket.timeout("timed out")
+        if port not in profile.udp:
+            if profile.state(port) == FILTERED:
+                self._sleep(timeout)
+                raise socket.timeout("timed out")
+            self._sleep(_draw_latency(rng, profile.latency))
+            raise ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused")
+        reply = profile.udp[port]
+        if reply is None:
+            self._sleep(timeout)
+            raise socket.timeout("timed out")
+        self._sleep(_draw_latency(rng, profile.latency))
+        return bytes(reply[:bufsize])
@@ -12,8 +12,44 @@ import tempfile
 import os
 import json
 import csv
+import errno
+import subprocess
+import io
+import sys
 from unittest.mock import patch, MagicMock
-from advanced_port_scanner import AdvancedPortScanner
+from advanced_port_scanner import (AdvancedPortScanner, CUSTOM_PAYLOADS, OUTCOME_CLOSED, OUTCOME_ERROR,
+                                   OUTCOME_NO_RESPONSE, OUTCOME_OPEN, banner_line, banner_text)
+from congestion import CongestionController
+from event_engine import SelectorEngine, TimerWheel, fd_budget
+from probe_trace import ReplayTarget, TraceRecorder, analyze, read_trace, replay
+import result_index
+from result_index import ResultIndex
+import scan_diff
+from scan_console import ConsoleRenderer
+from service_probes import fingerprint
+from scan_monitor import JsonLinesSink, ScanMonitor, expand_targets
+from scan_scope import IntervalSet, ScanScope, ScopeError
+from scan_profiles import TIMING_TEMPLATES, ProfileError, compile_profile_data, load_plan, timing_settings
+from scan_transport import SocketTransport
+from simulated_network import SimulatedNetwork
+
+class FakeStream:
+    """Socket stand-in that returns scripted chunks from recv_into"""
+    
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.reads = 0
+    
+    def settimeout(self, timeout):
+        pass
+    
+    def recv_into(self, buffer, nbytes=0):
+        self.reads += 1
+        if not self.chunks:
+            raise socket.timeout()
+        chunk = self.chunks.pop(0)[:len(buffer)]
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
 
 class TestAdvancedPortScanner(unittest.TestCase):
     """Test cases for AdvancedPortScanner class"""
@@ -164,11 +200,12 @@ class TestAdvancedPortScanner(unittest.TestCase):
         mock_sock = MagicMock()
         mock_sock.connect.return_value = None
         mock_sock.send.return_value = None
-        mock_sock.recv.return_value = b"HTTP/1.1 200 OK"
+        mock_sock.recv_into.side_effect = FakeStream([b"HTTP/1.1 200 OK\r\n\r\n"]).recv_into
         mock_socket.return_value = mock_sock
         
         banner = self.scanner._get_banner(80)
-        self.assertEqual(banner, "HTTP/1.1 200 OK")
+        self.assertEqual(banner, b"HTTP/1.1 200 OK\r\n\r\n")
+        self.assertEqual(banner_text(banner), "HTTP/1.1 200 OK")
     
     @patch('socket.socket')
     def test_get_banner_no_response(self, mock_socket):
@@ -177,11 +214,12 @@ class TestAdvancedPortScanner(unittest.TestCase):
         mock_sock = MagicMock()
         mock_sock.connect.return_value = None
         mock_sock.send.return_value = None
-        mock_sock.recv.return_value = b""
+        mock_sock.recv_into.return_value = 0
         mock_socket.return_value = mock_sock
         
         banner = self.scanner._get_banner(80)
-        self.assertEqual(banner, "No banner")
+        self.assertEqual(banner, b"")
+        self.assertEqual(banner_text(banner), "No banner")
     
     @patch('socket.socket')
     def test_get_banner_exception(self, mock_socket):
@@ -189,7 +227,7 @@ class TestAdvancedPortScanner(unittest.TestCase):
         mock_socket.side_effect = Exception("Connection error")
         
         banner = self.scanner._get_banner(80)
-        self.assertEqual(banner, "No banner")
+        self.assertEqual(banner, b"")
     
     def test_udp_scan_open_port(self):
         """Test UDP scan with open port"""
@@ -291,6 +329,32 @@ class TestAdvancedPortScanner(unittest.TestCase):
             self.assertIn("80/tcp", content)
             self.assertIn("HTTP", content)
     
+    def test_export_text_banner_matches_console(self):
+        """Test text exports fold banners exactly like the console does"""
+        banner = b"220-mail.example ESMTP\r\n220 ready\r\n"
+        self.scanner.results = [
+            {'port': 25, 'state': 'open', 'service': 'SMTP', 'banner': banner, 'scan_type': 'connect'}
+        ]
+        filename = os.path.join(self.test_dir, "test_export")
+        self.scanner.export_results("text", filename)
+        with open(f"{filename}.txt", 'r') as f:
+            self.assertIn(banner_line(banner), f.read())
+    
+    def test_export_notice_keeps_jsonl_stdout_clean(self):
+        """Test the export notice goes to stderr in JSON-lines mode and is dropped in quiet mode"""
+        from contextlib import redirect_stderr, redirect_stdout
+        self.scanner.results = [
+            {'port': 80, 'state': 'open', 'service': 'HTTP', 'banner': 'Test', 'scan_type': 'connect'}
+        ]
+        filename = os.path.join(self.test_dir, "test_export")
+        for mode, expected in (("jsonl", f"[*] Results exported to {filename}.json\n"), ("quiet", "")):
+            self.scanner.output = mode
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                self.scanner.export_results("json", filename)
+            self.assertEqual(stdout.getvalue(), "")
+            self.assertEqual(stderr.getvalue(), expected)
+    
     def test_export_results_auto_filename(self):
         """Test automatic filename generation"""
         # Add some test results
@@ -382,6 +446,1405 @@ class TestPortScannerIntegration(unittest.TestCase):
         self.assertEqual(results[0]['port'], self.test_port)
         self.assertEqual(results[0]['state'], 'open')
 
+class TestBannerReader(unittest.TestCase):
+    """Test the buffered, terminator-aware banner reader"""
+    
+    def setUp(self):
+        """Set up a scanner with a short banner deadline"""
+        self.scanner = AdvancedPortScanner("127.0.0.1", "80", timeout=1)
+    
+    def test_http_reads_until_end_of_headers(self):
+        """Test HTTP banners spanning several packets are read to the blank line"""
+        stream = FakeStream([b"HTTP/1.1 200 OK\r\nServer: x", b"\r\n\r", b"\n<html>", b"never read"])
+        banner = self.scanner._read_banner(stream, "HTTP")
+        self.assertEqual(banner, b"HTTP/1.1 200 OK\r\nServer: x\r\n\r\n<html>")
+        self.assertEqual(stream.reads, 3)
+    
+    def test_smtp_multiline_reply(self):
+        """Test SMTP continuation lines are read up to the final reply line"""
+        stream = FakeStream([b"220-mail.example.com ESMTP\r\n", b"220 ready\r\n", b"extra"])
+        banner = self.scanner._read_banner(stream, "SMTP")
+        self.assertEqual(banner, b"220-mail.example.com ESMTP\r\n220 ready\r\n")
+    
+    def test_bare_reply_code(self):
+        """Test a reply line holding only the code ends the read"""
+        stream = FakeStream([b"220\r\n", b"never read"])
+        self.assertEqual(self.scanner._read_banner(stream, "FTP"), b"220\r\n")
+        self.assertEqual(stream.reads, 1)
+    
+    def test_byte_cap(self):
+        """Test reads stop at the configured byte cap"""
+        self.scanner.banner_max_bytes = 8
+        stream = FakeStream([b"SSH-2.0-", b"OpenSSH_9.0\n"])
+        self.assertEqual(self.scanner._read_banner(stream, "SSH"), b"SSH-2.0-")
+    
+    def test_unknown_service_first_chunk(self):
+        """Test services without a terminator stop after the first chunk"""
+        stream = FakeStream([b"hello", b"world"])
+        self.assertEqual(self.scanner._read_banner(stream, "Unknown"), b"hello")
+    
+    def test_deadline(self):
+        """Test a silent service ends the read at the deadline"""
+        stream = FakeStream([b"220-partial\r\n"])
+        self.assertEqual(self.scanner._read_banner(stream, "FTP"), b"220-partial\r\n")
+    
+    def test_buffer_reused_per_worker(self):
+        """Test the receive buffer is allocated once per thread"""
+        first, _ = self.scanner._banner_buffer()
+        second, _ = self.scanner._banner_buffer()
+        self.assertIs(first, second)
+        
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.scanner._banner_buffer()[0]))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], first)
+    
+    def test_export_decodes_raw_banner(self):
+        """Test raw banners are decoded only when exporting"""
+        self.scanner.results = [
+            {'port': 22, 'state': 'open', 'service': 'SSH', 'banner': b"SSH-2.0-OpenSSH_8.9\r\n", 'scan_type': 'connect'}
+        ]
+        rows = list(self.scanner._export_rows())
+        self.assertEqual(rows[0]['banner'], "SSH-2.0-OpenSSH_8.9")
+        self.assertIsInstance(self.scanner.results[0]['banner'], bytes)
+
+class TestRetryScheduler(unittest.TestCase):
+    """Test the retry pass for unanswered ports"""
+    
+    def _scripted_scanner(self, script, retries):
+        """Scanner whose probes answer from a per-port list of outcomes"""
+        scanner = AdvancedPortScanner("127.0.0.1", ",".join(str(p) for p in script),
+                                      threads=4, timeout=1, retries=retries, retry_backoff=0)
+        calls = {port: 0 for port in script}
+        
+        def fake_scan_port(port):
+            outcome = script[port][min(calls[port], len(script[port]) - 1)]
+            calls[port] += 1
+            scanner._set_outcome(outcome)
+            if outcome == OUTCOME_OPEN:
+                return {'port': port, 'state': 'open', 'service': 'Unknown', 'banner': '', 'scan_type': 'connect'}
+            return None
+        
+        scanner.scan_port = fake_scan_port
+        return scanner, calls
+    
+    def test_retry_recovers_dropped_probe(self):
+        """Test only unanswered ports are re-probed, with per-port attempt counts"""
+        scanner, calls = self._scripted_scanner({
+            1: [OUTCOME_OPEN],
+            2: [OUTCOME_NO_RESPONSE, OUTCOME_OPEN],
+            3: [OUTCOME_NO_RESPONSE],
+            4: [OUTCOME_CLOSED],
+        }, retries=2)
+        
+        results = scanner.run_scan()
+        
+        self.assertEqual(sorted(r['port'] for r in results), [1, 2])
+        self.assertEqual(scanner.attempts, {1: 1, 2: 2, 3: 3, 4: 1})
+        self.assertEqual(calls, {1: 1, 2: 2, 3: 3, 4: 1})
+        self.assertEqual([r['attempts'] for r in results if r['port'] == 2], [2])
+    
+    def test_silent_udp_port_reports_all_attempts(self):
+        """Test a UDP port that never answers keeps open|filtered with its full attempt count"""
+        network = SimulatedNetwork()
+        network.add_host("10.0.0.3", udp={53: None})
+        scanner = AdvancedPortScanner("10.0.0.3", "53", timeout=0.01, scan_type="udp", retries=2,
+                                      retry_backoff=0, transport=network, quiet=True)
+        
+        results = scanner.run_scan()
+        
+        self.assertEqual(scanner.attempts, {53: 3})
+        self.assertEqual([(r['state'], r['attempts']) for r in results], [("open|filtered", 3)])
+    
+    def test_no_retries_by_default(self):
+        """Test each port gets exactly one attempt without retries"""
+        scanner, calls = self._scripted_scanner({5: [OUTCOME_NO_RESPONSE, OUTCOME_OPEN]}, retries=0)
+        
+        self.assertEqual(scanner.run_scan(), [])
+        self.assertEqual(calls, {5: 1})
+    
+    @patch('time.sleep')
+    def test_exponential_backoff(self, mock_sleep):
+        """Test retry rounds back off exponentially"""
+        scanner, calls = self._scripted_scanner({7: [OUTCOME_NO_RESPONSE]}, retries=3)
+        scanner.retry_backoff = 0.25
+        
+        scanner.run_scan()
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [0.25, 0.5, 1.0])
+    
+    @patch('socket.socket')
+    def test_connect_timeout_is_unanswered(self, mock_socket):
+        """Test connect_ex timeouts are classified as no response"""
+        scanner = AdvancedPortScanner("127.0.0.1", "80", timeout=1)
+        mock_sock = MagicMock()
+        mock_sock.connect_ex.return_value = errno.EAGAIN
+        mock_socket.return_value = mock_sock
+        
+        port, result, outcome, err = scanner._probe(80)
+        self.assertIsNone(result)
+        self.assertEqual(outcome, OUTCOME_NO_RESPONSE)
+        
+        mock_sock.connect_ex.return_value = errno.ECONNREFUSED
+        port, result, outcome, err = scanner._probe(80)
+        self.assertEqual(outcome, OUTCOME_CLOSED)
+        self.assertEqual(err, errno.ECONNREFUSED)
+
+class TestScanProfiles(unittest.TestCase):
+    """Test timing templates and compiled scan profiles"""
+    
+    def setUp(self):
+        """Create a temporary directory for profiles and plan caches"""
+        self.test_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """Remove profile files"""
+        for root, dirs, files in os.walk(self.test_dir, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+        os.rmdir(self.test_dir)
+    
+    def _write_profile(self, name, data):
+        """Write a JSON profile and return its path"""
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        return path
+    
+    def test_timing_templates_ordered(self):
+        """Test templates get faster from paranoid to insane"""
+        timeouts = [TIMING_TEMPLATES[name]['timeout'] for name in TIMING_TEMPLATES]
+        self.assertEqual(timeouts, sorted(timeouts, reverse=True))
+        self.assertEqual(list(TIMING_TEMPLATES)[0], "paranoid")
+        self.assertEqual(list(TIMING_TEMPLATES)[-1], "insane")
+    
+    def test_unknown_timing_template(self):
+        """Test unknown template names are rejected"""
+        with self.assertRaises(ProfileError):
+            timing_settings("ludicrous")
+    
+    def test_compile_profile(self):
+        """Test a profile compiles ports, probes, payloads and settings"""
+        path = self._write_profile("web.json", {
+            "name": "web",
+            "timing": "polite",
+            "timeout": 2,
+            "ports": "21,80,8000-8002",
+            "probes": ["connect", "udp"],
+            "payloads": {"8001": "PING\\r\\n", "9999": "ignored"}
+        })
+        plan = load_plan(path, CUSTOM_PAYLOADS)
+        
+        self.assertEqual(plan.ports, (21, 80, 8000, 8001, 8002))
+        self.assertEqual(plan.probes, ("connect", "udp"))
+        self.assertEqual(plan.payloads[21], CUSTOM_PAYLOADS[21])
+        self.assertEqual(plan.payloads[8001], b"PING\r\n")
+        self.assertNotIn(9999, plan.payloads)
+        self.assertNotIn(443, plan.payloads)
+        self.assertEqual(plan.settings['threads'], TIMING_TEMPLATES['polite']['threads'])
+        self.assertEqual(plan.settings['timeout'], 2)
+    
+    def test_plan_disk_cache(self):
+        """Test compiled plans are written to and reused from the cache directory"""
+        path = self._write_profile("cached.json", {"ports": "22,80"})
+        cache_dir = os.path.join(self.test_dir, "plans")
+        plan = load_plan(path, CUSTOM_PAYLOADS, cache_dir)
+        
+        cached = os.listdir(cache_dir)
+        self.assertEqual(cached, [f"{plan.key}.plan.json"])
+        
+        with patch('scan_profiles.compile_profile_data') as mock_compile, \
+             patch.dict('scan_profiles._PLAN_CACHE', clear=True):
+            reused = load_plan(path, CUSTOM_PAYLOADS, cache_dir)
+            mock_compile.assert_not_called()
+        self.assertEqual(reused.ports, plan.ports)
+        self.assertEqual(reused.payloads, plan.payloads)
+    
+    def test_port_override_rebuilds_payloads(self):
+        """Test command line ports replace the profile's ports and get their payloads"""
+        path = self._write_profile("ssh.json", {"ports": "22", "payloads": {"8080": "PING\\r\\n"}})
+        plan = load_plan(path, CUSTOM_PAYLOADS, ports="80,8080")
+        
+        self.assertEqual(plan.ports, (80, 8080))
+        self.assertEqual(plan.payloads[80], CUSTOM_PAYLOADS[80])
+        self.assertEqual(plan.payloads[8080], b"PING\r\n")
+        self.assertEqual(load_plan(path, CUSTOM_PAYLOADS).ports, (22,))
+        
+        scanner = AdvancedPortScanner.from_plan("127.0.0.1", plan)
+        self.assertIsNotNone(scanner._payload_for(80))
+    
+    def test_invalid_probe(self):
+        """Test unknown probe types are rejected"""
+        path = self._write_profile("bad.json", {"probes": ["xmas"]})
+        with self.assertRaises(ProfileError):
+            load_plan(path)
+    
+    def test_scanner_from_plan(self):
+        """Test building a scanner from a compiled plan with overrides"""
+        path = self._write_profile("fast.json", {"timing": "insane", "ports": "80,443"})
+        plan = load_plan(path, CUSTOM_PAYLOADS)
+        scanner = AdvancedPortScanner.from_plan("127.0.0.1", plan, threads=7)
+        
+        self.assertEqual(scanner.ports, [80, 443])
+        self.assertEqual(scanner.threads, 7)
+        self.assertEqual(scanner.timeout, TIMING_TEMPLATES['insane']['timeout'])
+        self.assertEqual(set(scanner.custom_payloads), {80, 443})
+
+class TestEventEngine(unittest.TestCase):
+    """Test the selectors-based scan engine"""
+    
+    def setUp(self):
+        """Start a listener that sends an FTP-style multi-line greeting"""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('127.0.0.1', 0))
+        self.server_socket.listen(16)
+        self.test_port = self.server_socket.getsockname()[1]
+        
+        # Reserve a port that is certainly closed
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.1', 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+        
+        self.server_thread = threading.Thread(target=self._run_server)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+    
+    def tearDown(self):
+        """Stop the listener"""
+        self.server_socket.close()
+    
+    def _run_server(self):
+        """Send the greeting in two packets"""
+        try:
+            while True:
+                client, addr = self.server_socket.accept()
+                client.sendall(b"220-welcome\r\n")
+                time.sleep(0.05)
+                client.sendall(b"220 ready\r\n")
+                time.sleep(0.05)
+                client.close()
+        except OSError:
+            pass
+    
+    def test_event_engine_scan(self):
+        """Test the event engine finds the open port and reads the whole greeting"""
+        scanner = AdvancedPortScanner(
+            target="127.0.0.1",
+            ports=f"{self.test_port},{self.closed_port}",
+            threads=8,
+            timeout=1,
+            engine="event"
+        )
+        scanner.custom_payloads = {}
+        scanner.service_signatures = {self.test_port: "FTP"}
+        
+        results = scanner.run_scan()
+        
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['port'], self.test_port)
+        self.assertEqual(results[0]['banner'], b"220-welcome\r\n220 ready\r\n")
+        self.assertEqual(scanner.attempts, {self.test_port: 1, self.closed_port: 1})
+    
+    def test_event_engine_scan_port(self):
+        """Test scan_port routes through the event engine and records the outcome"""
+        scanner = AdvancedPortScanner("127.0.0.1", str(self.closed_port), timeout=1, engine="event")
+        self.assertIsNone(scanner.scan_port(self.closed_port))
+        self.assertEqual(scanner._local.outcome, OUTCOME_CLOSED)
+    
+    def test_probes_finishing_at_launch(self):
+        """Test probes that complete inside launch are still yielded once the ports run out"""
+        class NoSockets(SocketTransport):
+            def tcp_socket(self):
+                raise OSError(errno.EMFILE, "Too many open files")
+        
+        scanner = AdvancedPortScanner("127.0.0.1", "1-5", threads=8, timeout=1, engine="event",
+                                      transport=NoSockets())
+        outcomes = list(SelectorEngine(scanner).run(scanner.ports))
+        self.assertEqual(sorted(port for port, result, outcome, err in outcomes), [1, 2, 3, 4, 5])
+        self.assertTrue(all(outcome == OUTCOME_ERROR and err == errno.EMFILE
+                            for port, result, outcome, err in outcomes))
+    
+    def test_single_port_engine_is_sized_to_the_work(self):
+        """Test scan_port does not allocate slots and banner buffers for every thread"""
+        scanner = AdvancedPortScanner("127.0.0.1", str(self.closed_port), threads=500, timeout=1, engine="event")
+        self.assertEqual(SelectorEngine(scanner, ports=1).capacity, 1)
+        self.assertEqual(len(SelectorEngine(scanner, ports=1).buffer), scanner.banner_max_bytes)
+        self.assertEqual(SelectorEngine(scanner, ports=10000).capacity, fd_budget(500))
+    
+    def test_timer_wheel_expiry(self):
+        """Test timers fire once, after their deadline, and stale generations are dropped"""
+        wheel = TimerWheel(tick=0.01, size=8)
+        now = time.monotonic()
+        generations = [1, 1, 1]
+        deadlines = [now + 0.02, now + 0.5, now + 0.02]
+        for slot in range(3):
+            wheel.schedule(slot, generations[slot], deadlines[slot])
+        generations[2] = 2
+        
+        self.assertEqual(wheel.expire(now, generations, deadlines), [])
+        self.assertEqual(wheel.expire(now + 0.05, generations, deadlines), [0])
+        # Slot 1 wraps around the 8-bucket wheel several times before firing
+        self.assertEqual(wheel.expire(now + 0.3, generations, deadlines), [])
+        self.assertEqual(wheel.expire(now + 0.6, generations, deadlines), [1])
+
+class TestScanMonitor(unittest.TestCase):
+    """Test incremental rescans and change events"""
+    
+    def setUp(self):
+        """Create a monitor over two hosts with a scripted network"""
+        self.test_dir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.test_dir, "state.json")
+        self.event_file = os.path.join(self.test_dir, "events.jsonl")
+        self.network = {('10.0.0.1', 22): b"SSH-2.0-OpenSSH_8.9"}
+        self.scanned = []
+        self.monitor = self._make_monitor()
+    
+    def tearDown(self):
+        """Remove state and event files"""
+        for file in os.listdir(self.test_dir):
+            os.remove(os.path.join(self.test_dir, file))
+        os.rmdir(self.test_dir)
+    
+    def _make_monitor(self):
+        """Monitor whose slice scans answer from self.network"""
+        monitor = ScanMonitor(["10.0.0.1", "10.0.0.2"], [22, 80], state_file=self.state_file,
+                              slice_size=4, interval=0, sinks=[JsonLinesSink(self.event_file)])
+        
+        def fake_scan_pairs(pairs):
+            self.scanned.append(list(pairs))
+            return {pair + ("tcp",): {'port': pair[1], 'state': 'open', 'service': 'SSH',
+                                      'banner': self.network[pair], 'scan_type': 'connect'}
+                    for pair in pairs if pair in self.network}
+        
+        monitor._scan_pairs = fake_scan_pairs
+        return monitor
+    
+    def _events(self):
+        """Events written to the sink so far"""
+        if not os.path.exists(self.event_file):
+            return []
+        with open(self.event_file, 'r') as f:
+            return [json.loads(line) for line in f]
+    
+    def test_baseline_then_changes(self):
+        """Test the first sweep is silent and later changes produce events"""
+        self.assertEqual(self.monitor.tick(), [])
+        self.assertEqual(self.monitor.state['sweeps'], 1)
+        
+        self.network[('10.0.0.2', 80)] = b"HTTP/1.1 200 OK"
+        self.network[('10.0.0.1', 22)] = b"SSH-2.0-OpenSSH_9.6"
+        events = self.monitor.tick()
+        self.assertEqual(sorted((e['event'], e['host'], e['port']) for e in events),
+                         [('banner_changed', '10.0.0.1', 22), ('port_opened', '10.0.0.2', 80)])
+        self.assertEqual(len(self._events()), 2)
+    
+    def test_close_needs_consecutive_misses(self):
+        """Test a known-open port is reported closed only after close_after misses"""
+        self.monitor.tick()
+        del self.network[('10.0.0.1', 22)]
+        self.assertEqual(self.monitor.tick(), [])
+        events = self.monitor.tick()
+        self.assertEqual([(e['event'], e['port']) for e in events], [('port_closed', 22)])
+    
+    def test_slices_prioritise_open_ports(self):
+        """Test known-open ports are rechecked every tick ahead of the sweep"""
+        self.monitor.slice_size = 2
+        for _ in range(3):
+            self.monitor.tick()
+        self.assertEqual(self.scanned[1][0], ('10.0.0.1', 22))
+        self.assertEqual(self.scanned[2][0], ('10.0.0.1', 22))
+        self.assertTrue(all(len(pairs) <= 2 for pairs in self.scanned))
+    
+    def test_state_persisted(self):
+        """Test a restarted monitor resumes from the state file"""
+        self.monitor.tick()
+        restarted = self._make_monitor()
+        self.assertEqual(restarted.state['sweeps'], 1)
+        self.assertIn("22", restarted.state['hosts']['10.0.0.1']['open'])
+    
+    def test_slice_hosts_scanned_in_parallel(self):
+        """Test all pairs of a slice share one probe pool instead of scanning host by host"""
+        class SlowFilteredNetwork(SimulatedNetwork):
+            def __init__(self):
+                super().__init__()
+                self.active = self.peak = 0
+                self.counter = threading.Lock()
+            
+            def connect(self, host, port, timeout):
+                with self.counter:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                time.sleep(0.05)
+                with self.counter:
+                    self.active -= 1
+                return errno.EAGAIN
+        
+        network = SlowFilteredNetwork()
+        hosts = [f"10.0.0.{n}" for n in range(1, 21)]
+        monitor = ScanMonitor(hosts, [22, 80, 443], slice_size=60, interval=0,
+                              scanner_options={'threads': 100, 'timeout': 0.05, 'transport': network})
+        with patch('builtins.print'):
+            monitor.tick()
+        self.assertEqual(network.stats['connect'], 0)
+        self.assertEqual(monitor.state['sweeps'], 1)
+        # Host by host, at most one host's three ports would ever be in flight
+        self.assertGreater(network.peak, 3)
+        self.assertLessEqual(network.peak, 60)
+    
+    def test_plan_payloads_and_probe_types(self):
+        """Test monitor scanners use the plan's payloads and every probe type"""
+        network = SimulatedNetwork()
+        network.add_host("10.0.0.1", open=[53, 8080], banners={8080: lambda sent: b"echo:" + sent},
+                         udp={53: b"\x81\x80"})
+        plan = compile_profile_data({'ports': "53,8080", 'probes': ["connect", "udp"],
+                                     'payloads': {'8080': "PING {}\\r\\n"}})
+        monitor = ScanMonitor(["10.0.0.1"], plan.ports, slice_size=4, interval=0, plan=plan,
+                              scanner_options={'timeout': 0.2, 'banner_timeout': 0.05, 'transport': network})
+        with patch('builtins.print'):
+            monitor.tick()
+        open_ports = monitor.state['hosts']['10.0.0.1']['open']
+        self.assertEqual(sorted(open_ports), ["53", "53/udp", "8080"])
+        self.assertEqual(open_ports["8080"]['banner'], "echo:PING 10.0.0.1")
+        self.assertEqual(open_ports["53/udp"]['scan_type'], "udp")
+    
+    def test_expand_targets(self):
+        """Test CIDR and list expansion"""
+        self.assertEqual(expand_targets("192.168.0.0/30,10.0.0.1"),
+                         ["192.168.0.1", "192.168.0.2", "10.0.0.1"])
+
+class TestStartupCost(unittest.TestCase):
+    """Test lazy imports and precomputed payload tables"""
+    
+    def test_import_is_lazy(self):
+        """Test importing the scanner does not pull in export, profile, pool or transport-option modules"""
+        # socket already loads itertools, so only modules new to the scanner import count
+        code = ("import sys, socket; loaded = set(sys.modules); import advanced_port_scanner; "
+                "print(sorted(m for m in ('json', 'csv', 'argparse', 'concurrent.futures', 'scan_export', "
+                "'scan_profiles', 'event_engine', 'ipaddress', 'struct', 'itertools') "
+                "if m in sys.modules and m not in loaded))")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+    
+    def test_helpers_do_not_import_the_scanner(self):
+        """Test helper modules get shared outcomes and banner helpers without loading the scanner module"""
+        code = ("import sys, scan_console, scan_export, event_engine, congestion, service_probes, result_index, "
+                "scan_diff; "
+                "print('advanced_port_scanner' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+        self.assertEqual(output.strip(), "False")
+    
+    def test_payloads_encoded_once_per_target(self):
+        """Test payload templates are rendered once per target and shared across probes"""
+        scanner = AdvancedPortScanner("10.1.2.3", "80")
+        self.assertIs(scanner.custom_payloads, CUSTOM_PAYLOADS)
+        
+        first = scanner._payload_for(80)
+        self.assertEqual(first, b"GET / HTTP/1.1\r\nHost: 10.1.2.3\r\n\r\n")
+        self.assertIs(scanner._payload_for(80), first)
+        self.assertIsNone(scanner._payload_for(9999))
+        
+        scanner.target = "10.9.9.9"
+        self.assertEqual(scanner._payload_for(25), b"EHLO 10.9.9.9\r\n")
+
+class TestProbeTrace(unittest.TestCase):
+    """Test probe trace recording, analysis and replay"""
+    
+    def setUp(self):
+        """Create a temporary trace file path"""
+        self.test_dir = tempfile.mkdtemp()
+        self.trace_file = os.path.join(self.test_dir, "scan.trace")
+    
+    def tearDown(self):
+        """Remove the trace file"""
+        for file in os.listdir(self.test_dir):
+            os.remove(os.path.join(self.test_dir, file))
+        os.rmdir(self.test_dir)
+    
+    def test_ring_buffer_round_trip(self):
+        """Test records survive batched flushes and the final flush"""
+        recorder = TraceRecorder(self.trace_file, capacity=4)
+        for port in range(1, 11):
+            recorder.record("10.0.0.5", port, "thread", "closed", errno.ECONNREFUSED, 100.0 + port, 100.5 + port)
+        self.assertEqual(recorder.count, 2)
+        recorder.record("::1", 443, "event", "no-response", errno.ETIMEDOUT, 200.0, 203.0)
+        recorder.close()
+        
+        records = list(read_trace(self.trace_file))
+        self.assertEqual(len(records), 11)
+        self.assertEqual(records[0], ("10.0.0.5", 1, "thread", "closed", errno.ECONNREFUSED, 101.0, 101.5))
+        self.assertEqual(records[-1], ("::1", 443, "event", "no-response", errno.ETIMEDOUT, 200.0, 203.0))
+    
+    @patch('socket.socket')
+    def test_scanner_records_probes(self, mock_socket):
+        """Test each thread-engine probe is traced with its outcome and errno"""
+        mock_sock = MagicMock()
+        mock_sock.connect_ex.return_value = errno.ECONNREFUSED
+        mock_socket.return_value = mock_sock
+        
+        recorder = TraceRecorder(self.trace_file)
+        scanner = AdvancedPortScanner("127.0.0.1", "1-5", threads=2, timeout=1, trace=recorder, quiet=True)
+        scanner.run_scan()
+        recorder.close()
+        
+        records = list(read_trace(self.trace_file))
+        self.assertEqual(sorted(r[1] for r in records), [1, 2, 3, 4, 5])
+        self.assertTrue(all(r[2:5] == ("thread", "closed", errno.ECONNREFUSED) for r in records))
+        self.assertTrue(all(r[6] >= r[5] for r in records))
+    
+    def test_rate_pacing_not_traced_as_latency(self):
+        """Test probe latency is measured after the --rate delay, not before it"""
+        network = SimulatedNetwork()
+        recorder = TraceRecorder(self.trace_file)
+        scanner = AdvancedPortScanner("10.0.0.1", "1-4", threads=4, timeout=1, rate=20, trace=recorder,
+                                      transport=network, quiet=True)
+        scanner.run_scan()
+        recorder.close()
+        
+        records = sorted(read_trace(self.trace_file), key=lambda r: r[5])
+        self.assertEqual(len(records), 4)
+        # Starts are paced 50ms apart; the instant simulated answers must not absorb that wait
+        spread = records[-1][5] - records[0][5]
+        self.assertGreaterEqual(spread, 0.1)
+        self.assertTrue(all(r[6] - r[5] < spread for r in records))
+    
+    def test_analyze_report(self):
+        """Test the analysis report has all three views"""
+        records = [("10.0.0.1", port, "thread", "no-response" if port % 2 else "closed", 0, 1.0, 1.0 + port / 100)
+                   for port in range(1, 21)]
+        output = io.StringIO()
+        analyze(records, bins=4, out=output)
+        report = output.getvalue()
+        self.assertIn("20 probes", report)
+        self.assertIn("Latency histogram", report)
+        self.assertIn("Concurrency over time", report)
+        self.assertIn("Timeout heatmap", report)
+    
+    def test_concurrency_counts_spanning_probes(self):
+        """Test bins a long probe spans without events still show it in flight"""
+        records = [("10.0.0.1", 22, "thread", "open", 0, 0.0, 10.0),
+                   ("10.0.0.1", 23, "thread", "closed", 0, 0.0, 0.1)]
+        output = io.StringIO()
+        analyze(records, bins=10, out=output)
+        lines = output.getvalue().split("Concurrency over time")[1].split("Timeout heatmap")[0].splitlines()
+        self.assertEqual([int(line.split("s", 1)[1].split()[0]) for line in lines if line.strip().startswith("+")],
+                         [2, 1, 1, 1, 1, 1, 1, 1, 1, 1])
+    
+    def test_replay_is_deterministic(self):
+        """Test replay reproduces recorded outcomes attempt by attempt"""
+        records = [
+            ("10.0.0.1", 80, "thread", "open", 0, 1.0, 1.01),
+            ("10.0.0.1", 81, "thread", "no-response", errno.ETIMEDOUT, 1.0, 2.0),
+            ("10.0.0.1", 81, "thread", "open", 0, 3.0, 3.01),
+            ("10.0.0.1", 82, "thread", "closed", errno.ECONNREFUSED, 1.0, 1.001),
+        ]
+        for _ in range(2):
+            scanner = AdvancedPortScanner("10.0.0.1", "80-82", threads=3, retries=1, retry_backoff=0, quiet=True,
+                                          transport=ReplayTarget(records, speed=0))
+            results = scanner.run_scan()
+            self.assertEqual(sorted(r['port'] for r in results), [80, 81])
+            self.assertEqual(scanner.attempts, {80: 1, 81: 2, 82: 1})
+    
+    def test_replay_keeps_hosts_apart(self):
+        """Test each traced host replays its own outcomes for the same port"""
+        recorder = TraceRecorder(self.trace_file)
+        recorder.record("10.0.0.1", 22, "thread", "open", 0, 1.0, 1.01)
+        recorder.record("10.0.0.2", 22, "thread", "closed", errno.ECONNREFUSED, 1.0, 1.01)
+        recorder.record("10.0.0.2", 443, "event", "no-response", errno.ETIMEDOUT, 1.0, 2.0)
+        recorder.record("10.0.0.2", 443, "event", "open", 0, 3.0, 3.01)
+        recorder.close()
+        
+        with patch('builtins.print'):
+            results = replay(self.trace_file, threads=4, speed=0, retries=1)
+        self.assertEqual(sorted((r['host'], r['port']) for r in results), [("10.0.0.1", 22), ("10.0.0.2", 443)])
+
+class TestSimulatedNetwork(unittest.TestCase):
+    """Test scans against the deterministic simulated network"""
+    
+    def test_full_port_range_on_one_host(self):
+        """Test a 1-65535 scan of a simulated host finds exactly its open ports"""
+        network = SimulatedNetwork(seed=1)
+        network.add_host("10.0.0.5", open=[22, 80, 443, 8080, 65535], filtered=[25])
+        scanner = AdvancedPortScanner("10.0.0.5", "1-65535", threads=16, timeout=1,
+                                      banner_timeout=0.01, transport=network, quiet=True)
+        start = time.time()
+        results = scanner.run_scan()
+        self.assertEqual(sorted(r['port'] for r in results), [22, 80, 443, 8080, 65535])
+        self.assertEqual(network.stats['connect'], 65535)
+        self.assertLess(time.time() - start, 60)
+    
+    def test_network_range(self):
+        """Test CIDR behaviour applies to every host with per-host overrides"""
+        network = SimulatedNetwork(seed=2)
+        network.add_network("10.1.0.0/16", open=[443])
+        network.add_host("10.1.200.7", open=[22, 443])
+        found = {}
+        for host in ("10.1.0.1", "10.1.200.7", "10.1.255.254", "10.2.0.1"):
+            scanner = AdvancedPortScanner(host, [22, 443], timeout=1, transport=network, quiet=True)
+            found[host] = sorted(r['port'] for r in scanner.run_scan())
+        self.assertEqual(found, {"10.1.0.1": [443], "10.1.200.7": [22, 443],
+                                 "10.1.255.254": [443], "10.2.0.1": []})
+    
+    def test_loss_is_recovered_by_retries(self):
+        """Test dropped probes surface as no-response and are recovered on retry"""
+        network = SimulatedNetwork(seed=3)
+        network.add_host("10.0.0.9", open=range(1, 201), loss=0.3)
+        scanner = AdvancedPortScanner("10.0.0.9", "1-200", threads=8, timeout=1, banner_timeout=0.01,
+                                      retries=6, retry_backoff=0, transport=network, quiet=True)
+        results = scanner.run_scan()
+        self.assertGreater(network.stats['lost'], 0)
+        self.assertEqual(len(results), 200)
+        self.assertGreater(max(scanner.attempts.values()), 1)
+    
+    def test_scripted_banners(self):
+        """Test static, chunked and request-driven banner scripts"""
+        network = SimulatedNetwork()
+        network.add_host("10.0.0.2", open=[21, 22, 80], banners={
+            22: b"SSH-2.0-OpenSSH_9.6\r\n",
+            21: [b"220-Welcome\r\n", b"220 Ready\r\n"],
+            80: lambda sent: b"HTTP/1.1 200 OK\r\nServer: sim\r\n\r\n" if sent.startswith(b"GET") else None,
+        })
+        scanner = AdvancedPortScanner("10.0.0.2", "21,22,80", timeout=1, banner_timeout=0.05,
+                                      transport=network, quiet=True)
+        banners = {r['port']: r['banner'] for r in scanner.run_scan()}
+        self.assertEqual(banners[22], b"SSH-2.0-OpenSSH_9.6\r\n")
+        self.assertEqual(banners[21], b"220-Welcome\r\n220 Ready\r\n")
+        self.assertTrue(banners[80].startswith(b"HTTP/1.1 200 OK"))
+    
+    def test_udp_responses(self):
+        """Test UDP replies, silent ports and closed ports"""
+        network = SimulatedNetwork()
+        network.add_host("10.0.0.3", udp={53: b"\x00\x01answer", 161: None})
+        scanner = AdvancedPortScanner("10.0.0.3", "53,161,162", timeout=1, scan_type="udp",
+                                      transport=network, quiet=True)
+        states = {r['port']: r['state'] for r in scanner.run_scan()}
+        self.assertEqual(states, {53: 'open', 161: 'open|filtered'})
+    
+    def test_deterministic_outcomes(self):
+        """Test the same seed gives the same outcomes regardless of thread scheduling"""
+        def run(threads):
+            network = SimulatedNetwork(seed=42)
+            network.add_host("10.0.0.4", open=range(1, 101), loss=0.2, latency=("lognormal", -5, 0.5))
+            scanner = AdvancedPortScanner("10.0.0.4", "1-100", threads=threads, timeout=1,
+                                          banner_timeout=0.01, transport=network, quiet=True)
+            ports = sorted(r['port'] for r in scanner.run_scan())
+            return ports, network.stats['lost'], scanner.attempts
+        
+        outcome = run(1)
+        self.assertLess(len(outcome[0]), 100)
+        self.assertEqual(run(16), outcome)
+
+class TestCongestionControl(unittest.TestCase):
+    """Test per-host AIMD windows and the global in-flight cap"""
+    
+    def test_additive_increase_multiplicative_decrease(self):
+        """Test windows grow on answers and halve once per window of losses"""
+        controller = CongestionController(max_inflight=100, initial_window=4)
+        tickets = [controller.acquire("10.0.0.1") for _ in range(4)]
+        self.assertIsNone(controller.acquire("10.0.0.1", block=False))
+        for ticket in tickets:
+            controller.release("10.0.0.1", ticket, OUTCOME_CLOSED, errno.ECONNREFUSED)
+        self.assertEqual(controller.window("10.0.0.1"), 8)
+        
+        tickets = [controller.acquire("10.0.0.1") for _ in range(8)]
+        for ticket in tickets:
+            controller.release("10.0.0.1", ticket, OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
+        self.assertEqual(controller.window("10.0.0.1"), 4)
+        
+        # Past the cut, growth is one probe per window of answers
+        for _ in range(4):
+            controller.release("10.0.0.1", controller.acquire("10.0.0.1"), OUTCOME_OPEN)
+        self.assertAlmostEqual(controller.window("10.0.0.1"), 5, delta=0.1)
+    
+    def test_resets_shrink_silent_hosts_do_not(self):
+        """Test connection resets shrink the window but a never-answering host keeps it"""
+        controller = CongestionController(initial_window=8)
+        controller.release("10.0.0.2", controller.acquire("10.0.0.2"), OUTCOME_NO_RESPONSE, errno.ETIMEDOUT)
+        self.assertEqual(controller.window("10.0.0.2"), 8)
+        controller.release("10.0.0.2", controller.acquire("10.0.0.2"), OUTCOME_CLOSED, errno.ECONNRESET)
+        self.assertEqual(controller.window("10.0.0.2"), 4)
+    
+    def test_global_cap(self):
+        """Test the global cap limits in-flight probes across hosts"""
+        controller = CongestionController(max_inflight=3, initial_window=2)
+        held = [controller.acquire(host) for host in ("10.0.0.1", "10.0.0.1", "10.0.0.2")]
+        self.assertIsNone(controller.acquire("10.0.0.3", block=False))
+        controller.release("10.0.0.1", held[0])
+        self.assertIsNotNone(controller.acquire("10.0.0.3", block=False))
+    
+    def test_scan_backs_off_overloaded_host(self):
+        """Test a host that resets connections beyond a concurrency limit is backed off"""
+        class OverloadedTransport(SimulatedNetwork):
+            """Resets connects once more than `limit` are in flight"""
+            
+            def __init__(self, limit):
+                super().__init__(time_scale=1.0)
+                self.limit = limit
+                self.active = 0
+                self.peak = 0
+                self.resets = 0
+            
+            def connect(self, host, port, timeout):
+                with self.lock:
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                    overloaded = self.active > self.limit
+                    self.resets += overloaded
+                try:
+                    time.sleep(0.002)
+                    return errno.ECONNRESET if overloaded else super().connect(host, port, timeout)
+                finally:
+                    with self.lock:
+                        self.active -= 1
+        
+        def scan(congestion):
+            network = OverloadedTransport(limit=6)
+            network.add_host("10.0.0.7", open=range(1, 301), latency=0.0)
+            scanner = AdvancedPortScanner("10.0.0.7", "1-300", threads=32, timeout=1, banner_timeout=0.01,
+                                          transport=network, congestion=congestion, quiet=True)
+            return scanner.run_scan(), network
+        
+        results, flooded = scan(None)
+        controller = CongestionController(max_inflight=32, initial_window=4)
+        adaptive_results, adaptive = scan(controller)
+        self.assertLessEqual(adaptive.peak, 32)
+        self.assertLess(adaptive.resets, flooded.resets / 2)
+        self.assertGreater(len(adaptive_results), len(results))
+        self.assertEqual(controller.inflight, 0)
+    
+    def test_event_engine_respects_window(self):
+        """Test the event engine launches no more than the host window allows"""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', 0))
+        server.listen(16)
+        port = server.getsockname()[1]
+        try:
+            controller = CongestionController(max_inflight=2, initial_window=2)
+            scanner = AdvancedPortScanner("127.0.0.1", [port, port + 1, port + 2], threads=50, timeout=1,
+                                          banner_timeout=0.05, engine="event", congestion=controller, quiet=True)
+            results = scanner.run_scan()
+            self.assertIn(port, [r['port'] for r in results])
+            self.assertEqual(controller.inflight, 0)
+            self.assertEqual(set(scanner.attempts), {port, port + 1, port + 2})
+        finally:
+            server.close()
+
+class TestResultIndex(unittest.TestCase):
+    """Test the incremental result index and its query CLI"""
+    
+    def setUp(self):
+        """Scan three simulated hosts into one index"""
+        self.test_dir = tempfile.mkdtemp()
+        self.network = SimulatedNetwork()
+        self.network.add_host("10.0.0.1", open=[22, 3389], banners={22: b"SSH-2.0-OpenSSH_7.4\r\n"})
+        self.network.add_host("10.0.0.2", open=[22, 80], banners={22: b"SSH-2.0-OpenSSH_9.6\r\n"})
+        self.network.add_host("10.0.1.9", open=[3389])
+        self.index = ResultIndex()
+        for host in ("10.0.0.1", "10.0.0.2", "10.0.1.9"):
+            self._scan(host)
+    
+    def tearDown(self):
+        """Remove index and export files"""
+        for file in os.listdir(self.test_dir):
+            os.remove(os.path.join(self.test_dir, file))
+        os.rmdir(self.test_dir)
+    
+    def _scan(self, host):
+        scanner = AdvancedPortScanner(host, [22, 80, 3389], timeout=1, banner_timeout=0.01,
+                                      transport=self.network, index=self.index, quiet=True)
+        return scanner.run_scan()
+    
+    def test_lookup_by_port_service_and_host(self):
+        """Test port, service and CIDR host lookups"""
+        self.assertEqual(self.index.hosts(port=3389), ["10.0.0.1", "10.0.1.9"])
+        self.assertEqual([f['host'] for f in self.index.query(service="ssh")], ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual([f['port'] for f in self.index.query(host="10.0.0.0/24")], [22, 3389, 22, 80])
+        self.assertEqual(self.index.query(port=3389, host="10.0.1.0/24")[0]['host'], "10.0.1.9")
+    
+    def test_banner_substring_and_prefix(self):
+        """Test case-insensitive banner n-gram and prefix lookups"""
+        self.assertEqual(self.index.hosts(banner="openssh_7."), ["10.0.0.1"])
+        self.assertEqual(self.index.hosts(banner_prefix="SSH-2.0-OpenSSH"), ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual(self.index.query(banner="OpenSSH_8"), [])
+    
+    def test_rescans_deduplicate(self):
+        """Test rescans replace findings instead of duplicating them"""
+        self.network.hosts["10.0.0.1"].banners[22] = b"SSH-2.0-OpenSSH_9.6\r\n"
+        self._scan("10.0.0.1")
+        self._scan("10.0.0.1")
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.hosts(banner="openssh_7."), [])
+        self.assertEqual(self.index.hosts(banner="openssh_9.6"), ["10.0.0.1", "10.0.0.2"])
+    
+    def test_persistence_and_cli(self):
+        """Test save/load and adding exported files through the query CLI"""
+        index_file = os.path.join(self.test_dir, "sweep.idx")
+        self.index.save(index_file)
+        self.assertEqual(ResultIndex.load(index_file).hosts(port=22), ["10.0.0.1", "10.0.0.2"])
+        
+        scanner = AdvancedPortScanner("10.0.2.2", "8080", quiet=True)
+        scanner.results = [{'port': 8080, 'state': 'open', 'service': 'HTTP-Proxy',
+                            'banner': b'HTTP/1.1 200 OK\r\nServer: nginx\r\n\r\n', 'scan_type': 'connect'}]
+        export = os.path.join(self.test_dir, "scan")
+        scanner.export_results("csv", export)
+        with patch('sys.stdout', new_callable=io.StringIO):
+            result_index.main(["add", index_file, f"{export}.csv"])
+        with patch('sys.stdout', new_callable=io.StringIO) as output, \
+                patch('sys.stderr', new_callable=io.StringIO):
+            result_index.main(["query", index_file, "--banner", "nginx", "--hosts"])
+        self.assertEqual(output.getvalue().split(), ["10.0.2.2"])
+    
+    def test_repeated_replacement_compacts(self):
+        """Test a finding replaced past the compaction threshold stays indexed once"""
+        for n in range(1100):
+            self.index.add({'port': 80, 'service': 'HTTP', 'banner': f"HTTP/1.1 200 OK\r\nDate: {n}\r\n\r\n"},
+                           host="10.0.9.9")
+        self.assertEqual(self.index.query(host="10.0.9.9"), [self.index.findings[self.index.keys[("10.0.9.9", 80, 'connect')]]])
+        self.assertLess(len(self.index.findings), 1100)
+        self.assertEqual(self.index.hosts(banner="date: 1099"), ["10.0.9.9"])
+        self.assertEqual(self.index.hosts(banner="date: 1098"), [])
+    
+    def test_large_index_queries_use_postings(self):
+        """Test selective queries over many findings only examine their candidates"""
+        class CountingList(list):
+            reads = 0
+            
+            def __getitem__(self, index):
+                CountingList.reads += 1
+                return super().__getitem__(index)
+        
+        index = ResultIndex()
+        for n in range(50000):
+            host = f"10.{n // 65536}.{n // 256 % 256}.{n % 256}"
+            index.add({'port': 22 if n % 10 else 3389, 'service': 'SSH' if n % 10 else 'RDP',
+                       'banner': f"SSH-2.0-OpenSSH_{n % 9}.{n % 7}" if n % 10 else b'', 'scan_type': 'connect'},
+                      host=host)
+        index.findings = CountingList(index.findings)
+        self.assertEqual(len(index.hosts(port=3389)), 5000)
+        self.assertEqual(CountingList.reads, 5000)
+        
+        CountingList.reads = 0
+        matches = index.query(banner="openssh_7.3")
+        self.assertEqual(len(matches), 714)
+        self.assertEqual(CountingList.reads, len(matches))
+
+class TestConsoleRenderer(unittest.TestCase):
+    """Test the queued, batched console renderer"""
+    
+    class BlockingStream(io.StringIO):
+        """Stream whose writes wait for a gate, like a stalled terminal"""
+        
+        def __init__(self):
+            super().__init__()
+            self.gate = threading.Event()
+            self.writes = 0
+        
+        def write(self, text):
+            self.gate.wait()
+            self.writes += 1
+            return super().write(text)
+    
+    def _result(self, port):
+        return {'port': port, 'state': 'open', 'service': 'HTTP', 'banner': b'Server: test\r\n',
+                'scan_type': 'connect'}
+    
+    def test_producers_never_block_and_output_is_batched(self):
+        """Test queuing results returns at once while the stream is stalled, then flushes in batches"""
+        stream = self.BlockingStream()
+        renderer = ConsoleRenderer(stream=stream, progress_stream=io.StringIO(), progress=False).start(1000)
+        start = time.perf_counter()
+        for port in range(1, 1001):
+            renderer.result(self._result(port), "10.0.0.1")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        stream.gate.set()
+        renderer.stop()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1000)
+        self.assertTrue(lines[0].startswith("[+]     1/tcp  open"))
+        self.assertLess(stream.writes, 20)
+    
+    def test_progress_line(self):
+        """Test the throttled progress line reports rate, ETA, in-flight and open counts"""
+        progress = io.StringIO()
+        renderer = ConsoleRenderer(stream=io.StringIO(), progress_stream=progress, interval=0.01, progress=True)
+        renderer.start(100, open_count=lambda: 3, inflight=lambda: 7)
+        renderer.advance(40)
+        time.sleep(0.1)
+        renderer.stop()
+        text = progress.getvalue()
+        self.assertIn("40/100 probes", text)
+        self.assertIn("ports/sec", text)
+        self.assertIn("ETA", text)
+        self.assertIn("in-flight 7", text)
+        self.assertIn("open 3", text)
+        self.assertTrue(text.endswith("\r"))
+    
+    def test_jsonl_mode(self):
+        """Test JSON-lines mode keeps stdout to one JSON object per open port"""
+        network = SimulatedNetwork()
+        network.add_host("10.0.0.8", open=[22, 80], banners={22: b"SSH-2.0-Test\r\n"})
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout, \
+                patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            scanner = AdvancedPortScanner("10.0.0.8", "20-25,80", timeout=1, banner_timeout=0.01,
+                                          transport=network, output="jsonl")
+            scanner.run_scan()
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(sorted(row['port'] for row in rows), [22, 80])
+        self.assertTrue(all(row['host'] == "10.0.0.8" for row in rows))
+        self.assertIn("SSH-2.0-Test", [row['banner'] for row in rows if row['port'] == 22][0])
+        self.assertIn("Scan completed", stderr.getvalue())
+    
+    def test_quiet_mode(self):
+        """Test quiet scans print nothing"""
+        network = SimulatedNetwork()
+        network.add_host("10.0.0.8", open=[22])
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            scanner = AdvancedPortScanner("10.0.0.8", "22", timeout=1, banner_timeout=0.01,
+                                          transport=network, output="quiet")
+            self.assertEqual(len(scanner.run_scan()), 1)
+        self.assertEqual(stdout.getvalue(), "")
+
+class TestServiceProbes(unittest.TestCase):
+    """Test second-stage protocol probes and fingerprint dispatch"""
+    
+    MYSQL_PAYLOAD = b"\x0a8.0.36\x00" + (42).to_bytes(4, 'little') + b"abcdefgh\x00" + b"\xff\xf7"
+    MYSQL_HANDSHAKE = len(MYSQL_PAYLOAD).to_bytes(3, 'little') + b"\x00" + MYSQL_PAYLOAD
+    
+    def setUp(self):
+        """Simulate a host running services on unusual ports"""
+        self.requests = []
+        
+        def http(sent):
+            if not sent:
+                return None
+            self.requests.append(sent)
+            return [b"HTTP/1.1 200 OK\r\nServer: nginx/1.24\r\nContent-Type: text/html\r\n\r\n",
+                    b"<html><head><title>Admin\n Console</title></head></html>"]
+        
+        def smtp(sent):
+            if not sent:
+                return b"220 mail.example ESMTP Postfix\r\n"
+            if sent.startswith(b"EHLO"):
+                return b"250-mail.example\r\n250-SIZE 10240000\r\n250 STARTTLS\r\n"
+            return None
+        
+        def redis(sent):
+            if sent == b"*1\r\n$4\r\nPING\r\n":
+                return b"+PONG\r\n"
+            if sent.startswith(b"*2\r\n$4\r\nINFO"):
+                info = b"# Server\r\nredis_version:7.2.4\r\n"
+                return b"$%d\r\n%s\r\n" % (len(info), info)
+            return b"-ERR unknown command\r\n" if sent else None
+        
+        self.network = SimulatedNetwork()
+        self.network.add_host("10.0.0.5", open=[21, 2222, 2525, 3306, 6379, 8081, 9999], banners={
+            21: b"220 (vsFTPd 3.0.5)\r\n",
+            2222: b"SSH-2.0-OpenSSH_9.6p1 Ubuntu-3ubuntu13\r\n",
+            2525: smtp,
+            3306: self.MYSQL_HANDSHAKE,
+            6379: redis,
+            8081: http,
+        })
+    
+    def _scan(self, ports):
+        scanner = AdvancedPortScanner("10.0.0.5", ports, timeout=1, banner_timeout=0.2,
+                                      transport=self.network, service_probes=True, probe_workers=4, quiet=True)
+        scanner.hostname = "admin.example"
+        return {r['port']: r for r in scanner.run_scan()}
+    
+    def test_fingerprints(self):
+        """Test raw greetings map to services regardless of port"""
+        self.assertEqual(fingerprint(b"SSH-2.0-dropbear\r\n"), "SSH")
+        self.assertEqual(fingerprint(self.MYSQL_HANDSHAKE), "MySQL")
+        self.assertEqual(fingerprint(b"220 smtp.example ESMTP\r\n"), "SMTP")
+        self.assertEqual(fingerprint(b"220 ProFTPD Server\r\n"), "FTP")
+        self.assertEqual(fingerprint(b"HTTP/1.0 404 Not Found\r\n"), "HTTP")
+        self.assertEqual(fingerprint(b"-NOAUTH Authentication required.\r\n"), "Redis")
+        self.assertEqual(fingerprint(b"\x15\x03\x01\x00\x02\x02\x46"), "TLS")
+        self.assertIsNone(fingerprint(b"\x00\x00garbage"))
+    
+    def test_pipeline_identifies_services(self):
+        """Test services on non-standard ports are identified with protocol details"""
+        results = self._scan("21,2222,2525,3306,6379,8081,9999")
+        services = {port: result['service'] for port, result in results.items()}
+        self.assertEqual(services, {21: "FTP", 2222: "SSH", 2525: "SMTP", 3306: "MySQL",
+                                    6379: "Redis", 8081: "HTTP", 9999: "Unknown"})
+        self.assertEqual(results[2222]['details']['software'], "OpenSSH_9.6p1")
+        self.assertEqual(results[2525]['details']['extensions'], ["SIZE 10240000", "STARTTLS"])
+        self.assertEqual(results[3306]['details']['version'], "8.0.36")
+        self.assertEqual(results[3306]['details']['connection_id'], 42)
+        self.assertEqual(results[6379]['details'], {'auth_required': False, 'version': "7.2.4"})
+        self.assertEqual(results[8081]['details'], {'status': 200, 'reason': "OK", 'server': "nginx/1.24",
+                                                    'title': "Admin Console"})
+        self.assertEqual(results[9999]['details'], {})
+    
+    def test_http_host_header(self):
+        """Test the HTTP probe sends the scanned hostname and port in Host"""
+        self._scan("8081")
+        self.assertIn(b"Host: admin.example:8081\r\n", self.requests[0])
+        self.assertTrue(self.requests[0].startswith(b"GET / HTTP/1.1\r\n"))
+    
+    def test_discovery_skips_banners(self):
+        """Test discovery opens no banner connections; only open ports get a second stage"""
+        self._scan("1-1000,2222")
+        self.assertEqual(self.network.stats['connect'], 1001)
+        self.assertEqual(self.network.stats['stream'], 2)
+    
+    def test_event_engine_discovery(self):
+        """Test the event engine hands open ports to the probe pool without reading banners"""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        port = server.getsockname()[1]
+        
+        def serve():
+            for _ in range(2):
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                conn.sendall(b"SSH-2.0-TestServer\r\n")
+                conn.close()
+        
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        try:
+            scanner = AdvancedPortScanner("127.0.0.1", str(port), timeout=1, banner_timeout=0.5,
+                                          engine="event", service_probes=True, quiet=True)
+            results = scanner.run_scan()
+            self.assertEqual(results[0]['service'], "SSH")
+            self.assertEqual(results[0]['details']['software'], "TestServer")
+        finally:
+            server.close()
+
+class TestScanScope(unittest.TestCase):
+    """Test exclusion lists, allow-lists and their enforcement in the scheduler"""
+    
+    def test_interval_set(self):
+        """Test overlapping and adjacent intervals merge and membership is exact"""
+        intervals = IntervalSet([(10, 20), (15, 30), (31, 35), (50, 50)])
+        self.assertEqual(list(intervals), [(10, 35), (50, 50)])
+        self.assertIn(10, intervals)
+        self.assertIn(35, intervals)
+        self.assertIn(50, intervals)
+        self.assertNotIn(9, intervals)
+        self.assertNotIn(36, intervals)
+        self.assertNotIn(51, intervals)
+    
+    def test_exclusions(self):
+        """Test CIDR, address range, single address, IPv6 and port exclusions"""
+        scope = ScanScope.from_options(exclude="10.0.0.0/24,172.16.0.5-172.16.0.9,192.168.1.1,2001:db8::/32",
+                                       exclude_ports="22,5432-5439")
+        self.assertFalse(scope.host_permitted("10.0.0.200"))
+        self.assertTrue(scope.host_permitted("10.0.1.1"))
+        self.assertFalse(scope.host_permitted("172.16.0.7"))
+        self.assertTrue(scope.host_permitted("172.16.0.10"))
+        self.assertFalse(scope.host_permitted("192.168.1.1"))
+        self.assertFalse(scope.host_permitted("2001:db8::1"))
+        self.assertFalse(scope.permits("10.0.1.1", 5435))
+        self.assertTrue(scope.permits("10.0.1.1", 5440))
+        self.assertEqual(scope.filter_ports("10.0.1.1", [21, 22, 23]), [21, 23])
+    
+    def test_allow_lists(self):
+        """Test allow-lists restrict hosts and ports independently"""
+        scope = ScanScope.from_options(allow="10.1.0.0/16", allow_ports="80,443", exclude="10.1.2.0/24")
+        self.assertTrue(scope.permits("10.1.0.1", 443))
+        self.assertFalse(scope.permits("10.1.0.1", 22))
+        self.assertFalse(scope.permits("10.2.0.1", 443))
+        self.assertFalse(scope.permits("10.1.2.3", 443))
+    
+    def test_scope_file(self):
+        """Test scope files with comments, hosts and port lines"""
+        with tempfile.NamedTemporaryFile('w', suffix=".txt", delete=False) as f:
+            f.write("# production databases\n10.9.0.0/16\n203.0.113.10  # vendor\nport 3306\nports 6379,27017\n\n")
+        try:
+            scope = ScanScope.from_options(exclude_files=[f.name])
+        finally:
+            os.remove(f.name)
+        self.assertFalse(scope.host_permitted("10.9.3.4"))
+        self.assertFalse(scope.host_permitted("203.0.113.10"))
+        self.assertEqual(scope.filter_ports("10.8.0.1", [3306, 6379, 8080, 27017]), [8080])
+    
+    def test_invalid_entries(self):
+        """Test malformed entries are rejected"""
+        with self.assertRaises(ScopeError):
+            ScanScope.from_options(exclude_ports="70000")
+        with self.assertRaises(ScopeError):
+            ScanScope.from_options(exclude="10.0.0.9-10.0.0.1")
+        with self.assertRaises(ScopeError):
+            ScanScope.from_options(exclude="10.0.0.0/33")
+    
+    def test_excluded_pairs_are_never_probed(self):
+        """Test the scheduler drops excluded ports and hosts before any probe"""
+        network = SimulatedNetwork()
+        network.add_network("10.0.0.0/24", open=[22, 80, 3306])
+        scope = ScanScope.from_options(exclude="10.0.0.7", exclude_ports="3306,1000-1999")
+        
+        scanner = AdvancedPortScanner("10.0.0.1", "1-2000", timeout=1, banner_timeout=0.01, retries=1,
+                                      retry_backoff=0, transport=network, scope=scope, quiet=True)
+        self.assertEqual(sorted(r['port'] for r in scanner.run_scan()), [22, 80])
+        self.assertEqual(network.stats['connect'], 1000)
+        self.assertIsNone(scanner.scan_port(3306))
+        self.assertEqual(network.stats['connect'], 1000)
+        
+        excluded = AdvancedPortScanner("10.0.0.7", "1-100", timeout=1, transport=network, scope=scope, quiet=True)
+        self.assertEqual(excluded.run_scan(), [])
+        self.assertEqual(network.stats['connect'], 1000)
+    
+    def test_hostname_entries_resolve_lazily(self):
+        """Test hostname entries cost no lookups to build and resolve once when an address is checked"""
+        with patch('socket.gethostbyname_ex', return_value=("db.internal", [], ["10.7.0.5"])) as lookup, \
+                patch('socket.gethostbyname', return_value="10.7.0.5"):
+            scope = ScanScope.from_options(exclude="db.internal,10.0.0.0/24")
+            lookup.assert_not_called()
+            self.assertFalse(scope.host_permitted("DB.internal"))
+            self.assertTrue(scope.host_permitted("10.0.1.1"))
+            self.assertFalse(scope.host_permitted("10.7.0.5"))
+            self.assertTrue(scope.host_permitted("10.7.0.6"))
+            self.assertEqual(lookup.call_count, 1)
+    
+    def test_unresolvable_exclusion_fails_closed(self):
+        """Test an excluded hostname that cannot be resolved blocks address checks until it resolves"""
+        scope = ScanScope.from_options(exclude="db.internal", allow="app.internal,10.0.0.0/24")
+        with patch('socket.gethostbyname_ex', side_effect=socket.gaierror("no such host")):
+            with self.assertRaises(ScopeError):
+                scope.host_permitted("10.0.0.5")
+            self.assertFalse(scope.allow.contains_host("10.1.0.5"))
+        with patch('socket.gethostbyname_ex', return_value=("db.internal", [], ["10.0.0.9"])):
+            self.assertTrue(scope.host_permitted("10.0.0.5"))
+            self.assertFalse(scope.host_permitted("10.0.0.9"))
+    
+    def test_large_lists_merge_into_intervals(self):
+        """Test tens of thousands of entries collapse into merged intervals checked by bisection"""
+        hosts = [f"10.{n // 256 % 256}.{n % 256}.{n % 7}" for n in range(40000)]
+        hosts += [f"172.{16 + n % 16}.{n % 256}.0/28" for n in range(20000)]
+        scope = ScanScope.from_options(exclude=",".join(hosts), exclude_ports=",".join(str(p) for p in range(1, 60000, 3)))
+        self.assertEqual(len(scope.exclude.addresses[4]), 40000 + 256)
+        self.assertEqual(len(scope.exclude.ports), 20000)
+        self.assertFalse(scope.host_permitted("10.0.5.5"))
+        self.assertTrue(scope.host_permitted("10.0.5.6"))
+        permitted = scope.filter_ports("192.0.2.1", range(1, 65536))
+        self.assertEqual(len(permitted), 65535 - 20000)
+
+class TestScanDiff(unittest.TestCase):
+    """Test streamed report diffs, merges and the external sort"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+    
+    def _row(self, host, port, banner="", scan_type="connect", state="open"):
+        return {'port': port, 'state': state, 'service': "Unknown", 'banner': banner,
+                'scan_type': scan_type, 'host': host}
+    
+    def _write_json(self, name, rows):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+        return path
+    
+    def test_streamed_json_array(self):
+        """Test the incremental JSON reader matches json.load across buffer boundaries"""
+        rows = [self._row(f"10.0.0.{n}", n, banner="x" * n + '"],{') for n in range(1, 40)]
+        path = self._write_json("rows.json", rows)
+        with patch.object(scan_diff, '_READ_SIZE', 7):
+            self.assertEqual(list(scan_diff.iter_rows(path)), rows)
+    
+    def test_sort_order(self):
+        """Test hosts sort numerically and UDP findings follow TCP on the same port"""
+        rows = [self._row("10.0.0.10", 22), self._row("10.0.0.9", 80), self._row("10.0.0.9", 53, scan_type="udp"),
+                self._row("10.0.0.9", 53), self._row("db.internal", 1)]
+        ordered = sorted(rows, key=scan_diff.sort_key)
+        self.assertEqual([(r['host'], r['port'], scan_diff.proto(r)) for r in ordered],
+                         [("10.0.0.9", 53, "tcp"), ("10.0.0.9", 53, "udp"), ("10.0.0.9", 80, "tcp"),
+                          ("10.0.0.10", 22, "tcp"), ("db.internal", 1, "tcp")])
+    
+    def test_diff(self):
+        """Test added, removed and changed findings from a linear merge"""
+        old = [self._row("10.0.0.1", 21), self._row("10.0.0.1", 22, "SSH-2.0-OpenSSH_7.4"), self._row("10.0.0.2", 80)]
+        new = [self._row("10.0.0.1", 22, "SSH-2.0-OpenSSH_8.9"), self._row("10.0.0.2", 80),
+               self._row("10.0.0.2", 443)]
+        changes = [(change, (old_row or new_row)['port']) for change, old_row, new_row in
+                   scan_diff.diff_rows(iter(old), iter(new))]
+        self.assertEqual(changes, [('removed', 21), ('changed', 22), ('added', 443)])
+    
+    def test_external_sort_of_unsorted_reports(self):
+        """Test unsorted JSON and CSV reports diff correctly through sorted runs on disk"""
+        random_order = list(range(1, 301))
+        import random
+        random.Random(7).shuffle(random_order)
+        old_path = self._write_json("old.json", [self._row("10.0.0.1", port) for port in random_order])
+        new_path = os.path.join(self.tmpdir, "new.csv")
+        with open(new_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['port', 'state', 'service', 'banner', 'scan_type', 'host'])
+            writer.writeheader()
+            writer.writerows(self._row("10.0.0.1", port, banner="v2" if port == 150 else "")
+                             for port in reversed(random_order) if port != 7)
+        self.assertFalse(scan_diff.is_sorted(scan_diff.iter_rows(old_path)))
+        
+        runs = os.path.join(self.tmpdir, "runs")
+        os.mkdir(runs)
+        with patch.object(scan_diff, 'MAX_MERGE_FANIN', 4):
+            streams = [scan_diff.sorted_rows(path, chunk_rows=16, tmpdir=runs) for path in (old_path, new_path)]
+            changes = [(change, (old_row or new_row)['port']) for change, old_row, new_row in
+                       scan_diff.diff_rows(*streams)]
+        self.assertEqual(changes, [('removed', 7), ('changed', 150)])
+        self.assertEqual(os.listdir(runs), [])
+    
+    def test_external_sort_is_stable_across_merge_passes(self):
+        """Test duplicates keep input order when runs outnumber the merge fan-in"""
+        rows = [self._row("10.0.0.1", port, banner=f"v{seq}") for seq in range(5) for port in (443, 22, 80)]
+        with patch.object(scan_diff, 'MAX_MERGE_FANIN', 4):
+            ordered = list(scan_diff.external_sort(iter(rows), chunk_rows=1, tmpdir=self.tmpdir))
+            self.assertEqual([(r['port'], r['banner']) for r in ordered],
+                             [(port, f"v{seq}") for port in (22, 80, 443) for seq in range(5)])
+            merged = list(scan_diff.merge_rows(scan_diff.external_sort(iter(rows), chunk_rows=1, tmpdir=self.tmpdir)))
+        self.assertEqual([(r['port'], r['banner']) for r in merged], [(22, "v4"), (80, "v4"), (443, "v4")])
+        self.assertEqual(os.listdir(self.tmpdir), [])
+    
+    def test_reading_stays_bounded(self):
+        """Test JSON-lines files stream row by row and external sorts hold one chunk in memory"""
+        import tracemalloc
+        rows = [self._row(f"10.0.{n % 256}.{n // 256}", n * 7919 % 65536, banner="x" * 60) for n in range(8000)]
+        lines_path = os.path.join(self.tmpdir, "rows.jsonl")
+        with open(lines_path, 'w') as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        array_path = self._write_json("rows.json", rows)
+        del rows
+        
+        tracemalloc.start()
+        try:
+            reader = scan_diff.iter_rows(lines_path)
+            self.assertEqual(next(reader)['port'], 0)
+            self.assertLess(tracemalloc.get_traced_memory()[1], 500000)
+            reader.close()
+            
+            tracemalloc.reset_peak()
+            count = sum(1 for row in scan_diff.sorted_rows(array_path, chunk_rows=500, tmpdir=self.tmpdir))
+            self.assertLess(tracemalloc.get_traced_memory()[1], 3000000)
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(count, 8000)
+    
+    def test_merge_later_reports_win(self):
+        """Test merging keeps one row per finding, taken from the last report"""
+        first = [self._row("10.0.0.1", 22, "old"), self._row("10.0.0.1", 80)]
+        second = [self._row("10.0.0.1", 22, "new"), self._row("10.0.0.1", 443)]
+        merged = list(scan_diff.merge_rows(iter(first), iter(second)))
+        self.assertEqual([(r['port'], r['banner']) for r in merged], [(22, "new"), (80, ""), (443, "")])
+    
+    def test_unsorted_input_is_rejected_when_assumed_sorted(self):
+        """Test a wrong --assume-sorted fails loudly instead of producing a bogus diff"""
+        path = self._write_json("unsorted.json", [self._row("10.0.0.1", 80), self._row("10.0.0.1", 22)])
+        with self.assertRaises(ValueError):
+            list(scan_diff.diff_rows(scan_diff.sorted_rows(path, assume_sorted=True), iter([])))
+    
+    def test_sorted_export(self):
+        """Test export_results(sort=True) writes reports that need no sort step"""
+        scanner = AdvancedPortScanner("10.0.0.1", "1-10")
+        scanner.results = [self._row("10.0.0.1", port, banner="") for port in (443, 22, 80)]
+        scanner.results.append({'port': 53, 'state': 'open', 'service': 'DNS', 'banner': b'', 'scan_type': 'udp'})
+        filename = os.path.join(self.tmpdir, "sorted")
+        with patch('builtins.print'):
+            scanner.export_results("json", filename, sort=True)
+        rows = list(scan_diff.iter_rows(filename + ".json"))
+        self.assertEqual([r['port'] for r in rows], [22, 53, 80, 443])
+        self.assertTrue(scan_diff.is_sorted(rows))
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "needs the whole 127.0.0.0/8 loopback range")
+class TestSocketTransport(unittest.TestCase):
+    """Test source address rotation and RST close for high connect rates"""
+    
+    def setUp(self):
+        """Start a listener that records each peer address and how it closed"""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind(('127.0.0.1', 0))
+        self.server_socket.listen(64)
+        self.test_port = self.server_socket.getsockname()[1]
+        self.peers = []
+        self.resets = 0
+        self.server_thread = threading.Thread(target=self._run_server)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+    
+    def tearDown(self):
+        """Stop the listener"""
+        self.server_socket.close()
+    
+    def _run_server(self):
+        try:
+            while True:
+                client, addr = self.server_socket.accept()
+                self.peers.append(addr[0])
+                client.settimeout(1)
+                try:
+                    client.recv(1)
+                except ConnectionResetError:
+                    self.resets += 1
+                except OSError:
+                    pass
+                client.close()
+        except OSError:
+            pass
+    
+    def _wait_for(self, count):
+        deadline = time.monotonic() + 2
+        while len(self.peers) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+    
+    def test_source_addresses_round_robin(self):
+        """Test connects alternate between the configured source addresses"""
+        transport = SocketTransport(["127.0.0.2", "127.0.0.3"])
+        for _ in range(4):
+            self.assertEqual(transport.connect("127.0.0.1", self.test_port, 1), 0)
+        self._wait_for(4)
+        self.assertEqual(sorted(self.peers), ["127.0.0.2", "127.0.0.2", "127.0.0.3", "127.0.0.3"])
+        self.assertEqual(self.resets, 0)
+    
+    def test_rst_close(self):
+        """Test discovery connects are reset rather than closed gracefully"""
+        transport = SocketTransport(rst_close=True)
+        self.assertEqual(transport.connect("127.0.0.1", self.test_port, 1), 0)
+        self._wait_for(1)
+        time.sleep(0.1)
+        self.assertEqual(self.resets, 1)
+    
+    def test_event_engine_uses_transport(self):
+        """Test the event engine binds and resets through the scanner's transport"""
+        scanner = AdvancedPortScanner("127.0.0.1", str(self.test_port), timeout=1, engine="event", quiet=True,
+                                      service_probes=False, transport=SocketTransport(["127.0.0.4"], rst_close=True))
+        scanner.custom_payloads = {}
+        scanner.banner_timeout = 0.05
+        self.assertEqual([r['port'] for r in scanner.run_scan()], [self.test_port])
+        self._wait_for(1)
+        self.assertEqual(self.peers, ["127.0.0.4"])
+        time.sleep(0.1)
+        self.assertEqual(self.resets, 0)
+    
+    def test_event_engine_resets_discovery_only(self):
+        """Test the event engine resets connects that never read a banner"""
+        scanner = AdvancedPortScanner("127.0.0.1", str(self.test_port), timeout=1, engine="event", quiet=True,
+                                      service_probes=True, transport=SocketTransport(rst_close=True))
+        outcomes = [outcome for port, result, outcome, errno_value in scanner._dispatch([self.test_port])]
+        self.assertEqual(outcomes, [OUTCOME_OPEN])
+        self._wait_for(1)
+        time.sleep(0.1)
+        self.assertEqual(self.resets, 1)
+    
+    def test_invalid_source_address(self):
+        """Test source addresses must be IPv4 literals"""
+        with self.assertRaises(ValueError):
+            SocketTransport(["not-an-address"])
+
 class TestCommandLineInterface(unittest.TestCase):
     """Test command line interface functionality"""
     